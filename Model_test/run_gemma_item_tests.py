@@ -1,12 +1,36 @@
 # run_gemma_item_tests.py
-import json, time, csv, sys, re, requests
+# Categorization benchmark: every test case x model x prompt variant, run
+# concurrently, with model responses cached on disk so reruns and new
+# comparisons only pay for calls they haven't made yet.
+#   python run_gemma_item_tests.py                                   # default model + prompt
+#   python run_gemma_item_tests.py --models gemma3:1b-it-qat,mistral --prompts full,zero_shot
+#   python run_gemma_item_tests.py --offline                         # recorded responses only
+#   python run_gemma_item_tests.py --models stub                     # keyword stub, no Ollama
+# Commit the cache directory (or point --cache-dir at a copy) to share a
+# recording that --offline can replay without Ollama.
+import os, json, time, csv, sys, re, hashlib, argparse, threading, requests
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+# Item normalization and the keyword rules come from the app itself
+# (backend/app): expected and returned items are matched the way production
+# normalizes them, and the stub model and backstop use production's rules
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+from app.normalize import norm
+from app.categorizer import match_category
 
 # ==== Config ====
 OLLAMA_URL = "http://localhost:11434/api/generate"
 MODEL = "gemma3:1b-it-qat"   # instruction-tuned, better accuracy
 TESTS_PATH = "tests_items.json"
 OUT_CSV = "results_items.csv"
+SUMMARY_CSV = "results_summary.csv"
+CACHE_DIR = ".eval_cache"     # one JSON file per (model, prompt hash, items)
+WORKERS = 4                   # Ollama queues beyond OLLAMA_NUM_PARALLEL anyway
+STUB_MODEL = "stub"           # answers from the app's keyword rules, no network
+
+# One keep-alive session for all calls instead of a new connection per request
+SESSION = requests.Session()
 
 CATEGORIES = [
     "Dairy","Bakery","Produce","Pulses","Grains","Flour","Household","Protein",
@@ -66,95 +90,152 @@ Input items: {items_json}
 
 # ==== Helpers ====
 
-def norm(s: str) -> str:
-    """Normalize item names for more stable matching."""
-    s = s.lower()
-    s = re.sub(r'[\-\(\)]', ' ', s)
-    # remove units like '1kg', '500 g', '2l', '12 pc', 'bunch', 'dozen'
-    s = re.sub(r'\b\d+(\.\d+)?\s*(kg|g|l|ml|pc|pcs|bunch|dozen)\b', '', s)
-    # remove numbers attached to units e.g., 2x100g
-    s = re.sub(r'\b\d+x\d+(g|ml)\b', '', s)
-    s = re.sub(r'\s+', ' ', s).strip()
-    return s
-
-# Optional: hard keyword backstop for obvious corrections
-KEYWORD_BACKSTOP = [
-    (re.compile(r'\b(rice|basmati)\b', re.I), "Grains"),
-    (re.compile(r'\b(atta|flour|maida)\b', re.I), "Flour"),
-    (re.compile(r'\b(paneer|curd|yogurt|butter|milk|perugu|dahi)\b', re.I), "Dairy"),
-    (re.compile(r'\b(dal|toor|masoor|chana|urad|moong|peas)\b', re.I), "Pulses"),
-    (re.compile(r'\b(tomato|potato|aloo|banana|apple|onion)\b', re.I), "Produce"),
-    (re.compile(r'\b(detergent|soap|dishwash|cleaner)\b', re.I), "Household"),
-    (re.compile(r'\b(oil|sunflower|mustard|groundnut|refined)\b', re.I), "Oils"),
-    (re.compile(r'\b(sugar|jaggery|gur)\b', re.I), "Sweeteners"),
-    (re.compile(r'\b(salt)\b', re.I), "Essentials"),
-    (re.compile(r'\b(biscuit|namkeen|chips|snack)\b', re.I), "Snacks"),
-    (re.compile(r'\b(tea|coffee|cola|juice|tropicana|soda)\b', re.I), "Beverages"),
-    (re.compile(r'\b(turmeric|chilli|cumin|jeera|coriander|dhania)\b', re.I), "Spices"),
-]
-
 def backstop_category(item_name: str, current_cat: str) -> str:
-    """Correct obviously wrong categories using keywords."""
+    """Correct obviously wrong categories with the app's keyword rules."""
     if current_cat not in CATEGORIES or current_cat == "Other":
-        for pat, cat in KEYWORD_BACKSTOP:
-            if pat.search(item_name):
-                return cat
+        return match_category(item_name) or current_cat
     return current_cat
 
-def call_gemma(items):
-    prompt = PROMPT_TEMPLATE.format(
+# Prompt variants compared by --prompts (same template, different guidance)
+PROMPT_VARIANTS = {
+    "full": {"guide": GUIDE, "few": FEW_SHOTS},
+    "no_hints": {"guide": "(none)", "few": FEW_SHOTS},
+    "zero_shot": {"guide": "(none)", "few": "(none)"},
+}
+
+def build_prompt(variant, items):
+    parts = PROMPT_VARIANTS[variant]
+    return PROMPT_TEMPLATE.format(
         cats=json.dumps(CATEGORIES, ensure_ascii=False),
-        guide=GUIDE.strip(),
-        few=FEW_SHOTS.strip(),
+        guide=parts["guide"].strip(),
+        few=parts["few"].strip(),
         items_json=json.dumps(items, ensure_ascii=False),
     )
+
+class OfflineMiss(Exception):
+    """--offline and no recorded response for this call."""
+
+class ResponseCache:
+    """
+    Model responses on disk, keyed by (model, prompt hash, items). Doubles as
+    the recording that --offline replays.
+    """
+    def __init__(self, root, enabled=True, refresh=False):
+        self.root = root
+        self.enabled = enabled
+        self.refresh = refresh
+
+    def key(self, model, prompt, items):
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        raw = json.dumps([model, prompt_hash, items], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def path(self, model, key):
+        return os.path.join(self.root, re.sub(r"[^\w.-]", "_", model), key[:2], key + ".json")
+
+    def get(self, model, key):
+        if not self.enabled or self.refresh:
+            return None
+        try:
+            with open(self.path(model, key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def put(self, model, key, record):
+        if not self.enabled:
+            return
+        path = self.path(model, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(record, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+def stub_generate(items):
+    """Offline stand-in model: categorizes with the app's keyword rules only."""
+    grouped = defaultdict(list)
+    for it in items or []:
+        grouped[backstop_category(it.get("name", ""), "Other")].append(it)
+    categories = [{"name": cat, "items": its, "subtotal": sum(i.get("price", 0) for i in its)}
+                  for cat, its in grouped.items()]
+    return json.dumps({"categories": categories, "totals": {"grand_total": sum(c["subtotal"] for c in categories)}})
+
+def generate(model, prompt, items, cache, offline=False, options=None, timeout=240):
+    """
+    One model call, served from the cache when possible.
+    Returns: record dict - response text, latency_sec, eval_count, tokens_per_sec, cached
+    """
+    key = cache.key(model, prompt, items)
+    record = cache.get(model, key)
+    if record is not None:
+        return dict(record, cached=True)
+
+    if model == STUB_MODEL:
+        return {"response": stub_generate(items), "latency_sec": 0.0, "eval_count": 0,
+                "tokens_per_sec": None, "cached": False}
+    if offline:
+        raise OfflineMiss(f"no recorded response for {model} ({key[:12]})")
+
     payload = {
-        "model": MODEL,
+        "model": model,
         "prompt": prompt,
         "stream": False,
         "format": "json",                        # force JSON
-        "options": {"temperature": 0.0, "num_ctx": 8192}
+        "options": options or {"temperature": 0.0, "num_ctx": 8192}
     }
-
     t0 = time.time()
-    r = requests.post(OLLAMA_URL, json=payload, timeout=240)
+    r = SESSION.post(OLLAMA_URL, json=payload, timeout=timeout)
     latency = time.time() - t0
     r.raise_for_status()
-    text = (r.json() or {}).get("response", "")
+    body = r.json() or {}
+
+    # Ollama reports generated tokens and generation time (ns)
+    eval_count = body.get("eval_count") or 0
+    eval_duration = body.get("eval_duration") or 0
+    record = {
+        "model": model,
+        "response": body.get("response", ""),
+        "latency_sec": latency,
+        "eval_count": eval_count,
+        "tokens_per_sec": eval_count / (eval_duration / 1e9) if eval_duration else None,
+    }
+    cache.put(model, key, record)
+    return dict(record, cached=False)
 
+def parse_json_response(text):
+    """Returns: Parsed JSON or None."""
     # First pass: direct parse
     try:
-        return json.loads(text), latency
+        return json.loads(text)
     except Exception:
         pass
 
-    # Fallback 1: extract inner JSON
+    # Fallback: extract inner JSON
     start, end = text.find("{"), text.rfind("}")
     if start != -1 and end != -1 and end > start:
         try:
-            return json.loads(text[start:end+1]), latency
+            return json.loads(text[start:end+1])
         except Exception:
             pass
+    return None
 
-    # Fallback 2: ask the model to repair JSON (one extra call)
-    repair_prompt = f"Return only valid JSON (no text). Fix this to valid JSON:\n{text}"
-    repair = requests.post(
-        OLLAMA_URL,
-        json={
-            "model": MODEL,
-            "prompt": repair_prompt,
-            "stream": False,
-            "format": "json",
-            "options": {"temperature": 0.0}
-        },
-        timeout=120
-    )
-    fixed = (repair.json() or {}).get("response", "{}")
+def call_model(model, variant, items, cache, offline=False):
+    """Returns: (parsed output, record of the categorization call)"""
+    record = generate(model, build_prompt(variant, items), items, cache, offline)
+    data = parse_json_response(record["response"])
+    if data is not None:
+        return data, record
+
+    # Fallback: ask the model to repair JSON (one extra call, cached too)
+    repair_prompt = f"Return only valid JSON (no text). Fix this to valid JSON:\n{record['response']}"
     try:
-        return json.loads(fixed), latency
-    except Exception:
-        # Safe default
-        return {"categories": [], "totals": {"grand_total": 0}}, latency
+        repair = generate(model, repair_prompt, None, cache, offline, options={"temperature": 0.0}, timeout=120)
+        data = parse_json_response(repair["response"])
+    except (OfflineMiss, requests.RequestException):
+        data = None
+    # Safe default
+    return data or {"categories": [], "totals": {"grand_total": 0}}, record
 
 def score_case(test_case, model_output):
     # Build normalized map: item_name -> predicted_category
@@ -188,44 +269,154 @@ def score_case(test_case, model_output):
     acc = correct / total if total else 0.0
     return acc, per_item
 
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    k = (len(values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+def run_case(model, variant, tc, cache, offline):
+    try:
+        data, record = call_model(model, variant, tc["items"], cache, offline)
+        error = None
+    except (OfflineMiss, requests.RequestException) as e:
+        data, record, error = {"categories": []}, {"latency_sec": None, "tokens_per_sec": None, "cached": False}, str(e)
+    acc, item_rows = score_case(tc, data)
+    return {
+        "model": model,
+        "prompt": variant,
+        "test_id": tc["id"],
+        "items_count": len(tc["items"]),
+        "accuracy": round(acc, 3),
+        "latency_sec": None if record["latency_sec"] is None else round(record["latency_sec"], 2),
+        "tokens_per_sec": None if record["tokens_per_sec"] is None else round(record["tokens_per_sec"], 1),
+        "cached": record["cached"],
+        "error": error,
+        "items": item_rows,
+    }
+
+def summarize(rows):
+    """Returns: Summary rows, one per (model, prompt) plus one per expected category."""
+    summary = []
+    groups = defaultdict(list)
+    for r in rows:
+        groups[(r["model"], r["prompt"])].append(r)
+
+    for (model, variant), group in groups.items():
+        latencies = [r["latency_sec"] for r in group if r["latency_sec"] is not None]
+        speeds = [r["tokens_per_sec"] for r in group if r["tokens_per_sec"]]
+        items = [it for r in group if not r["error"] for it in r["items"]]
+        summary.append({
+            "model": model, "prompt": variant, "category": "ALL",
+            "cases": len(group),
+            "errors": sum(1 for r in group if r["error"]),
+            "cached": sum(1 for r in group if r["cached"]),
+            "items": len(items),
+            "accuracy": round(sum(it["ok"] for it in items) / len(items), 3) if items else 0.0,
+            "p50_sec": round(percentile(latencies, 50), 2),
+            "p95_sec": round(percentile(latencies, 95), 2),
+            "p99_sec": round(percentile(latencies, 99), 2),
+            "tokens_per_sec": round(sum(speeds) / len(speeds), 1) if speeds else None,
+        })
+        by_category = defaultdict(list)
+        for it in items:
+            by_category[it["expected"]].append(it["ok"])
+        for category in sorted(by_category):
+            oks = by_category[category]
+            summary.append({
+                "model": model, "prompt": variant, "category": category,
+                "items": len(oks), "accuracy": round(sum(oks) / len(oks), 3),
+            })
+    return summary
+
 def main():
+    parser = argparse.ArgumentParser(description="Item categorization benchmark")
+    parser.add_argument("--models", default=MODEL, help=f"Comma-separated Ollama models ('{STUB_MODEL}' = keyword stub)")
+    parser.add_argument("--prompts", default="full", help=f"Comma-separated prompt variants: {', '.join(PROMPT_VARIANTS)}")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="Concurrent model calls")
+    parser.add_argument("--tests", default=TESTS_PATH)
+    parser.add_argument("--out", default=OUT_CSV, help="Per-case results CSV")
+    parser.add_argument("--summary", default=SUMMARY_CSV, help="Per model/prompt/category summary CSV")
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--no-cache", action="store_true", help="Neither read nor write cached responses")
+    parser.add_argument("--refresh", action="store_true", help="Ignore cached responses but record new ones")
+    parser.add_argument("--offline", action="store_true", help="Only replay recorded responses (no Ollama)")
+    parser.add_argument("--quiet", action="store_true", help="Don't print per-item mismatches")
+    args = parser.parse_args()
+
+    models = [m.strip() for m in args.models.split(",") if m.strip()]
+    variants = [v.strip() for v in args.prompts.split(",") if v.strip()]
+    unknown = [v for v in variants if v not in PROMPT_VARIANTS]
+    if unknown:
+        parser.error(f"unknown prompt variant(s): {', '.join(unknown)}")
+
     try:
-        tests = json.load(open(TESTS_PATH, "r", encoding="utf-8"))
+        tests = json.load(open(args.tests, "r", encoding="utf-8"))
     except FileNotFoundError:
-        sys.stderr.write(f"ERROR: Cannot find {TESTS_PATH}. Place it next to this script.\n")
+        sys.stderr.write(f"ERROR: Cannot find {args.tests}. Place it next to this script.\n")
         sys.exit(1)
 
-    rows = []
-    for tc in tests:
-        data, latency = call_gemma(tc["items"])
-        acc, item_rows = score_case(tc, data)
-        rows.append({
-            "test_id": tc["id"],
-            "items_count": len(tc["items"]),
-            "accuracy": round(acc, 3),
-            "latency_sec": round(latency, 2)
-        })
-        # Print mismatches for inspection
-        mismatches = [r for r in item_rows if not r["ok"]]
-        if mismatches:
-            print(f"[{tc['id']}] mismatches:")
-            for m in mismatches:
-                print(f"  - {m['item_name']}: expected {m['expected']} | got {m['predicted']}")
-
-    # Write summary CSV
-    with open(OUT_CSV, "w", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=["test_id","items_count","accuracy","latency_sec"])
+    cache = ResponseCache(args.cache_dir, enabled=not args.no_cache, refresh=args.refresh)
+    jobs = [(m, v, tc) for m in models for v in variants for tc in tests]
+    print(f"Running {len(jobs)} cases ({len(models)} models x {len(variants)} prompts x {len(tests)} tests), "
+          f"{args.workers} at a time")
+
+    t0 = time.time()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        rows = list(pool.map(lambda job: run_case(*job, cache, args.offline), jobs))
+    wall = time.time() - t0
+
+    # Print mismatches for inspection
+    if not args.quiet:
+        for r in rows:
+            if r["error"]:
+                print(f"[{r['model']}/{r['prompt']}/{r['test_id']}] error: {r['error']}")
+                continue
+            mismatches = [it for it in r["items"] if not it["ok"]]
+            if mismatches:
+                print(f"[{r['model']}/{r['prompt']}/{r['test_id']}] mismatches:")
+                for m in mismatches:
+                    print(f"  - {m['item_name']}: expected {m['expected']} | got {m['predicted']}")
+
+    # Write per-case CSV
+    fields = ["model", "prompt", "test_id", "items_count", "accuracy", "latency_sec", "tokens_per_sec", "cached", "error"]
+    with open(args.out, "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=fields, extrasaction="ignore")
         w.writeheader()
         w.writerows(rows)
 
+    summary = summarize(rows)
+    summary_fields = ["model", "prompt", "category", "cases", "errors", "cached", "items", "accuracy",
+                      "p50_sec", "p95_sec", "p99_sec", "tokens_per_sec"]
+    with open(args.summary, "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=summary_fields)
+        w.writeheader()
+        w.writerows(summary)
+
     # Overall stats
-    overall_acc = sum(r["accuracy"] for r in rows) / len(rows) if rows else 0.0
-    avg_latency = sum(r["latency_sec"] for r in rows) / len(rows) if rows else 0.0
     print("\n=== Summary ===")
-    print(f"Cases: {len(rows)}")
-    print(f"Overall accuracy: {overall_acc:.3f}")
-    print(f"Average latency (s): {avg_latency:.2f}")
-    print(f"CSV saved: {OUT_CSV}")
+    print(f"{'model':<22}{'prompt':<11}{'cases':>6}{'err':>5}{'cached':>7}{'acc':>7}"
+          f"{'p50 s':>8}{'p95 s':>8}{'p99 s':>8}{'tok/s':>8}")
+    for s in summary:
+        if s["category"] == "ALL":
+            tps = "-" if s["tokens_per_sec"] is None else f"{s['tokens_per_sec']:.1f}"
+            print(f"{s['model']:<22}{s['prompt']:<11}{s['cases']:>6}{s['errors']:>5}{s['cached']:>7}"
+                  f"{s['accuracy']:>7.3f}{s['p50_sec']:>8.2f}{s['p95_sec']:>8.2f}{s['p99_sec']:>8.2f}{tps:>8}")
+
+    print("\nPer-category accuracy:")
+    columns = [(s["model"], s["prompt"]) for s in summary if s["category"] == "ALL"]
+    table = {(s["model"], s["prompt"], s["category"]): s["accuracy"] for s in summary if s["category"] != "ALL"}
+    categories = sorted({s["category"] for s in summary if s["category"] != "ALL"})
+    print(f"{'category':<12}" + "".join(f"{(m + '/' + v)[:24]:>26}" for m, v in columns))
+    for category in categories:
+        cells = [table.get((m, v, category)) for m, v in columns]
+        print(f"{category:<12}" + "".join(f"{'-' if c is None else f'{c:.3f}':>26}" for c in cells))
+
+    print(f"\nWall time: {wall:.1f}s (latencies of cached cases are the recorded ones)")
+    print(f"CSV saved: {args.out}, {args.summary}")
 
 if __name__ == "__main__":
     try:
@@ -1,26 +1,57 @@
 import os
 from flask import Flask
-from flask_cors import CORS
-from flask_sqlalchemy import SQLAlchemy
 from app.models import db
 
-def create_app():
+def engine_options(uri):
+    """SQLAlchemy engine settings for the configured database."""
+    if uri.startswith("sqlite"):
+        # WAL/synchronous/busy_timeout/mmap pragmas are set per connection in models.py;
+        # the driver-level timeout matches busy_timeout for lock waits in BEGIN.
+        return {"connect_args": {"timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")) / 1000}}
+
+    # Server databases: each process (Flask, every Celery child) gets its own pool
+    return {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "5")),
+        "pool_timeout": 30,
+        "pool_recycle": 1800,
+        "pool_pre_ping": True,
+    }
+
+def create_app(with_routes=True):
+    """
+    The one app factory. with_routes=False gives a bare app (config + database)
+    for Celery workers and maintenance scripts: the blueprint, CORS, Celery
+    client and everything the routes pull in are never imported.
+    """
     app = Flask(__name__)
 
     # ✅ Define the absolute base path correctly
     BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 
+    # ✅ DATABASE_URL picks the engine, e.g. postgresql+psycopg2://user:pw@host/billwise
+    database_uri = os.getenv("DATABASE_URL", "sqlite:///" + os.path.join(BASE_DIR, "data", "bills.db"))
+
     # ✅ Set all paths with absolute locations
     app.config.from_mapping(
-        SQLALCHEMY_DATABASE_URI="sqlite:///" + os.path.join(BASE_DIR, "data", "bills.db"),
+        SQLALCHEMY_DATABASE_URI=database_uri,
+        SQLALCHEMY_ENGINE_OPTIONS=engine_options(database_uri),
         UPLOAD_FOLDER=os.path.join(BASE_DIR, "data", "uploads"),
         PARSED_JSON_FOLDER=os.path.join(BASE_DIR, "data", "parsed_json")
     )
 
+    # ✅ Create folders if they don't exist
+    os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
+    os.makedirs(app.config["PARSED_JSON_FOLDER"], exist_ok=True)
+
     db.init_app(app)
-    CORS(app)
 
-    from app.routes import bp
-    app.register_blueprint(bp)
+    if with_routes:
+        from flask_cors import CORS
+        from app.routes import bp
+        from app import metrics
+        CORS(app)
+        metrics.init_app(app)
+        app.register_blueprint(bp)
 
     return app
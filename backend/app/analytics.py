@@ -0,0 +1,245 @@
+from datetime import date, datetime, timedelta
+import calendar
+
+import numpy as np
+from sqlalchemy import insert, delete
+
+from .models import db, Bill, BillItem, UserInsight, Vendor, Item
+from .category_cache import categorize
+from .response_cache import mark_user_dirty
+
+# Personalized spend insights. Bills and items of a whole batch of users are
+# loaded with two queries into columnar NumPy arrays (vendors and items under
+# their canonical dimension names); every statistic below is
+# computed with array operations on each user's slice, and the results replace
+# that user's previous analytics rows in one bulk INSERT.
+INSIGHT_TYPES = ("spend_trend", "anomaly", "recurring", "forecast")
+HISTORY_DAYS = 365
+RECENT_DAYS = 30          # anomalies are reported for bills this recent
+ROLLING_WINDOWS = (7, 30)
+Z_THRESHOLD = 2.5
+MIN_HISTORY = 5           # other bills at the vendor/category before z-scores count
+MAX_ANOMALIES = 3
+RECURRING_MIN_GAPS = 3    # at least 4 purchases
+RECURRING_MAX_CV = 0.35   # std/mean of the gaps between purchases
+MAX_RECURRING = 5
+FORECAST_PRIOR_DAYS = 7   # weight of the long-run daily rate in the forecast
+BATCH_USERS = 200
+
+_DAY_KEY = 1 << 20        # > any date ordinal, for packing (code, day) keys
+
+
+class History:
+    """One batch of users' bills and items as parallel arrays, sorted by user."""
+
+    def __init__(self, user_ids, since):
+        bills = db.session.execute(
+            db.select(Bill.user_id, Bill.id, Bill.date,
+                      db.func.coalesce(Vendor.name, Bill.vendor).label("vendor"), Bill.total)
+            .outerjoin(Vendor, Vendor.id == Bill.vendor_id)
+            .where(Bill.user_id.in_(user_ids), Bill.date >= since, Bill.date.isnot(None))
+            .order_by(Bill.user_id, Bill.date, Bill.id)
+        ).all()
+        items = db.session.execute(
+            db.select(Bill.user_id, BillItem.bill_id,
+                      db.func.coalesce(Item.name, BillItem.name).label("name"), BillItem.price)
+            .join(Bill, Bill.id == BillItem.bill_id)
+            .outerjoin(Item, Item.id == BillItem.item_id)
+            .where(Bill.user_id.in_(user_ids), Bill.date >= since, Bill.date.isnot(None))
+            .order_by(Bill.user_id)
+        ).all()
+
+        n = len(bills)
+        self.user = np.fromiter((b.user_id for b in bills), np.int64, n)
+        self.bill_id = np.fromiter((b.id for b in bills), np.int64, n)
+        self.day = np.fromiter((b.date.toordinal() for b in bills), np.int64, n)
+        self.total = np.fromiter((b.total or 0.0 for b in bills), np.float64, n)
+        self.vendors, self.vendor = np.unique(
+            np.array([b.vendor or "Unknown" for b in bills], dtype=object), return_inverse=True)
+
+        m = len(items)
+        self.item_user = np.fromiter((i.user_id for i in items), np.int64, m)
+        order = np.argsort(self.bill_id)
+        self.item_bill = order[np.searchsorted(self.bill_id, np.fromiter((i.bill_id for i in items), np.int64, m),
+                                               sorter=order)] if m else np.zeros(0, np.int64)
+        self.item_price = np.fromiter((i.price or 0.0 for i in items), np.float64, m)
+        self.names, self.item_name = np.unique(np.array([i.name for i in items], dtype=object), return_inverse=True)
+        self.categories, name_category = np.unique(
+            np.array(categorize(self.names), dtype=object), return_inverse=True)
+        self.item_category = name_category[self.item_name]
+
+    def bills_of(self, user_id):
+        return slice(*np.searchsorted(self.user, [user_id, user_id + 1]))
+
+    def items_of(self, user_id):
+        return slice(*np.searchsorted(self.item_user, [user_id, user_id + 1]))
+
+
+def _leave_one_out_z(values, groups, n_groups):
+    """z-score of each value against the other values of its group (NaN if too few)."""
+    count = np.bincount(groups, minlength=n_groups)[groups] - 1
+    total = np.bincount(groups, weights=values, minlength=n_groups)[groups] - values
+    squares = np.bincount(groups, weights=values ** 2, minlength=n_groups)[groups] - values ** 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = total / count
+        std = np.sqrt(np.maximum(squares / count - mean ** 2, 0.0))
+        z = (values - mean) / std
+    z[(count < MIN_HISTORY) | ~(std > 0)] = np.nan
+    return z, mean
+
+
+def _money(amount):
+    return f"₹{amount:,.2f}"
+
+
+def spend_trends(daily, first_day):
+    """Latest 7/30-day spend against the user's average window of that length."""
+    insights = []
+    csum = np.concatenate(([0.0], np.cumsum(daily)))
+    for window in ROLLING_WINDOWS:
+        rolling = (csum[window:] - csum[:-window])[first_day:]   # one window per start day
+        if len(rolling) < 2 * window:
+            continue
+        latest, usual = rolling[-1], rolling[:-window].mean()
+        if usual <= 0:
+            continue
+        change = (latest - usual) / usual * 100
+        direction = "above" if change >= 0 else "below"
+        insights.append(("spend_trend", None,
+                         f"Last {window} days: {_money(latest)} spent, {abs(change):.0f}% {direction} "
+                         f"your usual {_money(usual)} per {window} days."))
+    return insights
+
+
+def anomalies(h, bills, items, today):
+    """Recent bills whose total (per vendor) or category spend (per category) is unusually high."""
+    total, vendor, day, bill_id = h.total[bills], h.vendor[bills], h.day[bills], h.bill_id[bills]
+    recent = day >= today - RECENT_DAYS
+    found = []
+
+    z, mean = _leave_one_out_z(total, vendor, len(h.vendors))
+    for i in np.flatnonzero(recent & (z >= Z_THRESHOLD)):
+        found.append((z[i], int(bill_id[i]),
+                      f"{_money(total[i])} at {h.vendors[vendor[i]]} on {date.fromordinal(int(day[i]))} is unusually "
+                      f"high - you usually spend {_money(mean[i])} there."))
+
+    # Spend per (bill, category), then the same test per category
+    local_bill = h.item_bill[items] - bills.start
+    n_categories = len(h.categories)
+    keys, inverse = np.unique(local_bill * n_categories + h.item_category[items], return_inverse=True)
+    spend = np.bincount(inverse, weights=h.item_price[items])
+    key_bill, key_category = keys // n_categories, keys % n_categories
+    z, mean = _leave_one_out_z(spend, key_category, n_categories)
+    for k in np.flatnonzero(recent[key_bill] & (z >= Z_THRESHOLD)):
+        i = key_bill[k]
+        found.append((z[k], int(bill_id[i]),
+                      f"{_money(spend[k])} on {h.categories[key_category[k]]} at {h.vendors[vendor[i]]} on "
+                      f"{date.fromordinal(int(day[i]))} is unusually high - usually {_money(mean[k])} per bill."))
+
+    found.sort(key=lambda f: -f[0])
+    return [("anomaly", bill, text) for _, bill, text in found[:MAX_ANOMALIES]]
+
+
+def recurring_purchases(h, bills, items, today):
+    """
+    Items bought at regular intervals, with the next expected purchase (or,
+    within two intervals of the last one, the purchase that is overdue).
+    """
+    keys = np.unique(h.item_name[items] * _DAY_KEY + h.day[bills][h.item_bill[items] - bills.start])
+    name, day = keys // _DAY_KEY, keys % _DAY_KEY            # sorted by name, then day
+    same = name[1:] == name[:-1]
+    gaps, gap_name = np.diff(day)[same], name[1:][same]
+    n_names = len(h.names)
+    count = np.bincount(gap_name, minlength=n_names)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = np.bincount(gap_name, weights=gaps, minlength=n_names) / count
+        std = np.sqrt(np.maximum(np.bincount(gap_name, weights=gaps ** 2, minlength=n_names) / count - mean ** 2, 0))
+        cv = std / mean
+    last = np.zeros(n_names, np.int64)
+    is_last = np.append(~same, True)                          # final (latest) row of each name
+    last[name[is_last]] = day[is_last]
+
+    regular = (count >= RECURRING_MIN_GAPS) & (cv <= RECURRING_MAX_CV) & (today - last <= 2 * mean)
+    candidates = np.flatnonzero(regular)
+    insights = []
+    for n in candidates[np.argsort(-count[candidates])][:MAX_RECURRING]:
+        due = int(round(last[n] + mean[n]))
+        if due >= today:
+            text = f"You buy {h.names[n]} about every {mean[n]:.0f} days - next one due around {date.fromordinal(due)}."
+        else:
+            text = (f"You buy {h.names[n]} about every {mean[n]:.0f} days - one was due around "
+                    f"{date.fromordinal(due)} ({today - due} days overdue; last bought {date.fromordinal(int(last[n]))}).")
+        insights.append(("recurring", None, text))
+    return insights
+
+
+def month_forecast(daily, start, first_day, today):
+    """Month-end spend: this month so far plus the remaining days at a blended daily rate."""
+    today_date = date.fromordinal(today)
+    month_start = today_date.replace(day=1).toordinal() - start
+    if month_start - first_day < 30:
+        return []                                             # not enough history for a baseline
+    elapsed = today_date.day
+    days_in_month = calendar.monthrange(today_date.year, today_date.month)[1]
+
+    so_far = daily[month_start:].sum()
+    baseline = daily[max(first_day, month_start - 90):month_start].mean()
+    rate = (so_far + baseline * FORECAST_PRIOR_DAYS) / (elapsed + FORECAST_PRIOR_DAYS)
+    forecast = so_far + rate * (days_in_month - elapsed)
+
+    last_month = (today_date.replace(day=1) - timedelta(days=1))
+    previous = daily[max(last_month.replace(day=1).toordinal() - start, 0):month_start].sum()
+    return [("forecast", None,
+             f"At this pace you'll spend about {_money(forecast)} in {today_date:%B} "
+             f"({_money(so_far)} so far; {last_month:%B}: {_money(previous)}).")]
+
+
+def user_insights(h, user_id, today):
+    """Returns: List of (insight_type, bill_id, text) for one user."""
+    bills, items = h.bills_of(user_id), h.items_of(user_id)
+    if bills.stop == bills.start:
+        return []
+
+    start = today - HISTORY_DAYS + 1
+    day = h.day[bills]
+    daily = np.bincount(day - start, weights=h.total[bills], minlength=HISTORY_DAYS)[:HISTORY_DAYS]
+    first_day = int(day.min() - start)
+
+    insights = spend_trends(daily, first_day)
+    insights += anomalies(h, bills, items, today)
+    if items.stop > items.start:
+        insights += recurring_purchases(h, bills, items, today)
+    insights += month_forecast(daily, start, first_day, today)
+    return insights
+
+
+def run(user_ids, today=None):
+    """
+    Recompute analytics insights for these users (in batches) and replace
+    their previous ones. Commits.
+    Returns: Number of insight rows written
+    """
+    today = (today or date.today()).toordinal()
+    since = date.fromordinal(today - HISTORY_DAYS + 1)
+    user_ids = sorted(set(user_ids))
+    written = 0
+
+    for offset in range(0, len(user_ids), BATCH_USERS):
+        batch = user_ids[offset:offset + BATCH_USERS]
+        history = History(batch, since)
+        now = datetime.utcnow()
+        rows = [
+            {"user_id": user_id, "bill_id": bill_id, "insight_type": kind, "insight_text": text, "generated_at": now}
+            for user_id in batch
+            for kind, bill_id, text in user_insights(history, user_id, today)
+        ]
+
+        db.session.execute(delete(UserInsight).where(
+            UserInsight.user_id.in_(batch), UserInsight.insight_type.in_(INSIGHT_TYPES)))
+        if rows:
+            db.session.execute(insert(UserInsight), rows)
+        mark_user_dirty(db.session, batch)
+        db.session.commit()
+        written += len(rows)
+
+    return written
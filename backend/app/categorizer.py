@@ -0,0 +1,64 @@
+import re
+
+from app.normalize import norm
+
+# Keyword table. Model_test's benchmark imports it (and norm) for its stub
+# model and backstop, so both score the same rules. Order only matters for
+# readability - a name hitting keywords of two categories is not trusted.
+KEYWORD_RULES = [
+    ("Grains", ["rice", "basmati"]),
+    ("Flour", ["atta", "flour", "maida"]),
+    ("Dairy", ["paneer", "curd", "yogurt", "butter", "milk", "perugu", "dahi", "doodh"]),
+    ("Pulses", ["dal", "toor", "masoor", "chana", "urad", "moong", "peas"]),
+    ("Produce", ["tomato", "potato", "aloo", "banana", "apple", "onion"]),
+    ("Household", ["detergent", "soap", "dishwash", "cleaner"]),
+    ("Oils", ["oil", "sunflower", "mustard", "groundnut", "refined"]),
+    ("Sweeteners", ["sugar", "jaggery", "gur"]),
+    ("Essentials", ["salt"]),
+    ("Snacks", ["biscuit", "namkeen", "chips", "snack"]),
+    ("Beverages", ["tea", "coffee", "cola", "juice", "tropicana", "soda"]),
+    ("Spices", ["turmeric", "chilli", "cumin", "jeera", "coriander", "dhania"]),
+]
+
+
+def _compile(rules):
+    # One alternation with a named group per category: a single scan of the
+    # name finds every keyword, and match.lastgroup says which category hit.
+    groups = [
+        "(?P<c%d>%s)" % (i, "|".join(re.escape(k) for k in sorted(words, key=len, reverse=True)))
+        for i, (_, words) in enumerate(rules)
+    ]
+    # allow simple plurals: tomatoes, biscuits, apples
+    pattern = r"\b(?:%s)(?:e?s)?\b" % "|".join(groups)
+    return re.compile(pattern, re.I), {f"c{i}": cat for i, (cat, _) in enumerate(rules)}
+
+
+_MATCHER, _GROUP_CATEGORY = _compile(KEYWORD_RULES)
+
+
+def match_category(name):
+    """
+    Returns: Category when every keyword in the name points the same way,
+             None when nothing matched or the keywords disagree
+             (e.g. "rice flour") - those are left for the LLM.
+    """
+    hits = {_GROUP_CATEGORY[m.lastgroup] for m in _MATCHER.finditer(norm(name))}
+    if len(hits) == 1:
+        return hits.pop()
+    return None
+
+
+def categorize_by_rules(names):
+    """
+    names: Raw item names
+    Returns: (matched, unmatched) - matched maps name -> category,
+             unmatched lists names that need the cache/LLM path.
+    """
+    matched, unmatched = {}, []
+    for name in names:
+        category = match_category(name)
+        if category:
+            matched[name] = category
+        else:
+            unmatched.append(name)
+    return matched, unmatched
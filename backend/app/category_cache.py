@@ -0,0 +1,195 @@
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timedelta
+
+import redis
+
+from .models import db, ItemCategory
+from .normalize import norm
+from .categorizer import categorize_by_rules
+from . import metrics
+
+# In-process tier
+LRU_MAX_ENTRIES = 4096
+LRU_TTL_SECONDS = 60 * 60
+
+# Persistent tier (item_categories table)
+PERSIST_TTL_DAYS = 90
+PERSIST_MAX_ROWS = 200000
+PRUNE_EVERY_WRITES = 500
+
+# Counters of every process (categorization runs in the workers, not the web
+# process) are summed in Redis; deltas are flushed once per call and kept
+# for later if Redis is down, without retrying it for FLUSH_RETRY_SECONDS
+FLUSH_RETRY_SECONDS = 30
+EVENTS = metrics.Counter("billwise_category_cache_events_total",
+                         "Item category cache hits, misses, stores and evictions (all processes)",
+                         ("event",), shared=True)
+COUNTER_NAMES = ("lru_hits", "db_hits", "misses", "stores", "evictions")
+
+
+class CategoryCache:
+    """
+    Two-tier item -> category memo: an LRU dict per process in front of the
+    item_categories table. Keys are norm()-alized names so "Milk 1L" and
+    "milk" share an entry.
+    """
+
+    def __init__(self, max_entries=LRU_MAX_ENTRIES, ttl_seconds=LRU_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes_since_prune = 0
+        self.counters = dict.fromkeys(COUNTER_NAMES, 0)
+        self._unflushed = defaultdict(int)
+        self._count_lock = threading.Lock()
+        self._flush_after = 0.0
+
+    # ---- in-process tier ----
+
+    def _lru_get(self, key):
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is None:
+                return None
+            category, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._lru[key]
+                return None
+            self._lru.move_to_end(key)
+            return category
+
+    def _lru_put(self, key, category):
+        with self._lock:
+            self._lru[key] = (category, time.monotonic() + self.ttl_seconds)
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+                self._count("evictions")
+
+    # ---- counters ----
+
+    def _count(self, event, n=1):
+        if n:
+            with self._count_lock:
+                self.counters[event] += n
+                self._unflushed[event] += n
+
+    def _flush(self):
+        with self._count_lock:
+            if not self._unflushed or time.monotonic() < self._flush_after:
+                return
+            deltas, self._unflushed = self._unflushed, defaultdict(int)
+        try:
+            pipe = metrics.get_redis().pipeline(transaction=False)
+            for event, n in deltas.items():
+                EVENTS.inc(n, event, pipe=pipe)
+            pipe.execute()
+        except redis.RedisError as e:
+            print(f"Could not flush category cache counters: {e}")
+            with self._count_lock:
+                self._flush_after = time.monotonic() + FLUSH_RETRY_SECONDS
+                for event, n in deltas.items():
+                    self._unflushed[event] += n
+
+    # ---- public API ----
+
+    def get_many(self, names):
+        """
+        names: Raw item names
+        Returns: (found, missing) - found maps raw name -> category,
+                 missing is the list of normalized keys nobody knows yet.
+        """
+        found, pending = {}, {}
+        for name in names:
+            key = norm(name)
+            category = self._lru_get(key)
+            if category is not None:
+                found[name] = category
+                self._count("lru_hits")
+            else:
+                pending.setdefault(key, []).append(name)
+
+        if pending:
+            cutoff = datetime.utcnow() - timedelta(days=PERSIST_TTL_DAYS)
+            rows = ItemCategory.query.filter(
+                ItemCategory.name_key.in_(list(pending)),
+                ItemCategory.updated_at >= cutoff
+            ).all()
+            now = datetime.utcnow()
+            for row in rows:
+                row.hits = (row.hits or 0) + len(pending[row.name_key])
+                row.last_used_at = now
+                self._lru_put(row.name_key, row.category)
+                for name in pending.pop(row.name_key):
+                    found[name] = row.category
+                    self._count("db_hits")
+            if rows:
+                db.session.commit()
+
+        self._count("misses", sum(len(v) for v in pending.values()))
+        self._flush()
+        return found, list(pending)
+
+    def put_many(self, categories):
+        """categories: Dict of item name (raw or normalized) -> category"""
+        now = datetime.utcnow()
+        for name, category in categories.items():
+            key = norm(name)
+            if not key:
+                continue
+            db.session.merge(ItemCategory(name_key=key, category=category, updated_at=now, last_used_at=now))
+            self._lru_put(key, category)
+        db.session.commit()
+
+        self._count("stores", len(categories))
+        self._writes_since_prune += len(categories)
+        if self._writes_since_prune >= PRUNE_EVERY_WRITES:
+            self._writes_since_prune = 0
+            self.prune()
+
+    def prune(self):
+        """Drop expired rows, then least recently used rows above PERSIST_MAX_ROWS."""
+        cutoff = datetime.utcnow() - timedelta(days=PERSIST_TTL_DAYS)
+        removed = ItemCategory.query.filter(ItemCategory.updated_at < cutoff).delete()
+
+        excess = ItemCategory.query.count() - PERSIST_MAX_ROWS
+        if excess > 0:
+            oldest = db.session.query(ItemCategory.name_key) \
+                .order_by(ItemCategory.last_used_at.asc()).limit(excess)
+            removed += ItemCategory.query.filter(ItemCategory.name_key.in_(oldest.scalar_subquery())) \
+                .delete(synchronize_session=False)
+
+        db.session.commit()
+        self._count("evictions", removed)
+        self._flush()
+        return removed
+
+    def stats(self):
+        """Counters of this process only."""
+        return dict(_with_ratio(self.counters), lru_size=len(self._lru))
+
+    def shared_stats(self):
+        """Counters summed over every process (raises redis.RedisError if Redis is down)."""
+        totals = {values[0]: int(n) for values, n in EVENTS.values().items()}
+        return _with_ratio({name: totals.get(name, 0) for name in COUNTER_NAMES})
+
+
+def _with_ratio(counters):
+    lookups = counters["lru_hits"] + counters["db_hits"] + counters["misses"]
+    hits = lookups - counters["misses"]
+    return dict(counters, hit_ratio=round(hits / lookups, 3) if lookups else None)
+
+
+category_cache = CategoryCache()
+
+
+def categorize(names):
+    """Category per name from the keyword rules and the item cache (no LLM calls here)."""
+    names = list(names)
+    found, unmatched = categorize_by_rules(names)
+    if unmatched:
+        found.update(category_cache.get_many(unmatched)[0])
+    return [found.get(name, "Other") for name in names]
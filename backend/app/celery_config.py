@@ -1,3 +1,6 @@
 from celery import Celery
 
-celery_app = Celery("billwise", broker="redis://localhost:6379/0", backend="redis://localhost:6379/0")
+celery_app = Celery("billwise")
+
+# Queues, routing, delivery, limits and worker profiles live in celery_settings.py
+celery_app.config_from_object("app.celery_settings")
@@ -0,0 +1,105 @@
+import os
+from celery.schedules import crontab
+from kombu import Exchange, Queue
+
+# Celery configuration, loaded with celery_app.config_from_object().
+#
+# Two kinds of work, two queues, two worker profiles:
+#   ingest   - receipt extraction, validation, DB writes. CPU-bound and short:
+#              prefork (solo on Windows), one process per core.
+#   insights - LLM categorization. Waits on Ollama for up to minutes: threads,
+#              many in flight, kept away from ingest so they can't starve it.
+# Start each with BILLWISE_WORKER set so it picks up its profile:
+#   BILLWISE_WORKER=ingest   celery -A celery_worker.celery_app worker -Q ingest -n ingest@%h
+#   BILLWISE_WORKER=insights celery -A celery_worker.celery_app worker -Q insights -n insights@%h
+# (command-line --pool/--concurrency still win over the profile)
+# Scheduled digests need one beat process next to the workers:
+#   celery -A celery_worker.celery_app beat
+
+broker_url = os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0")
+result_backend = os.getenv("CELERY_RESULT_BACKEND", "redis://localhost:6379/0")
+broker_connection_retry_on_startup = True
+
+task_serializer = "json"
+result_serializer = "json"
+accept_content = ["json"]
+timezone = "UTC"
+
+# --- Routing ---
+task_default_queue = "ingest"
+task_queues = (
+    Queue("ingest", Exchange("ingest"), routing_key="ingest"),
+    Queue("insights", Exchange("insights"), routing_key="insights"),
+)
+task_routes = {
+    "app.tasks.parse_json_async": {"queue": "ingest"},
+    "app.tasks.ingest_batch_async": {"queue": "ingest"},
+    # Vectorized NumPy work, milliseconds per user: CPU-bound, so it runs with ingest
+    "app.tasks.generate_user_analytics_async": {"queue": "ingest"},
+    # Grouped SQL + bulk insert per user shard, no LLM calls
+    "app.tasks.schedule_digests_async": {"queue": "ingest"},
+    "app.tasks.generate_digest_shard_async": {"queue": "ingest"},
+    "app.tasks.generate_category_insights_async": {"queue": "insights", "priority": 5},
+}
+
+# --- Delivery ---
+# Ack after the task finishes, so a worker crash re-queues the task instead of
+# losing it (tasks are idempotent, or opt out with acks_late=False), and only
+# reserve one message per process so a long task never sits on queued work.
+task_acks_late = True
+task_reject_on_worker_lost = True
+worker_prefetch_multiplier = 1
+
+# Redis re-delivers unacked messages after visibility_timeout: keep it above the
+# longest hard time limit or running tasks get a second copy.
+# Priorities are emulated with sub-queues; 0 is highest.
+broker_transport_options = {
+    "visibility_timeout": 3600,
+    "priority_steps": list(range(10)),
+    "queue_order_strategy": "priority",
+}
+
+# --- Time limits (seconds): soft raises SoftTimeLimitExceeded, hard kills ---
+task_soft_time_limit = 120
+task_time_limit = 180
+task_annotations = {
+    "app.tasks.ingest_batch_async": {"soft_time_limit": 900, "time_limit": 1200},
+    # Ollama reads time out at 120s and are retried, so give the batch room
+    "app.tasks.generate_category_insights_async": {"soft_time_limit": 600, "time_limit": 660},
+    "app.tasks.generate_digest_shard_async": {"soft_time_limit": 600, "time_limit": 660},
+}
+
+# --- Beat: scheduled digests (app/digests.py) ---
+# Only shards with users whose bills changed (added, edited or deleted, in
+# any period) get work, so refreshing often stays cheap.
+beat_schedule = {
+    "digests-refresh": {
+        "task": "app.tasks.schedule_digests_async",
+        "schedule": crontab(minute=15),
+    },
+}
+beat_schedule_filename = os.getenv("CELERY_BEAT_SCHEDULE", "celerybeat-schedule")
+
+# --- Results: small and short-lived so Redis memory stays bounded ---
+result_expires = int(os.getenv("CELERY_RESULT_EXPIRES", "3600"))
+result_compression = "gzip"
+task_compression = "gzip"
+result_extended = False
+redis_max_connections = 20
+
+# --- Worker profiles ---
+WORKER_PROFILES = {
+    "ingest": {
+        "worker_pool": "solo" if os.name == "nt" else "prefork",
+        "worker_concurrency": os.cpu_count() or 2,
+        # Pillow/PDF buffers fragment the heap; recycle children now and then
+        "worker_max_tasks_per_child": 200,
+        "worker_max_memory_per_child": 300 * 1024,  # KiB
+    },
+    "insights": {
+        "worker_pool": "threads",
+        "worker_concurrency": 8,
+    },
+}
+
+globals().update(WORKER_PROFILES.get(os.getenv("BILLWISE_WORKER", ""), {}))
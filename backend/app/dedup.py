@@ -0,0 +1,72 @@
+import json
+import hashlib
+
+from .models import db, Bill, UserInsight, BillFingerprint
+
+
+def file_fingerprint(content_hash):
+    return f"file:{content_hash}"
+
+
+def task_fingerprint(task_id):
+    return f"task:{task_id}"
+
+
+def bill_fingerprint(bill_row, item_rows):
+    """
+    Hash of a validated bill (see ingest.validate_bill) that ignores item order,
+    letter case and whitespace, so the same receipt posted twice matches.
+    """
+    def clean(s):
+        return " ".join(str(s or "").lower().split())
+
+    canonical = {
+        "user_id": bill_row["user_id"],
+        "vendor": clean(bill_row["vendor"]),
+        "total": round(bill_row["total"] or 0.0, 2),
+        "tax": round(bill_row["tax"] or 0.0, 2),
+        "date": bill_row["date"].isoformat() if bill_row["date"] else None,
+        "items": sorted(
+            [clean(i["name"]), round(i["price"] or 0.0, 2), i["quantity"] or 1]
+            for i in item_rows
+        ),
+    }
+    blob = json.dumps(canonical, sort_keys=True, separators=(",", ":"))
+    return "bill:" + hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def lookup(fingerprint):
+    """
+    Returns: The stored result of the bill already saved for this fingerprint
+             (same shape parse_json_async returns), or None.
+    """
+    entry = db.session.get(BillFingerprint, fingerprint)
+    if entry is None:
+        return None
+
+    if db.session.get(Bill, entry.bill_id) is None:
+        # Bill was deleted behind our back - forget the stale entry
+        db.session.delete(entry)
+        db.session.commit()
+        return None
+
+    insight = UserInsight.query.filter_by(bill_id=entry.bill_id, insight_type="category_summary") \
+        .order_by(UserInsight.generated_at.desc()).first()
+
+    return {
+        "message": "Duplicate bill",
+        "bill_id": entry.bill_id,
+        "task_id": entry.task_id,
+        "category_insight": insight.insight_text if insight else None
+    }
+
+
+def claim(fingerprint, bill_id, task_id=None):
+    """
+    Record the bill for a fingerprint in the caller's transaction, so the bill
+    and its fingerprint commit together. The commit raises IntegrityError if
+    another transaction claimed the fingerprint first: roll back, then
+    lookup() the bill that won.
+    """
+    db.session.add(BillFingerprint(fingerprint=fingerprint, bill_id=bill_id, task_id=task_id))
+
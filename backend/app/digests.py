@@ -0,0 +1,248 @@
+import os
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import insert, delete, bindparam
+
+from .models import db, dialect_insert, Bill, BillItem, Vendor, Item, UserInsight, UserMonthlySpend, DigestDirty
+from .category_cache import categorize
+from .response_cache import mark_user_dirty
+
+# Scheduled digests, driven by Celery beat (see beat_schedule in
+# celery_settings.py). Every bill insert, update and delete marks its user's
+# digests of the bill's day/month dirty in digest_dirty, in the same
+# transaction (rollups.apply -> mark_dirty). A run covers one digest kind, one
+# period and one shard of users (user_id % shards) and only recomputes the
+# dirty users, so it costs in proportion to users with changed bills, not to
+# all users. Their digests for the period are rebuilt from all their bills in
+# it with grouped queries and replaced with one bulk INSERT, so re-running a
+# period never duplicates anything.
+DIGEST_KINDS = {
+    "daily_digest": "day",          # period 'YYYY-MM-DD'
+    "monthly_digest": "month",      # period 'YYYY-MM'
+    "category_digest": "month",
+}
+DIGEST_SHARDS = int(os.getenv("DIGEST_SHARDS", "8"))
+# Periods a bill change affects, relative to the bill's own: the monthly
+# digest also compares against the month before it
+DIRTY_PERIODS = {"daily_digest": (0,), "monthly_digest": (0, -1), "category_digest": (0,)}
+BATCH_USERS = 500
+MARK_CHUNK = 10000
+TOP_CATEGORIES = 3
+
+
+def _money(amount):
+    return f"₹{amount:,.2f}"
+
+
+def period_of(kind, today=None, periods_back=0):
+    """Period string of a kind: the one today falls in, or periods_back before it."""
+    today = today or date.today()
+    if DIGEST_KINDS[kind] == "day":
+        return (today - timedelta(days=periods_back)).isoformat()
+    month = today.year * 12 + today.month - 1 - periods_back
+    return f"{month // 12:04d}-{month % 12 + 1:02d}"
+
+
+def mark_dirty(user_days):
+    """
+    user_days: Iterable of (user_id, bill date) whose digests changed
+    Marks every digest kind of those periods dirty. Caller commits.
+    """
+    marks = {(kind, period_of(kind, day, periods_back), user_id)
+             for user_id, day in user_days if user_id is not None and day is not None
+             for kind, periods_backs in DIRTY_PERIODS.items() for periods_back in periods_backs}
+    if not marks:
+        return
+    stmt = dialect_insert(DigestDirty)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["kind", "period", "user_id"],
+        set_={"version": DigestDirty.__table__.c.version + 1},
+    )
+    db.session.execute(stmt, [{"kind": k, "period": p, "user_id": u, "version": 1} for k, p, u in marks])
+
+
+def mark_all_dirty(user_id=None):
+    """
+    Mark the digests of every day/month with bills dirty (all users, or
+    one), for bulk loads that bypass rollups.apply. Caller commits.
+    Returns: Number of (user, day) pairs marked
+    """
+    query = db.select(Bill.user_id, Bill.date).where(Bill.date.isnot(None)).distinct()
+    if user_id is not None:
+        query = query.where(Bill.user_id == user_id)
+    user_days = db.session.execute(query).all()
+    for start in range(0, len(user_days), MARK_CHUNK):
+        mark_dirty(user_days[start:start + MARK_CHUNK])
+    return len(user_days)
+
+
+def never_run():
+    """True when no digest has been written or queued yet (e.g. a database from before digests)."""
+    return (db.session.execute(db.select(DigestDirty.user_id).limit(1)).first() is None
+            and db.session.execute(db.select(UserInsight.id).where(
+                UserInsight.insight_type.in_(list(DIGEST_KINDS))).limit(1)).first() is None)
+
+
+def pending(shards=DIGEST_SHARDS, kinds=None):
+    """Returns: (kind, period, shard) of every shard with dirty users"""
+    shard = DigestDirty.user_id % shards
+    query = db.select(DigestDirty.kind, DigestDirty.period, shard).distinct()
+    if kinds:
+        query = query.where(DigestDirty.kind.in_(kinds))
+    return [tuple(row) for row in db.session.execute(query.order_by(DigestDirty.kind, DigestDirty.period, shard))]
+
+
+def period_bounds(kind, period):
+    """Returns: (first day, day after the last) of a period"""
+    if DIGEST_KINDS[kind] == "day":
+        start = date.fromisoformat(period)
+        return start, start + timedelta(days=1)
+    start = date.fromisoformat(period + "-01")
+    return start, (start + timedelta(days=32)).replace(day=1)
+
+
+def _label(kind, period):
+    start, _ = period_bounds(kind, period)
+    return f"{start:%d %b %Y}" if DIGEST_KINDS[kind] == "day" else f"{start:%B %Y}"
+
+
+def _in_period(user_ids, start, end):
+    return [Bill.user_id.in_(user_ids), Bill.date >= start, Bill.date < end]
+
+
+def _top_vendors(user_ids, start, end):
+    """Returns: user_id -> (vendor name, spend) of the vendor with the most spend"""
+    rows = db.session.execute(
+        db.select(Bill.user_id, Vendor.name, db.func.sum(Bill.total))
+        .join(Vendor, Vendor.id == Bill.vendor_id)
+        .where(*_in_period(user_ids, start, end))
+        .group_by(Bill.user_id, Vendor.id, Vendor.name)
+    ).all()
+    top = {}
+    for user_id, name, spent in rows:
+        if spent and (user_id not in top or spent > top[user_id][1]):
+            top[user_id] = (name, spent)
+    return top
+
+
+def _totals(user_ids, start, end):
+    """Returns: user_id -> (bill count, spend)"""
+    return {user_id: (count, spent or 0.0) for user_id, count, spent in db.session.execute(
+        db.select(Bill.user_id, db.func.count(), db.func.sum(Bill.total))
+        .where(*_in_period(user_ids, start, end)).group_by(Bill.user_id)
+    )}
+
+
+def daily_digests(user_ids, kind, period):
+    start, end = period_bounds(kind, period)
+    top = _top_vendors(user_ids, start, end)
+    digests = {}
+    for user_id, (count, spent) in _totals(user_ids, start, end).items():
+        text = f"{_label(kind, period)}: {_money(spent)} across {count} bill{'s' if count != 1 else ''}"
+        if user_id in top:
+            text += f", most at {top[user_id][0]} ({_money(top[user_id][1])})"
+        digests[user_id] = text + "."
+    return digests
+
+
+def monthly_digests(user_ids, kind, period):
+    start, end = period_bounds(kind, period)
+    previous = period_of(kind, start, periods_back=1)
+    months = defaultdict(dict)
+    for user_id, month, spent, count in db.session.execute(
+        db.select(UserMonthlySpend.user_id, UserMonthlySpend.month,
+                  UserMonthlySpend.total_spent, UserMonthlySpend.bill_count)
+        .where(UserMonthlySpend.user_id.in_(user_ids), UserMonthlySpend.month.in_([period, previous]))
+    ):
+        months[user_id][month] = (spent, count)
+    top = _top_vendors(user_ids, start, end)
+
+    digests = {}
+    for user_id, by_month in months.items():
+        if period not in by_month:
+            continue
+        spent, count = by_month[period]
+        text = f"{_label(kind, period)}: {_money(spent)} across {count} bill{'s' if count != 1 else ''}"
+        before = by_month.get(previous, (0.0, 0))[0]
+        if before > 0:
+            change = (spent - before) / before * 100
+            text += f", {abs(change):.0f}% {'more' if change >= 0 else 'less'} than {_label(kind, previous)}"
+        if user_id in top:
+            text += f". Most spent at {top[user_id][0]} ({_money(top[user_id][1])})"
+        digests[user_id] = text + "."
+    return digests
+
+
+def category_digests(user_ids, kind, period):
+    start, end = period_bounds(kind, period)
+    rows = db.session.execute(
+        db.select(Bill.user_id, Item.name, db.func.sum(BillItem.price))
+        .join(Bill, Bill.id == BillItem.bill_id)
+        .join(Item, Item.id == BillItem.item_id)
+        .where(*_in_period(user_ids, start, end))
+        .group_by(Bill.user_id, Item.id, Item.name)
+    ).all()
+    names = sorted({name for _, name, _ in rows})
+    category_of = dict(zip(names, categorize(names)))
+
+    spend = defaultdict(lambda: defaultdict(float))
+    for user_id, name, spent in rows:
+        spend[user_id][category_of[name]] += spent or 0.0
+
+    digests = {}
+    for user_id, by_category in spend.items():
+        total = sum(by_category.values())
+        if total <= 0:
+            continue
+        top = sorted(by_category.items(), key=lambda c: -c[1])[:TOP_CATEGORIES]
+        digests[user_id] = f"{_label(kind, period)} by category: " + ", ".join(
+            f"{category} {_money(spent)} ({spent / total * 100:.0f}%)" for category, spent in top) + "."
+    return digests
+
+
+BUILDERS = {
+    "daily_digest": daily_digests,
+    "monthly_digest": monthly_digests,
+    "category_digest": category_digests,
+}
+
+
+def run_shard(kind, period, shard=0, shards=DIGEST_SHARDS):
+    """
+    Refresh one shard's dirty digests of a kind for a period. Commits.
+    Returns: Dict with users refreshed and insights written
+    """
+    dirty = db.session.execute(
+        db.select(DigestDirty.user_id, DigestDirty.version)
+        .where(DigestDirty.kind == kind, DigestDirty.period == period, DigestDirty.user_id % shards == shard)
+        .order_by(DigestDirty.user_id)
+    ).all()
+
+    saved = 0
+    for offset in range(0, len(dirty), BATCH_USERS):
+        marks = dirty[offset:offset + BATCH_USERS]
+        batch = [user_id for user_id, _ in marks]
+        now = datetime.utcnow()
+        rows = [
+            {"user_id": user_id, "insight_type": kind, "period": period, "insight_text": text, "generated_at": now}
+            for user_id, text in BUILDERS[kind](batch, kind, period).items()
+        ]
+        # Users whose bills in the period are all gone just lose the digest
+        db.session.execute(delete(UserInsight).where(
+            UserInsight.user_id.in_(batch), UserInsight.insight_type == kind, UserInsight.period == period))
+        if rows:
+            db.session.execute(insert(UserInsight), rows)
+
+        # Clear only marks nobody bumped since they were read: a bill change
+        # committing meanwhile keeps its user dirty for the next run
+        table = DigestDirty.__table__
+        db.session.connection().execute(
+            delete(table).where(table.c.kind == kind, table.c.period == period,
+                                table.c.user_id == bindparam("u"), table.c.version == bindparam("v")),
+            [{"u": user_id, "v": version} for user_id, version in marks])
+        mark_user_dirty(db.session, batch)
+        db.session.commit()
+        saved += len(rows)
+
+    return {"kind": kind, "period": period, "shard": shard, "users": len(dirty), "saved": saved}
@@ -0,0 +1,113 @@
+import string
+
+from sqlalchemy import event, update, bindparam
+from sqlalchemy.orm import Session
+
+from .models import db, dialect_insert, Vendor, Item, Bill, BillItem
+from .normalize import vendor_key, item_key
+
+# Vendor and item names are interned into the vendors/items dimension tables
+# once, at ingest; bills and bill items then carry integer ids, so grouping
+# and lookups work on compact keys and spelling variants ("D-Mart"/"DMart",
+# "Milk 1L"/"Doodh") land on the same row.
+#
+# key -> id is cached per process. Ids found or created inside a transaction
+# only enter the cache once it commits (a rollback could take new rows away).
+LOOKUP_CHUNK = 500
+MAX_CACHED = 200000
+
+_ids = {Vendor: {}, Item: {}}
+_KEY_FUNCS = {Vendor: vendor_key, Item: item_key}
+# Display name stored with a new key: vendors keep the first spelling seen,
+# items are shown by their canonical key ("Doodh 1L" -> "Milk")
+_DISPLAY_FUNCS = {
+    Vendor: lambda name, key: name.strip(),
+    Item: lambda name, key: string.capwords(key),
+}
+
+
+@event.listens_for(Session, "after_commit")
+def _cache_after_commit(session):
+    for model, found in session.info.pop("dimension_ids", []):
+        cache = _ids[model]
+        if len(cache) + len(found) > MAX_CACHED:
+            cache.clear()
+        cache.update(found)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_after_rollback(session):
+    session.info.pop("dimension_ids", None)
+
+
+def intern(model, names):
+    """
+    model: Vendor or Item
+    names: Raw names (duplicates and spelling variants welcome)
+    Returns: Dict raw name -> id, creating dimension rows for new keys.
+    Caller commits.
+    """
+    key_func, display, cache = _KEY_FUNCS[model], _DISPLAY_FUNCS[model], _ids[model]
+    keys = {name: key_func(name)[:255] for name in set(names) if name and name.strip()}
+
+    ids = {key: cache[key] for key in set(keys.values()) if key in cache}
+    missing = {}
+    for name, key in keys.items():
+        if key not in ids:
+            missing.setdefault(key, display(name, key)[:255])
+
+    found = {}
+    missing_keys = list(missing)
+    for start in range(0, len(missing_keys), LOOKUP_CHUNK):
+        chunk = missing_keys[start:start + LOOKUP_CHUNK]
+        stmt = dialect_insert(model).on_conflict_do_nothing(index_elements=["name_key"])
+        db.session.execute(stmt, [{"name_key": key, "name": missing[key]} for key in chunk])
+        found.update(db.session.execute(
+            db.select(model.name_key, model.id).where(model.name_key.in_(chunk))
+        ).all())
+
+    if found:
+        db.session.info.setdefault("dimension_ids", []).append((model, found))
+        ids.update(found)
+    return {name: ids[key] for name, key in keys.items()}
+
+
+def attach_ids(parsed):
+    """
+    parsed: List of (bill_row, item_rows) from ingest.validate_bill
+    Sets bill_row['vendor_id'] and each item row's 'item_id' in place.
+    """
+    vendor_ids = intern(Vendor, [bill_row["vendor"] for bill_row, _ in parsed])
+    item_ids = intern(Item, [item["name"] for _, items in parsed for item in items])
+    for bill_row, items in parsed:
+        bill_row["vendor_id"] = vendor_ids.get(bill_row["vendor"])
+        for item in items:
+            item["item_id"] = item_ids.get(item["name"])
+    return parsed
+
+
+def backfill(batch_size=LOOKUP_CHUNK):
+    """
+    Fill vendor_id/item_id on rows written without them (older rows, raw
+    bulk loads). Works per distinct name, not per row. Commits.
+    Returns: (bills updated, bill items updated)
+    """
+    counts = []
+    for model, fact, name_col, id_col in ((Vendor, Bill, Bill.vendor, Bill.vendor_id),
+                                          (Item, BillItem, BillItem.name, BillItem.item_id)):
+        names = [name for (name,) in db.session.execute(
+            db.select(name_col).where(id_col.is_(None), name_col.isnot(None)).distinct())]
+        updated = 0
+        for start in range(0, len(names), batch_size):
+            ids = intern(model, names[start:start + batch_size])
+            if ids:
+                stmt = update(fact.__table__).where(
+                    fact.__table__.c[name_col.key] == bindparam("raw_name"),
+                    fact.__table__.c[id_col.key].is_(None)
+                ).values({id_col.key: bindparam("dim_id")})
+                result = db.session.connection().execute(
+                    stmt, [{"raw_name": name, "dim_id": dim_id} for name, dim_id in ids.items()])
+                updated += result.rowcount
+            db.session.commit()
+        counts.append(updated)
+    return tuple(counts)
@@ -0,0 +1,98 @@
+import io
+import csv
+import json
+
+from .models import db, Bill, BillItem
+
+# One row per bill item (bills without items get one row with empty item
+# columns). Rows are pulled from the database in batches and written out as
+# they arrive, so exports of any size run in constant memory.
+COLUMNS = [
+    "bill_id", "user_id", "date", "vendor", "bill_total", "tax", "filename",
+    "item_id", "item_name", "quantity", "price",
+]
+FETCH_BATCH = 1000
+PARQUET_ROW_GROUP = 50000
+
+
+def export_rows(user_id=None, start=None, end=None):
+    """
+    start/end: Inclusive datetime.date bounds on Bill.date
+    Yields: Tuples in COLUMNS order, by bill id then item id
+    """
+    query = db.select(
+        Bill.id, Bill.user_id, Bill.date, Bill.vendor, Bill.total, Bill.tax, Bill.filename,
+        BillItem.id, BillItem.name, BillItem.quantity, BillItem.price
+    ).outerjoin(BillItem, BillItem.bill_id == Bill.id).order_by(Bill.id, BillItem.id)
+
+    if user_id is not None:
+        query = query.where(Bill.user_id == user_id)
+    if start is not None:
+        query = query.where(Bill.date >= start)
+    if end is not None:
+        query = query.where(Bill.date <= end)
+
+    # yield_per -> server-side cursor on PostgreSQL, incremental fetch on SQLite
+    result = db.session.execute(query.execution_options(yield_per=FETCH_BATCH))
+    for row in result:
+        yield tuple(row)
+
+
+def iter_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for n, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if n % FETCH_BATCH == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_ndjson(rows):
+    for row in rows:
+        record = dict(zip(COLUMNS, row))
+        if record["date"] is not None:
+            record["date"] = record["date"].isoformat()
+        yield json.dumps(record, ensure_ascii=False) + "\n"
+
+
+def write_parquet(rows, sink, row_group_size=PARQUET_ROW_GROUP):
+    """
+    Write rows to a path or binary file object, one row group per chunk.
+    Needs pyarrow (optional): pip install pyarrow
+    Returns: Number of rows written
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export needs pyarrow: pip install pyarrow")
+
+    schema = pa.schema([
+        ("bill_id", pa.int64()), ("user_id", pa.int64()), ("date", pa.date32()),
+        ("vendor", pa.string()), ("bill_total", pa.float64()), ("tax", pa.float64()),
+        ("filename", pa.string()), ("item_id", pa.int64()), ("item_name", pa.string()),
+        ("quantity", pa.int64()), ("price", pa.float64()),
+    ])
+
+    def to_table(chunk):
+        columns = zip(*chunk)
+        return pa.Table.from_arrays([pa.array(list(col), type=field.type) for col, field in zip(columns, schema)],
+                                    schema=schema)
+
+    written = 0
+    with pq.ParquetWriter(sink, schema) as writer:
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= row_group_size:
+                writer.write_table(to_table(chunk))
+                written += len(chunk)
+                chunk = []
+        if chunk:
+            writer.write_table(to_table(chunk))
+            written += len(chunk)
+    return written
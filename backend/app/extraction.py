@@ -0,0 +1,185 @@
+import os
+import json
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from .preprocess import preprocess_many, render_pdf_pages
+from .storage import sidecar_path
+from .textract_utils import read_parsed_json, parse_expense_document
+
+# Receipt file -> bill dict (vendor, items, tax, total, date) ready for
+# ingest.validate_bill. Pages are preprocessed on all cores, then sent to the
+# configured extractor concurrently; multi-page PDFs are merged back into one bill.
+EXTRACTOR = os.getenv("BILL_EXTRACTOR", "local")     # local | textract
+EXTRACT_CONCURRENCY = int(os.getenv("EXTRACT_CONCURRENCY", "8"))
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".tif", ".tiff", ".webp", ".bmp"}
+# Opt-in for the local extractor: a parsed JSON in PARSED_JSON_FOLDER (e.g.
+# sample_output.json) returned for uploads that have no parsed JSON sidecar.
+# Unset, such uploads fail instead of all being saved as the same bill.
+LOCAL_FALLBACK = os.getenv("LOCAL_EXTRACTOR_FALLBACK", "")
+
+_extractors = {}
+
+
+class Extractor(ABC):
+    """An OCR backend that reads preprocessed page images (PNG bytes)."""
+    name = None
+
+    @abstractmethod
+    def extract_page(self, image):
+        """Returns: Bill dict for one page"""
+
+
+class FileExtractor(ABC):
+    """A backend that reads the uploaded file itself (no page preprocessing)."""
+    name = None
+
+    @abstractmethod
+    def extract_file(self, path):
+        """Returns: Bill dict for the whole file"""
+
+
+class TextractExpenseExtractor(Extractor):
+    """AWS Textract AnalyzeExpense (synchronous, one call per page)."""
+    name = "textract"
+
+    def __init__(self, region=None):
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError("The Textract extractor needs boto3: pip install boto3")
+        # boto3 clients are thread-safe, so one client serves every page thread
+        self.client = boto3.client("textract", region_name=region or os.getenv("AWS_REGION"))
+
+    def extract_page(self, image):
+        response = self.client.analyze_expense(Document={"Bytes": image})
+        return merge_pages([parse_expense_document(doc) for doc in response.get("ExpenseDocuments", [])])
+
+
+class LocalJsonExtractor(FileExtractor):
+    """
+    Offline stand-in for development and tests: returns the parsed JSON
+    stored next to the upload ('ab/cd/<hash>.json', written when the receipt
+    is posted to /upload with a 'parsed' part). Without one it raises, unless
+    LOCAL_EXTRACTOR_FALLBACK names a parsed JSON to use instead.
+    """
+    name = "local"
+
+    def extract_file(self, path):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Upload not found: {path}")
+        sidecar = path if path.lower().endswith(".json") else sidecar_path(path)
+        if os.path.exists(sidecar):
+            with open(sidecar, "r", encoding="utf-8") as f:
+                return json.load(f)
+        fallback = current_app.config.get("LOCAL_EXTRACTOR_FALLBACK", LOCAL_FALLBACK)
+        if not fallback:
+            raise FileNotFoundError(
+                f"No parsed JSON stored with {os.path.basename(path)}: the local extractor can't read "
+                f"images - post the receipt's JSON with it (/upload 'parsed' part), or set "
+                f"BILL_EXTRACTOR=textract for real OCR")
+        print(f"⚠️ WARNING: {os.path.basename(path)} has no parsed JSON, saving {fallback} in its place "
+              f"(LOCAL_EXTRACTOR_FALLBACK)")
+        return read_parsed_json(fallback)
+
+
+EXTRACTORS = {cls.name: cls for cls in (TextractExpenseExtractor, LocalJsonExtractor)}
+
+
+def get_extractor(name=None):
+    name = name or current_app.config.get("BILL_EXTRACTOR", EXTRACTOR)
+    if name not in EXTRACTORS:
+        raise ValueError(f"Unknown extractor '{name}' (choose from {', '.join(EXTRACTORS)})")
+    if name not in _extractors:
+        _extractors[name] = EXTRACTORS[name]()
+    return _extractors[name]
+
+
+def load_pages(path):
+    """Returns: Encoded image bytes per page (PDFs rendered page by page)."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".pdf":
+        return render_pdf_pages(path)
+    if ext not in IMAGE_EXTENSIONS:
+        raise ValueError(f"Unsupported receipt type '{ext or path}'")
+    with open(path, "rb") as f:
+        return [f.read()]
+
+
+def merge_pages(pages):
+    """
+    Combine per-page results into one bill: items concatenated in page order,
+    vendor/date from the first page that has them, total/tax from the last
+    (receipts print the totals at the end).
+    """
+    bill = {"vendor": None, "items": [], "tax": None, "total": None, "date": None}
+    for page in pages:
+        bill["items"].extend(page.get("items") or [])
+        for key in ("vendor", "date"):
+            if bill[key] is None and page.get(key):
+                bill[key] = page[key]
+        for key in ("tax", "total"):
+            if page.get(key) is not None:
+                bill[key] = page[key]
+    return bill
+
+
+def extract_bills(paths, extractor=None):
+    """
+    paths: Receipt files (images or PDFs)
+    Returns: One entry per path, in order - a bill dict, or the exception
+             that file failed with (so one bad file doesn't fail a batch)
+    """
+    extractor = extractor or get_extractor()
+    results = [None] * len(paths)
+
+    if isinstance(extractor, FileExtractor):
+        for i, path in enumerate(paths):
+            try:
+                results[i] = extractor.extract_file(path)
+            except Exception as e:
+                results[i] = e
+        return results
+
+    # Pages of every file go through the process pool together
+    owners, raw_pages = [], []
+    for i, path in enumerate(paths):
+        try:
+            pages = load_pages(path)
+            owners.extend([i] * len(pages))
+            raw_pages.extend(pages)
+        except Exception as e:
+            results[i] = e
+    if not raw_pages:
+        return results
+    images = preprocess_many(raw_pages)
+
+    # OCR calls are network-bound: run them side by side on threads
+    def extract(image):
+        if isinstance(image, Exception):
+            return image
+        try:
+            return extractor.extract_page(image)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=min(EXTRACT_CONCURRENCY, len(images))) as pool:
+        page_results = list(pool.map(extract, images))
+
+    pages_by_file = {}
+    for owner, page in zip(owners, page_results):
+        pages_by_file.setdefault(owner, []).append(page)
+    for i, pages in pages_by_file.items():
+        failed = next((p for p in pages if isinstance(p, Exception)), None)
+        results[i] = failed or merge_pages(pages)
+    return results
+
+
+def extract_bill(path, extractor=None):
+    """Extract one receipt; raises if it can't be read."""
+    result = extract_bills([path], extractor)[0]
+    if isinstance(result, Exception):
+        raise result
+    return result
@@ -0,0 +1,102 @@
+from datetime import date, datetime
+from sqlalchemy import insert
+
+from .models import db, Bill, BillItem
+from . import rollups
+from .dimensions import attach_ids
+
+# Bills per transaction when bulk inserting a batch
+BATCH_CHUNK_SIZE = 500
+MAX_BATCH_SIZE = 10000
+
+
+def _to_float(value, field):
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"'{field}' must be a number")
+
+
+def _to_date(value):
+    if value is None or value == "":
+        return None
+    if isinstance(value, date):
+        return value
+    try:
+        return datetime.fromisoformat(str(value)).date()
+    except ValueError:
+        raise ValueError("'date' must be an ISO date (YYYY-MM-DD)")
+
+
+def validate_bill(data, user_id=1, filename=None):
+    """
+    Check one parsed bill and coerce it into column values.
+    Returns: (bill_row, item_rows) or raises ValueError with a readable message.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Bill must be a JSON object")
+
+    items = data.get("items")
+    if not isinstance(items, list) or not items:
+        raise ValueError("Missing or empty 'items'")
+
+    item_rows = []
+    for i, item in enumerate(items):
+        if not isinstance(item, dict) or not item.get("name"):
+            raise ValueError(f"Item {i} has no 'name'")
+        quantity = item.get("quantity", item.get("qty"))
+        item_rows.append({
+            "name": str(item["name"])[:255],
+            "price": _to_float(item.get("price", 0.0), f"items[{i}].price") or 0.0,
+            "quantity": int(quantity) if quantity not in (None, "") else None,
+        })
+
+    bill_row = {
+        "vendor": str(data.get("vendor") or "Unknown")[:255],
+        "total": _to_float(data.get("total"), "total"),
+        "tax": _to_float(data.get("tax"), "tax"),
+        "date": _to_date(data.get("date")),
+        "filename": data.get("filename") or filename,
+        "user_id": int(data.get("user_id") or user_id),
+    }
+    if bill_row["total"] is None:
+        bill_row["total"] = round(sum(r["price"] for r in item_rows), 2)
+
+    return bill_row, item_rows
+
+
+def bulk_insert_bills(parsed, chunk_size=BATCH_CHUNK_SIZE):
+    """
+    parsed: List of (bill_row, item_rows) tuples from validate_bill
+    Inserts bills and their items with one INSERT per table per chunk,
+    committing each chunk separately so a bad chunk doesn't sink the batch.
+    Returns: List of per-bill outcome dicts, in input order
+    """
+    outcomes = []
+    for start in range(0, len(parsed), chunk_size):
+        chunk = parsed[start:start + chunk_size]
+        try:
+            attach_ids(chunk)
+            bill_ids = db.session.scalars(
+                insert(Bill).returning(Bill.id, sort_by_parameter_order=True),
+                [bill_row for bill_row, _ in chunk],
+            ).all()
+
+            item_rows = [
+                dict(item, bill_id=bill_id)
+                for bill_id, (_, items) in zip(bill_ids, chunk)
+                for item in items
+            ]
+            if item_rows:
+                db.session.execute(insert(BillItem), item_rows)
+            rollups.apply((bill_row, [i["item_id"] for i in items]) for bill_row, items in chunk)
+
+            db.session.commit()
+            outcomes.extend({"status": "saved", "bill_id": bill_id} for bill_id in bill_ids)
+        except Exception as e:
+            db.session.rollback()
+            outcomes.extend({"status": "failed", "error": str(e)} for _ in chunk)
+
+    return outcomes
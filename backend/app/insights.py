@@ -1,35 +1,110 @@
-import requests
+import json
+from collections import defaultdict
 
-OLLAMA_URL = "http://localhost:11434/api/generate"
+from app.categorizer import categorize_by_rules
+from app.category_cache import category_cache
+from app.llm_client import get_client, pack_by_token_budget
+from app.normalize import norm
 
-def get_category_insight_from_llm(items):
-    """
-    items: List of dicts like [{'name': 'Tomatoes', 'price': 30}, ...]
-    Returns: Insight string
-    """
-    # Prepare the prompt
-    item_lines = "\n".join([f"- {item['name']} ₹{item['price']}" for item in items])
-    prompt = f"""
-You are a personal finance assistant. Analyze the following list of items from a grocery bill and:
-1. Group them into common household categories (like Vegetables, Dairy, Snacks, Toiletries, Beverages, etc.)
-2. Calculate total spent per category
-3. Return the result in format: Category: ₹Amount (rounded to 2 decimals)
+MODEL = "mistral"
+
+CATEGORIES = [
+    "Dairy","Bakery","Produce","Pulses","Grains","Flour","Household","Protein",
+    "Beverages","Spices","Sweeteners","Essentials","Oils","Snacks","Other"
+]
+
+
+PROMPT_TEMPLATE = """
+You are a personal finance assistant for Indian households.
+Put each grocery item below into exactly one of these categories:
+{cats}
 
 Items:
-{item_lines}
+{items_json}
 
-Respond in this format:
-Category: Total ₹Amount
+Return STRICT JSON only, mapping every item name to its category:
+{{"items": {{"<item name>": "<category>"}}}}
 """
 
-    payload = {
-        "model": "mistral",
-        "prompt": prompt,
-        "stream": False
+
+def _parse_categories(text, names):
+    try:
+        mapping = json.loads(text).get("items", {})
+    except (ValueError, AttributeError):
+        return {}
+    return {
+        name: mapping.get(name) if mapping.get(name) in CATEGORIES else "Other"
+        for name in names
     }
 
-    response = requests.post(OLLAMA_URL, json=payload)
-    if response.ok:
-        return response.json().get("response", "").strip()
-    else:
-        return "LLM failed to generate insight."
+
+def categorize_items_with_llm(names):
+    """
+    names: List of (normalized) item names, possibly from many bills
+    Returns: Dict of name -> category for every name the model answered;
+             names from failed or unparseable calls are left out.
+
+    Names are packed into as few prompts as the token budget allows and the
+    prompts run concurrently through the shared client.
+    """
+    batches = pack_by_token_budget(list(dict.fromkeys(names)))
+    prompts = [
+        PROMPT_TEMPLATE.format(cats=json.dumps(CATEGORIES), items_json=json.dumps(batch, ensure_ascii=False))
+        for batch in batches
+    ]
+    texts = get_client().generate_many(prompts, MODEL, json_mode=True)
+
+    result = {}
+    for batch, text in zip(batches, texts):
+        if text is not None:
+            result.update(_parse_categories(text, batch))
+    return result
+
+
+def get_category_insights_for_bills(bills):
+    """
+    bills: List of item lists, one per bill, e.g. [[{'name': 'Milk', 'price': 30}], ...]
+    Returns: List of insight strings in the same order
+
+    Keyword rules settle the obvious items, the item cache covers names seen
+    before, and what's left from all bills goes to the model together.
+    Totals are added up locally.
+    """
+    names = [item['name'] for items in bills for item in items]
+    found, unmatched = categorize_by_rules(names)
+    cached, missing = category_cache.get_many(unmatched) if unmatched else ({}, [])
+    found.update(cached)
+
+    fresh = {}
+    if missing:
+        fresh = categorize_items_with_llm(missing)
+        if fresh:
+            category_cache.put_many(fresh)
+
+    insights = []
+    for items in bills:
+        totals = defaultdict(float)
+        failed = False
+        for item in items:
+            category = found.get(item['name']) or fresh.get(norm(item['name']))
+            if category is None:
+                failed = True
+                break
+            totals[category] += float(item['price'] or 0)
+
+        if failed:
+            insights.append("LLM failed to generate insight.")
+        else:
+            insights.append("\n".join(
+                f"{category}: ₹{total:.2f}"
+                for category, total in sorted(totals.items(), key=lambda kv: -kv[1])
+            ))
+    return insights
+
+
+def get_category_insight_from_llm(items):
+    """
+    items: List of dicts like [{'name': 'Tomatoes', 'price': 30}, ...]
+    Returns: Insight string
+    """
+    return get_category_insights_for_bills([items])[0]
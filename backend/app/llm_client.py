@@ -0,0 +1,176 @@
+import os
+import json
+import time
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from app.metrics import record_llm_call
+
+OLLAMA_URL = os.getenv("OLLAMA_URL", "http://localhost:11434/api/generate")
+
+MAX_IN_FLIGHT = 4                # concurrent requests to Ollama per process
+CONNECT_TIMEOUT = 3.05
+READ_TIMEOUT = 120
+RETRIES = 2
+FAILURES_TO_OPEN = 5             # consecutive failures before the breaker opens
+BREAKER_COOLDOWN = 30            # seconds to fail fast before trying again
+PROMPT_TOKEN_BUDGET = 1500       # item tokens per categorization prompt
+
+
+class LLMUnavailable(Exception):
+    """Raised when the model can't be reached or the circuit breaker is open."""
+
+
+def estimate_tokens(text):
+    # Rough rule of thumb for Latin text: ~4 characters per token
+    return len(text) // 4 + 1
+
+
+class CircuitBreaker:
+    def __init__(self, failures_to_open=FAILURES_TO_OPEN, cooldown=BREAKER_COOLDOWN):
+        self.failures_to_open = failures_to_open
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            # Half-open: let one request through after the cooldown
+            if time.monotonic() - self.opened_at >= self.cooldown:
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failures_to_open:
+                self.opened_at = time.monotonic()
+
+
+class OllamaClient:
+    """
+    Shared Ollama client: one keep-alive connection pool, a cap on in-flight
+    requests, timeouts, retries with backoff and a circuit breaker.
+    Point url at a stub server to exercise it without a model.
+    """
+
+    def __init__(self, url=OLLAMA_URL, max_in_flight=MAX_IN_FLIGHT,
+                 timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), retries=RETRIES,
+                 breaker=None):
+        self.url = url
+        self.timeout = timeout
+        self.max_in_flight = max_in_flight
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self.breaker = breaker or CircuitBreaker()
+
+        # Generation isn't idempotent, so a POST is only retried when Ollama
+        # never got it (connect errors) or said it didn't run it (429/503) -
+        # never after a read timeout or a 500, which may have done the work
+        retry = Retry(
+            total=retries,
+            read=0,
+            backoff_factor=0.5,
+            status_forcelist=(429, 503),
+            allowed_methods=frozenset(["POST"]),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_in_flight, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def generate(self, prompt, model, json_mode=False, options=None, timeout=None):
+        """
+        Returns: The model's response text
+        Raises: LLMUnavailable on connection errors, timeouts, HTTP errors
+                or while the breaker is open
+        """
+        if not self.breaker.allow():
+            raise LLMUnavailable("Circuit open: Ollama failing, not calling it")
+
+        payload = {"model": model, "prompt": prompt, "stream": False}
+        if json_mode:
+            payload["format"] = "json"
+        if options:
+            payload["options"] = options
+
+        # Blocks when max_in_flight requests are already out (backpressure)
+        with self._slots:
+            started = time.perf_counter()
+            try:
+                response = self.session.post(self.url, json=payload, timeout=timeout or self.timeout)
+                response.raise_for_status()
+                text = response.json().get("response", "")
+            except (requests.RequestException, ValueError) as e:
+                self.breaker.record_failure()
+                raise LLMUnavailable(str(e)) from e
+            finally:
+                record_llm_call(time.perf_counter() - started)
+
+        self.breaker.record_success()
+        return text
+
+    def generate_many(self, prompts, model, **kwargs):
+        """
+        Runs prompts concurrently (at most max_in_flight at once).
+        Returns: List of response texts (None where the call failed), in order
+        """
+        def run(prompt):
+            try:
+                return self.generate(prompt, model, **kwargs)
+            except LLMUnavailable as e:
+                print(f"LLM call failed: {e}")
+                return None
+
+        if len(prompts) <= 1:
+            return [run(p) for p in prompts]
+        # Each call runs in a copy of this context so its time is charged to the caller's task
+        with ThreadPoolExecutor(max_workers=min(self.max_in_flight, len(prompts))) as pool:
+            futures = [pool.submit(contextvars.copy_context().run, run, p) for p in prompts]
+            return [f.result() for f in futures]
+
+
+def pack_by_token_budget(names, budget=PROMPT_TOKEN_BUDGET):
+    """
+    Split names into consecutive groups whose JSON stays within budget tokens,
+    so items from many bills share as few prompts as possible.
+    """
+    batches, current, used = [], [], 0
+    for name in names:
+        cost = estimate_tokens(json.dumps(name, ensure_ascii=False)) + 1
+        if current and used + cost > budget:
+            batches.append(current)
+            current, used = [], 0
+        current.append(name)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Per-process client, created lazily (after a Celery fork, not before)."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = OllamaClient()
+    return _client
@@ -0,0 +1,340 @@
+import os
+import time
+import threading
+import contextvars
+from collections import defaultdict
+
+import redis
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from celery.signals import before_task_publish, task_prerun, task_postrun
+
+# Where the time goes, in Prometheus text format on /metrics:
+#   HTTP   - latency per route, SQL statements and SQL time per request
+#            (recorded in the web process that served the request)
+#   Celery - queue wait, run time, LLM time and SQL statements per task
+#            (recorded by the workers into Redis, so every worker process
+#            shows up on the web process's /metrics)
+# SQL statements and LLM calls are charged to the request or task that is
+# running in the current context (see scope()).
+METRICS_REDIS_URL = os.getenv("METRICS_REDIS_URL", "redis://localhost:6379/1")
+KEY_PREFIX = "billwise:metrics"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+TASK_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 900)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+
+# Opt-in profiling: with PROFILE_SLOW_MS set, every request runs under cProfile
+# and the ones slower than that are dumped to PROFILE_DIR (open with snakeviz
+# or pstats). Costs roughly 2x on the profiled requests - not for production.
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "data", "profiles")))
+
+SENT_AT_HEADER = "billwise_sent_at"
+
+_client = None
+
+
+def get_redis():
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(METRICS_REDIS_URL, socket_timeout=0.5, socket_connect_timeout=0.5)
+    return _client
+
+
+def _label_text(labels):
+    escaped = ((k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in labels)
+    return ",".join(f'{k}="{v}"' for k, v in escaped)
+
+
+def _number(value):
+    return "+Inf" if value == float("inf") else repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram. shared=True keeps the series in a Redis hash
+    instead of this process, for values recorded by Celery worker processes.
+    """
+
+    def __init__(self, name, help_text, labels, buckets, shared=False):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets) + (float("inf"),)
+        self.shared = shared
+        self._series = defaultdict(lambda: [[0] * len(self.buckets), 0.0, 0])  # label values -> counts, sum, n
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, *label_values, pipe=None):
+        """pipe: Redis pipeline to queue shared observations on (executed by the caller)"""
+        first = next(i for i, bound in enumerate(self.buckets) if value <= bound)
+        if self.shared:
+            key, labels = f"{KEY_PREFIX}:{self.name}", _label_text(zip(self.labels, label_values))
+            for bound in self.buckets[first:]:
+                pipe.hincrby(key, f"{labels}\x1f{_number(bound)}", 1)
+            pipe.hincrbyfloat(key, f"{labels}\x1fsum", value)
+            return
+        with self._lock:
+            series = self._series[tuple(label_values)]
+            for i in range(first, len(self.buckets)):
+                series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def _samples(self):
+        """Returns: {label text: ({bucket bound: count}, sum)}"""
+        if not self.shared:
+            with self._lock:
+                return {
+                    _label_text(zip(self.labels, values)): (dict(zip(map(_number, self.buckets), counts)), total)
+                    for values, (counts, total, _) in self._series.items()
+                }
+        samples = defaultdict(lambda: ({}, 0.0))
+        for field, value in get_redis().hgetall(f"{KEY_PREFIX}:{self.name}").items():
+            labels, _, bound = field.decode().rpartition("\x1f")
+            if bound == "sum":
+                samples[labels] = (samples[labels][0], float(value))
+            else:
+                samples[labels][0][bound] = int(value)
+        return samples
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in sorted(self._samples().items()):
+            prefix = f"{labels}," if labels else ""
+            for bound in map(_number, self.buckets):
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {counts.get(bound, 0)}')
+            suffix = f"{{{labels}}}" if labels else ""
+            lines.append(f"{self.name}_sum{suffix} {total}")
+            lines.append(f"{self.name}_count{suffix} {counts.get('+Inf', 0)}")
+        return lines
+
+
+class Counter:
+    """Monotonic counter. shared=True keeps it in a Redis hash, like Histogram."""
+
+    def __init__(self, name, help_text, labels, shared=False):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.shared = shared
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, amount, *label_values, pipe=None):
+        """pipe: Redis pipeline to queue shared increments on (executed by the caller)"""
+        if self.shared:
+            pipe.hincrbyfloat(f"{KEY_PREFIX}:{self.name}", "\x1f".join(map(str, label_values)), amount)
+            return
+        with self._lock:
+            self._values[tuple(label_values)] += amount
+
+    def values(self):
+        """Returns: {label values tuple: total}"""
+        if not self.shared:
+            with self._lock:
+                return dict(self._values)
+        return {tuple(field.decode().split("\x1f")): float(value)
+                for field, value in get_redis().hgetall(f"{KEY_PREFIX}:{self.name}").items()}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for values, total in sorted(self.values().items()):
+            labels = _label_text(zip(self.labels, values))
+            lines.append(f"{self.name}{{{labels}}} {total}" if labels else f"{self.name} {total}")
+        return lines
+
+
+REGISTRY = []
+
+HTTP_LATENCY = Histogram("billwise_http_request_duration_seconds", "Request latency by route",
+                         ("method", "route", "status"), LATENCY_BUCKETS)
+HTTP_QUERIES = Histogram("billwise_http_request_sql_queries", "SQL statements per request",
+                         ("method", "route"), QUERY_BUCKETS)
+HTTP_SQL_TIME = Histogram("billwise_http_request_sql_seconds", "Time spent in SQL per request",
+                          ("method", "route"), LATENCY_BUCKETS)
+TASK_QUEUE_WAIT = Histogram("billwise_task_queue_wait_seconds", "Time from publish (or ETA) to start",
+                            ("task",), TASK_BUCKETS, shared=True)
+TASK_RUNTIME = Histogram("billwise_task_run_seconds", "Task run time", ("task", "state"),
+                         TASK_BUCKETS, shared=True)
+TASK_LLM_TIME = Histogram("billwise_task_llm_seconds", "Time in LLM calls per task (summed over parallel calls)",
+                          ("task",), TASK_BUCKETS, shared=True)
+TASK_QUERIES = Histogram("billwise_task_sql_queries", "SQL statements per task", ("task",),
+                         QUERY_BUCKETS, shared=True)
+
+
+def render():
+    """All metrics in Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        try:
+            lines.extend(metric.render())
+        except redis.RedisError as e:
+            print(f"Could not read metric {metric.name}: {e}")
+    return "\n".join(lines) + "\n"
+
+
+# --- Per request / per task scope: SQL and LLM time charged to whoever runs ---
+
+class Scope:
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.llm_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add_llm(self, seconds):
+        with self._lock:       # generate_many runs calls on several threads
+            self.llm_seconds += seconds
+
+
+_scope = contextvars.ContextVar("billwise_metrics_scope", default=None)
+
+
+def scope():
+    """The current request's / task's Scope, or None outside of one."""
+    return _scope.get()
+
+
+def record_llm_call(seconds):
+    current = _scope.get()
+    if current is not None:
+        current.add_llm(seconds)
+
+
+# The start time lives on the statement's execution context, which is
+# dropped with the statement, so a failing statement leaves nothing behind
+@event.listens_for(Engine, "before_cursor_execute")
+def _sql_started(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and _scope.get() is not None:
+        context.billwise_sql_started = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _sql_finished(conn, cursor, statement, parameters, context, executemany):
+    current = _scope.get()
+    started = getattr(context, "billwise_sql_started", None)
+    if current is not None and started is not None:
+        current.queries += 1
+        current.sql_seconds += time.perf_counter() - started
+
+
+# --- Flask ---
+
+def _route():
+    return request.url_rule.rule if request.url_rule else "<unmatched>"
+
+
+def _before_request():
+    g.metrics_token = _scope.set(Scope())
+    g.metrics_started = time.perf_counter()
+    if PROFILE_SLOW_MS:
+        import cProfile
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+
+def _after_request(response):
+    if "metrics_token" not in g:
+        return response
+    started, token = g.metrics_started, g.pop("metrics_token")
+    current = _scope.get()
+    method, route, path, status = request.method, _route(), request.path, response.status_code
+    profiler = g.pop("profiler", None)
+    # Headers go out before the body, so for streamed responses this only
+    # covers the time until the first chunk
+    elapsed = time.perf_counter() - started
+    response.headers["Server-Timing"] = f"app;dur={elapsed * 1000:.1f}, sql;dur={current.sql_seconds * 1000:.1f}"
+
+    def finished():
+        # Runs when the server closes the response, i.e. after a streamed
+        # body (and the queries it ran) has been sent
+        elapsed = time.perf_counter() - started
+        try:
+            _scope.reset(token)
+        except ValueError:  # closed from another context
+            pass
+        HTTP_LATENCY.observe(elapsed, method, route, status)
+        HTTP_QUERIES.observe(current.queries, method, route)
+        HTTP_SQL_TIME.observe(current.sql_seconds, method, route)
+        if profiler is not None:
+            profiler.disable()
+            if elapsed * 1000 >= PROFILE_SLOW_MS:
+                _dump_profile(profiler, method, route, path, elapsed)
+
+    response.call_on_close(finished)
+    return response
+
+
+def _teardown_request(exc):
+    # Only when after_request never ran; otherwise the response's close does it
+    token = g.pop("metrics_token", None)
+    if token is not None:
+        _scope.reset(token)
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        profiler.disable()
+
+
+def _dump_profile(profiler, method, route, path, elapsed):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = "".join(c if c.isalnum() else "_" for c in f"{method}{route}").strip("_")
+    path_on_disk = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{name}-{elapsed * 1000:.0f}ms.prof")
+    profiler.dump_stats(path_on_disk)
+    print(f"Slow request {method} {path} ({elapsed * 1000:.0f} ms), profile: {path_on_disk}")
+
+
+def init_app(app):
+    """Time every request of this app (the /metrics route itself lives in routes.py)."""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+
+
+# --- Celery ---
+
+@before_task_publish.connect
+def _stamp_sent_at(headers=None, **kwargs):
+    if headers is not None:
+        headers.setdefault(SENT_AT_HEADER, time.time())
+
+
+@task_prerun.connect
+def _task_started(task=None, **kwargs):
+    task.request.metrics_scope = Scope()
+    task.request.metrics_token = _scope.set(task.request.metrics_scope)
+    task.request.metrics_started = time.perf_counter()
+
+    sent_at = getattr(task.request, SENT_AT_HEADER, None)
+    if sent_at is not None:
+        eta = task.request.eta
+        if isinstance(eta, str):
+            from datetime import datetime
+            eta = datetime.fromisoformat(eta)
+        ready_at = max(float(sent_at), eta.timestamp()) if eta else float(sent_at)
+        task.request.metrics_wait = max(time.time() - ready_at, 0.0)
+
+
+@task_postrun.connect
+def _task_finished(task=None, state=None, **kwargs):
+    current = getattr(task.request, "metrics_scope", None)
+    if current is None:
+        return
+    _scope.reset(task.request.metrics_token)
+    elapsed = time.perf_counter() - task.request.metrics_started
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        TASK_RUNTIME.observe(elapsed, task.name, state or "UNKNOWN", pipe=pipe)
+        TASK_QUERIES.observe(current.queries, task.name, pipe=pipe)
+        if current.llm_seconds:
+            TASK_LLM_TIME.observe(current.llm_seconds, task.name, pipe=pipe)
+        wait = getattr(task.request, "metrics_wait", None)
+        if wait is not None:
+            TASK_QUEUE_WAIT.observe(wait, task.name, pipe=pipe)
+        pipe.execute()
+    except redis.RedisError as e:
+        print(f"Could not record metrics of task {task.name}: {e}")
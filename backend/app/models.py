@@ -1,31 +1,154 @@
+import os
+import sqlite3
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 from datetime import datetime
 
 db = SQLAlchemy()
 
+# Per-connection SQLite settings:
+# - foreign_keys: SQLite ignores FOREIGN KEY / ON DELETE CASCADE otherwise
+# - WAL + synchronous=NORMAL: readers don't block the writer, commits skip an fsync
+# - busy_timeout: wait for the write lock instead of failing with "database is locked"
+# - mmap_size: read pages through the OS page cache instead of copying them
+SQLITE_PRAGMAS = [
+    "PRAGMA foreign_keys=ON",
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    f"PRAGMA busy_timeout={int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))}",
+    f"PRAGMA mmap_size={int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))}",
+]
+
+@event.listens_for(Engine, "connect")
+def _configure_sqlite(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        for pragma in SQLITE_PRAGMAS:
+            cursor.execute(pragma)
+        cursor.close()
+
+def dialect_insert(model):
+    """INSERT that supports on_conflict_* on both SQLite and PostgreSQL."""
+    if db.engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model)
+
+# ---- Dimensions: one row per canonical vendor / item (see app/dimensions.py) ----
+
+class Vendor(db.Model):
+    __tablename__ = 'vendors'
+    id = db.Column(db.Integer, primary_key=True)
+    name_key = db.Column(db.String(255), nullable=False, unique=True)  # normalize.vendor_key()
+    name = db.Column(db.String(255), nullable=False)                   # first spelling seen
+
+class Item(db.Model):
+    __tablename__ = 'items'
+    id = db.Column(db.Integer, primary_key=True)
+    name_key = db.Column(db.String(255), nullable=False, unique=True)  # normalize.item_key()
+    name = db.Column(db.String(255), nullable=False)
+
 class Bill(db.Model):
     __tablename__ = 'bills'
     id = db.Column(db.Integer, primary_key=True)
-    vendor = db.Column(db.String(255))
+    vendor = db.Column(db.String(255))           # as printed on the receipt
+    vendor_id = db.Column(db.Integer, db.ForeignKey('vendors.id'), nullable=True)
     total = db.Column(db.Float)
     tax = db.Column(db.Float) 
     date = db.Column(db.Date)
     filename = db.Column(db.String(255))
     user_id = db.Column(db.Integer, nullable=False)
 
+    # Load with .options(selectinload(Bill.items)) when items are needed;
+    # deletes are left to the database's ON DELETE CASCADE.
+    items = db.relationship('BillItem', backref='bill', cascade='all, delete-orphan',
+                            passive_deletes=True, order_by='BillItem.id')
+
+    __table_args__ = (
+        db.Index('ix_bills_user_id_date', 'user_id', 'date'),
+        db.Index('ix_bills_vendor', 'vendor'),
+        db.Index('ix_bills_vendor_id', 'vendor_id'),
+    )
+
 class BillItem(db.Model):
     __tablename__ = 'bill_items'
     id = db.Column(db.Integer, primary_key=True)
-    bill_id = db.Column(db.Integer)
-    name = db.Column(db.String(255))
+    bill_id = db.Column(db.Integer, db.ForeignKey('bills.id', ondelete='CASCADE'), nullable=False)
+    name = db.Column(db.String(255))             # as printed on the receipt
+    item_id = db.Column(db.Integer, db.ForeignKey('items.id'), nullable=True)
     quantity = db.Column(db.Integer)
     price = db.Column(db.Float)
 
+    __table_args__ = (
+        db.Index('ix_bill_items_bill_id', 'bill_id'),
+        db.Index('ix_bill_items_name', 'name'),
+        db.Index('ix_bill_items_item_id', 'item_id'),
+    )
+
 class UserInsight(db.Model):
     __tablename__ = 'user_insights'
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, nullable=False)
-    bill_id = db.Column(db.Integer, nullable=True)
+    bill_id = db.Column(db.Integer, db.ForeignKey('bills.id', ondelete='CASCADE'), nullable=True)
     insight_text = db.Column(db.Text, nullable=False)
     insight_type = db.Column(db.String(50), default='per_bill')
     generated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    period = db.Column(db.String(10), nullable=True)  # 'YYYY-MM-DD' / 'YYYY-MM' of scheduled digests
+
+    __table_args__ = (
+        db.Index('ix_user_insights_user_type_generated', 'user_id', 'insight_type', 'generated_at'),
+        db.Index('ix_user_insights_user_type_period', 'user_id', 'insight_type', 'period'),
+    )
+
+class BillFingerprint(db.Model):
+    __tablename__ = 'bill_fingerprints'
+    # 'file:<sha256 of upload>' or 'bill:<sha256 of normalized parsed bill>'
+    fingerprint = db.Column(db.String(80), primary_key=True)
+    bill_id = db.Column(db.Integer, db.ForeignKey('bills.id', ondelete='CASCADE'), nullable=False, index=True)
+    task_id = db.Column(db.String(155), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ItemCategory(db.Model):
+    __tablename__ = 'item_categories'
+    # norm()-alized item name, e.g. 'basmati rice' for "Basmati Rice 5kg"
+    name_key = db.Column(db.String(255), primary_key=True)
+    category = db.Column(db.String(50), nullable=False)
+    hits = db.Column(db.Integer, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+# ---- Spend rollups, maintained incrementally by app/rollups.py ----
+
+class UserVendorSpend(db.Model):
+    __tablename__ = 'user_vendor_spend'
+    user_id = db.Column(db.Integer, primary_key=True)
+    vendor_id = db.Column(db.Integer, db.ForeignKey('vendors.id'), primary_key=True)
+    total_spent = db.Column(db.Float, nullable=False, default=0.0)
+    bill_count = db.Column(db.Integer, nullable=False, default=0)
+
+class UserMonthlySpend(db.Model):
+    __tablename__ = 'user_monthly_spend'
+    user_id = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.String(7), primary_key=True)  # 'YYYY-MM' of Bill.date
+    total_spent = db.Column(db.Float, nullable=False, default=0.0)
+    bill_count = db.Column(db.Integer, nullable=False, default=0)
+
+class UserItemCount(db.Model):
+    __tablename__ = 'user_item_counts'
+    user_id = db.Column(db.Integer, primary_key=True)
+    item_id = db.Column(db.Integer, db.ForeignKey('items.id'), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+# ---- Scheduled digests (app/digests.py) ----
+
+class DigestDirty(db.Model):
+    __tablename__ = 'digest_dirty'
+    # A user whose digest of a period is out of date. Marked in the same
+    # transaction as every bill insert/update/delete (rollups.apply) and
+    # removed by the digest run that catches up, if version is unchanged
+    kind = db.Column(db.String(50), primary_key=True)
+    period = db.Column(db.String(10), primary_key=True)
+    user_id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=1)
@@ -0,0 +1,55 @@
+import re
+
+
+def norm(s: str) -> str:
+    """Normalize item names for more stable matching (Model_test's benchmark imports this too)."""
+    s = s.lower()
+    s = re.sub(r'[\-\(\)]', ' ', s)
+    # remove units like '1kg', '500 g', '2l', '12 pc', 'bunch', 'dozen'
+    s = re.sub(r'\b\d+(\.\d+)?\s*(kg|g|l|ml|pc|pcs|bunch|dozen)\b', '', s)
+    # remove numbers attached to units e.g., 2x100g
+    s = re.sub(r'\b\d+x\d+(g|ml)\b', '', s)
+    s = re.sub(r'\s+', ' ', s).strip()
+    return s
+
+
+# Hindi/Telugu/Tamil spellings of common items; the first word of each group
+# is the canonical one. Shared by search (query expansion) and item_key().
+TRANSLITERATIONS = [
+    ("milk", "doodh", "dudh", "paal", "palu"),
+    ("curd", "dahi", "perugu", "thayir", "yogurt"),
+    ("potato", "aloo", "alu", "batata", "bangaladumpa"),
+    ("onion", "pyaz", "pyaaz", "kanda", "ullipaya", "vengayam"),
+    ("tomato", "tamatar", "thakkali"),
+    ("rice", "chawal", "chaawal", "biyyam", "arisi"),
+    ("sugar", "cheeni", "chini", "shakkar"),
+    ("salt", "namak", "uppu"),
+    ("flour", "atta", "aata"),
+    ("oil", "tel", "nune", "ennai"),
+    ("eggs", "egg", "anda", "ande", "guddu"),
+    ("banana", "kela", "arati"),
+    ("apple", "seb", "saeb"),
+    ("tea", "chai", "chaay"),
+    ("dal", "daal", "lentils", "pappu", "paruppu"),
+    ("butter", "makhan", "makkhan", "venna"),
+    ("jaggery", "gur", "gud", "bellam", "vellam"),
+    ("turmeric", "haldi", "pasupu", "manjal"),
+    ("cumin", "jeera", "jeeragam", "jilakarra"),
+    ("coriander", "dhania", "dhaniya", "kothimeera"),
+]
+_CANONICAL = {word: group[0] for group in TRANSLITERATIONS for word in group}
+
+
+def item_key(name: str) -> str:
+    """
+    Canonical key of an item name: norm() plus transliterations mapped to one
+    spelling, so "Milk", "Milk 1L" and "Doodh" all become 'milk'.
+    """
+    key = " ".join(_CANONICAL.get(word, word) for word in norm(name).split())
+    return key or name.strip().lower()
+
+
+def vendor_key(name: str) -> str:
+    """Canonical key of a vendor name: letters and digits only ("D-Mart", "DMart" -> 'dmart')."""
+    key = re.sub(r"[^0-9a-z]+", "", name.lower())
+    return key or name.strip().lower()
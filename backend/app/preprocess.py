@@ -0,0 +1,118 @@
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Receipt image clean-up before OCR. Needs Pillow (and pypdfium2 for PDFs);
+# both are imported lazily so the rest of the app runs without them.
+MAX_SIDE = 2000              # px; Textract doesn't need more for receipts
+DESKEW_MAX_ANGLE = 6         # degrees searched either way
+DESKEW_STEP = 0.5
+DESKEW_PROBE_SIDE = 400      # angle search runs on a small copy
+PDF_RENDER_SCALE = 2.0       # ~144 dpi
+
+_pool = None
+
+
+def _pil():
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        raise RuntimeError("Image preprocessing needs Pillow: pip install pillow")
+    return Image, ImageOps
+
+
+def _skew_angle(gray):
+    """
+    Angle that makes text lines horizontal: rotate a small copy through
+    candidate angles and keep the one whose row brightness profile is most
+    uneven (dark text rows alternating with blank gaps).
+    """
+    Image, _ = _pil()
+    probe = gray.copy()
+    probe.thumbnail((DESKEW_PROBE_SIDE, DESKEW_PROBE_SIDE))
+
+    best_angle, best_score = 0.0, -1.0
+    steps = int(DESKEW_MAX_ANGLE / DESKEW_STEP)
+    for i in range(-steps, steps + 1):
+        angle = i * DESKEW_STEP
+        rotated = probe.rotate(angle, resample=Image.BILINEAR, expand=False, fillcolor=255)
+        # Mean of every row in one C call: squash the width to 1 pixel
+        rows = list(rotated.resize((1, rotated.height), Image.BOX).getdata())
+        mean = sum(rows) / len(rows)
+        score = sum((r - mean) ** 2 for r in rows)
+        if score > best_score:
+            best_angle, best_score = angle, score
+    return best_angle
+
+
+def preprocess_image(data):
+    """
+    data: Encoded image bytes (JPEG/PNG/...)
+    Returns: PNG bytes - EXIF-rotated, grayscale, at most MAX_SIDE px, deskewed
+    """
+    Image, ImageOps = _pil()
+    image = Image.open(io.BytesIO(data))
+    image = ImageOps.exif_transpose(image)
+    image = image.convert("L")
+    image.thumbnail((MAX_SIDE, MAX_SIDE), Image.LANCZOS)
+
+    angle = _skew_angle(image)
+    if angle:
+        image = image.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=255)
+
+    out = io.BytesIO()
+    image.save(out, format="PNG", optimize=False)
+    return out.getvalue()
+
+
+def render_pdf_pages(path):
+    """Returns: List of PNG bytes, one per page."""
+    try:
+        import pypdfium2 as pdfium
+    except ImportError:
+        raise RuntimeError("PDF receipts need pypdfium2: pip install pypdfium2")
+
+    pages = []
+    pdf = pdfium.PdfDocument(path)
+    try:
+        for page in pdf:
+            image = page.render(scale=PDF_RENDER_SCALE).to_pil()
+            out = io.BytesIO()
+            image.save(out, format="PNG")
+            pages.append(out.getvalue())
+    finally:
+        pdf.close()
+    return pages
+
+
+def _preprocess_or_error(data):
+    try:
+        return preprocess_image(data)
+    except Exception as e:
+        return e
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 2)
+    return _pool
+
+
+def preprocess_many(images):
+    """
+    Preprocess several images (e.g. the pages of one PDF) in parallel on all
+    cores. Falls back to threads where child processes aren't allowed
+    (inside daemonic worker processes).
+    Returns: PNG bytes per image, or the exception that image failed with
+    """
+    global _pool
+    if len(images) == 1:
+        return [_preprocess_or_error(images[0])]
+    try:
+        return list(_get_pool().map(_preprocess_or_error, images))
+    except (AssertionError, BrokenProcessPool, OSError):
+        _pool = None
+        with ThreadPoolExecutor(max_workers=os.cpu_count() or 2) as threads:
+            return list(threads.map(_preprocess_or_error, images))
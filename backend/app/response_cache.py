@@ -0,0 +1,134 @@
+import os
+import time
+import hashlib
+import functools
+
+import redis
+from flask import request, Response
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# Redis-backed cache for per-user insight responses. Every user has a
+# generation counter that is part of the cache key; bill writes bump it after
+# their transaction commits, which invalidates exactly that user's entries.
+# A global epoch is part of every key too: a process whose invalidation
+# couldn't be sent bumps it as soon as Redis answers again, dropping every
+# entry cached before the outage for all processes. If that process exits
+# before Redis comes back, the stale entries live until CACHE_TTL.
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/1")
+CACHE_TTL = 300
+KEY_PREFIX = "billwise:insights"
+EPOCH_KEY = f"{KEY_PREFIX}:epoch"
+# After a Redis error the cache is bypassed for this long (like the LLM
+# client's circuit breaker), so a down Redis costs one timeout per window
+# instead of one per request
+REDIS_RETRY_SECONDS = 10
+
+_client = None
+_down_until = 0.0
+_epoch_owed = False  # an invalidation of this process was lost
+
+
+class CacheUnavailable(redis.ConnectionError):
+    """Raised without calling Redis during the retry window after a failure."""
+
+
+def get_redis():
+    """
+    Returns: Redis client, after bumping the epoch if an invalidation was lost
+    Raises: redis.RedisError; CacheUnavailable within REDIS_RETRY_SECONDS of the last failure
+    """
+    global _client, _epoch_owed
+    if time.monotonic() < _down_until:
+        raise CacheUnavailable("Insight cache Redis unavailable, retrying later")
+    if _client is None:
+        _client = redis.Redis.from_url(CACHE_REDIS_URL, socket_timeout=0.5, socket_connect_timeout=0.5)
+    if _epoch_owed:
+        _client.incr(EPOCH_KEY)
+        _epoch_owed = False
+        print("Insight cache: dropped entries cached before the outage (epoch bumped)")
+    return _client
+
+
+def _failed(what, error):
+    global _down_until
+    if isinstance(error, CacheUnavailable):
+        return
+    _down_until = time.monotonic() + REDIS_RETRY_SECONDS
+    print(f"{what}: {error} (bypassing the cache for {REDIS_RETRY_SECONDS}s)")
+
+
+def _generation_key(user_id):
+    return f"{KEY_PREFIX}:{user_id}:gen"
+
+
+def mark_user_dirty(session, user_ids):
+    """Queue cache invalidation for these users once session commits."""
+    session.info.setdefault("insight_users", set()).update(u for u in user_ids if u is not None)
+
+
+def invalidate_users(user_ids):
+    global _epoch_owed
+    if not user_ids:
+        return
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.incr(_generation_key(user_id))
+        pipe.execute()
+    except redis.RedisError as e:
+        _epoch_owed = True
+        _failed("Insight cache invalidation failed", e)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    invalidate_users(session.info.pop("insight_users", None))
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_after_rollback(session):
+    session.info.pop("insight_users", None)
+
+
+def cached_user_response(ttl=CACHE_TTL):
+    """
+    Cache a JSON view that takes user_id, with ETag / If-None-Match support.
+    Falls back to computing the response when Redis isn't reachable.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(user_id, *args, **kwargs):
+            try:
+                r = get_redis()
+                epoch, generation = r.mget(EPOCH_KEY, _generation_key(user_id))
+                key = f"{KEY_PREFIX}:{int(epoch or 0)}:{user_id}:{int(generation or 0)}:{request.full_path}"
+                etag, body = r.hmget(key, "etag", "body")
+            except redis.RedisError as e:
+                _failed("Insight cache unavailable", e)
+                return view(user_id, *args, **kwargs)
+
+            if etag is None:
+                response = view(user_id, *args, **kwargs)
+                if isinstance(response, tuple) or response.status_code != 200:
+                    return response
+                body = response.get_data()
+                etag = hashlib.sha1(body).hexdigest().encode("ascii")
+                try:
+                    pipe = r.pipeline(transaction=False)
+                    pipe.hset(key, mapping={"etag": etag, "body": body})
+                    pipe.expire(key, ttl)
+                    pipe.execute()
+                except redis.RedisError as e:
+                    _failed("Insight cache write failed", e)
+
+            etag = etag.decode("ascii")
+            if etag in request.if_none_match:
+                response = Response(status=304)
+            else:
+                response = Response(body, mimetype="application/json")
+            response.set_etag(etag)
+            response.headers["Cache-Control"] = "private, no-cache"
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,150 @@
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import insert, delete
+
+from .models import db, dialect_insert, Bill, BillItem, UserVendorSpend, UserMonthlySpend, UserItemCount
+from .response_cache import mark_user_dirty
+from .digests import mark_dirty as mark_digests_dirty, mark_all_dirty as mark_all_digests_dirty
+
+# Per-user spend aggregates for the insight routes. Every bill write path
+# applies its delta here inside the same transaction, so reads never have to
+# scan bills/bill_items. rebuild() recomputes everything for backfills.
+
+
+def _date(value):
+    if isinstance(value, str):
+        return datetime.fromisoformat(value).date()
+    return value
+
+
+def _month(value):
+    value = _date(value)
+    return value.strftime("%Y-%m") if value is not None else None
+
+
+def _increment(model, keys, counters, rows):
+    """INSERT rows, adding counters onto any existing row with the same keys."""
+    if not rows:
+        return
+    stmt = dialect_insert(model)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=keys,
+        set_={c: getattr(model.__table__.c, c) + getattr(stmt.excluded, c) for c in counters},
+    )
+    db.session.execute(stmt, rows)
+
+
+def apply(bills, sign=1):
+    """
+    bills: Iterable of (bill, item_ids) where bill has user_id, vendor_id,
+           total and date (a Bill or a validate_bill row dict after
+           dimensions.attach_ids)
+    sign:  +1 when bills are added, -1 when they are removed
+    Caller commits.
+    """
+    vendors = defaultdict(lambda: [0.0, 0])
+    months = defaultdict(lambda: [0.0, 0])
+    items = defaultdict(int)
+    user_days = set()
+
+    for bill, item_ids in bills:
+        get = bill.get if isinstance(bill, dict) else lambda k: getattr(bill, k)
+        user_id, total = get("user_id"), float(get("total") or 0.0)
+
+        vendor_id = get("vendor_id")
+        if vendor_id is not None:
+            vendors[(user_id, vendor_id)][0] += sign * total
+            vendors[(user_id, vendor_id)][1] += sign
+        user_days.add((user_id, _date(get("date"))))
+        month = _month(get("date"))
+        if month:
+            months[(user_id, month)][0] += sign * total
+            months[(user_id, month)][1] += sign
+        for item_id in item_ids:
+            if item_id is not None:
+                items[(user_id, item_id)] += sign
+
+    _increment(UserVendorSpend, ["user_id", "vendor_id"], ["total_spent", "bill_count"], [
+        {"user_id": u, "vendor_id": v, "total_spent": t, "bill_count": n} for (u, v), (t, n) in vendors.items()
+    ])
+    _increment(UserMonthlySpend, ["user_id", "month"], ["total_spent", "bill_count"], [
+        {"user_id": u, "month": m, "total_spent": t, "bill_count": n} for (u, m), (t, n) in months.items()
+    ])
+    _increment(UserItemCount, ["user_id", "item_id"], ["count"], [
+        {"user_id": u, "item_id": i, "count": n} for (u, i), n in items.items()
+    ])
+
+    # Scheduled digests of these days/months need recomputing
+    mark_digests_dirty(user_days)
+
+    # Cached insight responses of these users go stale when this commits
+    mark_user_dirty(db.session, {u for u, _ in vendors} | {u for u, _ in months} | {u for u, _ in items})
+
+    if sign < 0:
+        # Drop groups that no longer have any bills behind them
+        user_ids = {u for u, _ in vendors} | {u for u, _ in months} | {u for u, _ in items}
+        db.session.execute(delete(UserVendorSpend).where(
+            UserVendorSpend.user_id.in_(user_ids), UserVendorSpend.bill_count <= 0))
+        db.session.execute(delete(UserMonthlySpend).where(
+            UserMonthlySpend.user_id.in_(user_ids), UserMonthlySpend.bill_count <= 0))
+        db.session.execute(delete(UserItemCount).where(
+            UserItemCount.user_id.in_(user_ids), UserItemCount.count <= 0))
+
+
+def add_bill(bill, item_ids):
+    apply([(bill, item_ids)], sign=1)
+
+
+def remove_bill(bill):
+    """Subtract a bill as it is currently stored (call before changing/deleting it)."""
+    item_ids = [i for (i,) in db.session.query(BillItem.item_id).filter(BillItem.bill_id == bill.id)]
+    apply([(bill, item_ids)], sign=-1)
+
+
+def month_expr(column):
+    """'YYYY-MM' of a date column in the current dialect."""
+    if db.engine.dialect.name == "postgresql":
+        return db.func.to_char(column, "YYYY-MM")
+    return db.func.strftime("%Y-%m", column)
+
+
+def rebuild(user_id=None):
+    """
+    Recompute rollups from bills/bill_items (all users, or one) and mark
+    their digests dirty, since bulk loads never went through apply(). Commits.
+    """
+    user_filter = [] if user_id is None else [Bill.user_id == user_id]
+    if user_id is None:
+        mark_user_dirty(db.session, [u for (u,) in db.session.query(UserVendorSpend.user_id).distinct()])
+        mark_user_dirty(db.session, [u for (u,) in db.session.query(Bill.user_id).distinct()])
+    else:
+        mark_user_dirty(db.session, [user_id])
+
+    for model in (UserVendorSpend, UserMonthlySpend, UserItemCount):
+        stmt = delete(model)
+        if user_id is not None:
+            stmt = stmt.where(model.user_id == user_id)
+        db.session.execute(stmt)
+
+    db.session.execute(insert(UserVendorSpend).from_select(
+        ["user_id", "vendor_id", "total_spent", "bill_count"],
+        db.select(Bill.user_id, Bill.vendor_id, db.func.coalesce(db.func.sum(Bill.total), 0.0), db.func.count())
+        .where(Bill.vendor_id.isnot(None), *user_filter).group_by(Bill.user_id, Bill.vendor_id)
+    ))
+
+    month = month_expr(Bill.date)
+    db.session.execute(insert(UserMonthlySpend).from_select(
+        ["user_id", "month", "total_spent", "bill_count"],
+        db.select(Bill.user_id, month, db.func.coalesce(db.func.sum(Bill.total), 0.0), db.func.count())
+        .where(Bill.date.isnot(None), *user_filter).group_by(Bill.user_id, month)
+    ))
+
+    db.session.execute(insert(UserItemCount).from_select(
+        ["user_id", "item_id", "count"],
+        db.select(Bill.user_id, BillItem.item_id, db.func.count())
+        .join(Bill, Bill.id == BillItem.bill_id)
+        .where(BillItem.item_id.isnot(None), *user_filter).group_by(Bill.user_id, BillItem.item_id)
+    ))
+
+    mark_all_digests_dirty(user_id)
+    db.session.commit()
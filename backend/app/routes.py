@@ -1,23 +1,69 @@
-import os
-from flask import Blueprint, request, jsonify, current_app
+import json
+import tempfile
+import time
+from flask import Blueprint, Response, request, jsonify, current_app, stream_with_context, send_file
 from werkzeug.utils import secure_filename
-from sqlalchemy import and_
+from datetime import date, datetime
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import selectinload
 
 from .textract_utils import read_parsed_json
 from app.models import Bill, BillItem, db
 from celery.result import AsyncResult
-from celery import Celery
 from app.celery_config import celery_app
-from app.models import UserInsight
+from app.models import UserInsight, UserVendorSpend, UserMonthlySpend, UserItemCount, Vendor, Item
+from app import rollups
+from app.dimensions import attach_ids, intern
+from app.normalize import item_key
+from app.response_cache import cached_user_response
+from app.ingest import validate_bill, MAX_BATCH_SIZE
+from app.storage import stream_to_store, store_sidecar, CHUNK_SIZE
+from app import search, export, task_events, metrics
+from app.pagination import encode_cursor, decode_cursor
+from sqlalchemy.exc import IntegrityError
+from app.dedup import file_fingerprint, bill_fingerprint, lookup, claim
 
 bp = Blueprint('main', __name__)
 
+MAX_PER_PAGE = 100
+MAX_TASK_IDS = 1000
+SSE_HEARTBEAT_SECONDS = 15
+SSE_MAX_SECONDS = 600
+FINAL_STATUSES = {"Completed", "FAILURE", "REVOKED"}
+INSIGHT_STREAM_BATCH = 500
+
 # ✅ Health check route
 @bp.route("/", methods=["GET"])
 def index():
     return jsonify({"message": "BillWise API is running"}), 200
 
+# ✅ Prometheus metrics: route latency / SQL per request, task timings from the workers
+@bp.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+def store_upload(stream, original_name=""):
+    # Content-addressed, so client file names never collide or pick the path
+    return stream_to_store(
+        stream,
+        current_app.config['UPLOAD_FOLDER'],
+        original_name=secure_filename(original_name),
+        chunk_size=current_app.config.get("UPLOAD_CHUNK_SIZE", CHUNK_SIZE),
+        max_bytes=current_app.config.get("MAX_UPLOAD_BYTES")
+    )
+
+def duplicate_response(existing):
+    # Same shape as a finished /result/<task_id>, returned without queueing anything
+    return jsonify({
+        "task_id": existing["task_id"],
+        "status": "Completed",
+        "duplicate": True,
+        "result": existing
+    }), 200
+
 # ✅ Upload route (asynchronous)
+# Optional "parsed" part: the receipt's parsed JSON, stored next to it for the
+# local (no-OCR) extractor
 @bp.route("/upload", methods=["POST"])
 def upload_file():
     from app.tasks import parse_json_async
@@ -29,16 +75,157 @@ def upload_file():
         file = request.files["file"]
         if file.filename == "":
             return jsonify({"error": "No selected file"}), 400
-
-        filename = secure_filename(file.filename)
-        save_path = os.path.abspath(os.path.join(current_app.config['UPLOAD_FOLDER'], filename))
-        file.save(save_path)
-
-        print(f"Saved file: {save_path}")
-        task = parse_json_async.delay(filename)
+        parsed = request.files.get("parsed")
+        if parsed is not None and parsed.filename:
+            try:
+                parsed = json.load(parsed.stream)
+            except ValueError:
+                return jsonify({"error": "'parsed' must be a JSON file"}), 400
+            if not isinstance(parsed, dict):
+                return jsonify({"error": "'parsed' must be a JSON object"}), 400
+        else:
+            parsed = None
+
+        # Stored and hashed in one pass; a receipt we've already seen is
+        # answered from the index (its bytes are already at the same path)
+        content_hash, rel_path, size = store_upload(file.stream, file.filename)
+        if rel_path is None:
+            return jsonify({"error": "Empty file"}), 400
+        existing = lookup(file_fingerprint(content_hash))
+        if existing:
+            return duplicate_response(existing)
+
+        print(f"Stored upload {file.filename!r} as {rel_path} ({size} bytes)")
+        if parsed is not None:
+            store_sidecar(current_app.config['UPLOAD_FOLDER'], rel_path, parsed)
+        task = parse_json_async.delay(rel_path, content_hash)
         print(f"Started task: {task.id}")
 
         return jsonify({"task_id": task.id, "status": "processing"}), 202
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 413
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
+# ✅ Streaming upload route (raw request body, content-addressed storage)
+# Send the file bytes as the body with the original name in X-Filename
+# (or ?filename=); the body is copied to disk chunk by chunk.
+@bp.route("/upload/stream", methods=["POST", "PUT"])
+def upload_stream():
+    from app.tasks import parse_json_async
+    try:
+        original_name = request.headers.get("X-Filename") or request.args.get("filename", "")
+        content_hash, rel_path, size = store_upload(request.stream, original_name)
+        if rel_path is None:
+            return jsonify({"error": "Empty request body"}), 400
+
+        existing = lookup(file_fingerprint(content_hash))
+        if existing:
+            return duplicate_response(existing)
+
+        print(f"Stored upload {original_name!r} as {rel_path} ({size} bytes)")
+        task = parse_json_async.delay(rel_path, content_hash)
+
+        return jsonify({
+            "task_id": task.id,
+            "status": "processing",
+            "sha256": content_hash,
+            "size": size
+        }), 202
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 413
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({"error": str(e)}), 500
+
+# ✅ Batch upload route (asynchronous, bulk insert)
+# Accepts either a JSON array of parsed bills (or {"user_id": .., "bills": [..]})
+# or multipart "files" - .json files are read as parsed bills, anything else
+# is saved and parsed by the worker.
+@bp.route("/upload/batch", methods=["POST"])
+def upload_batch():
+    from app.tasks import ingest_batch_async
+    try:
+        user_id = request.args.get("user_id", 1, type=int)
+        sources = []
+        stored = {}  # source index -> content-addressed path of a stored receipt
+
+        if request.is_json:
+            payload = request.get_json()
+            if isinstance(payload, dict):
+                try:
+                    user_id = int(payload.get("user_id", user_id))
+                except (TypeError, ValueError):
+                    return jsonify({"error": "'user_id' must be an integer"}), 400
+                payload = payload.get("bills")
+            if not isinstance(payload, list):
+                return jsonify({"error": "Expected a JSON array of bills"}), 400
+            sources = [(None, bill) for bill in payload]
+        else:
+            if request.form.get("user_id") is not None:
+                try:
+                    user_id = int(request.form["user_id"])
+                except ValueError:
+                    return jsonify({"error": "'user_id' must be an integer"}), 400
+            for file in request.files.getlist("files"):
+                if file.filename == "":
+                    continue
+                filename = secure_filename(file.filename)
+                if filename.lower().endswith(".json"):
+                    try:
+                        sources.append((filename, json.load(file.stream)))
+                    except ValueError:
+                        sources.append((filename, "Invalid JSON file"))
+                else:
+                    try:
+                        _, rel_path, _ = store_upload(file.stream, filename)
+                    except ValueError as e:  # over MAX_UPLOAD_BYTES
+                        sources.append((filename, str(e)))
+                        continue
+                    if rel_path:
+                        stored[len(sources)] = rel_path
+                    sources.append((filename, None if rel_path else "Empty file"))
+
+        if not sources:
+            return jsonify({"error": "No bills or files provided"}), 400
+        if len(sources) > MAX_BATCH_SIZE:
+            return jsonify({"error": f"Batch too large (max {MAX_BATCH_SIZE})"}), 413
+
+        # Validate everything up front so bad rows never reach the worker
+        entries, outcomes = [], []
+        for index, (filename, data) in enumerate(sources):
+            outcome = {"index": index, "filename": filename}
+            if index in stored:
+                # Stored receipt: the worker parses it from its content path
+                entries.append({"index": index, "filename": stored[index]})
+                outcome["status"] = "queued"
+            elif isinstance(data, str):
+                outcome.update(status="rejected", error=data)
+            else:
+                try:
+                    validate_bill(data, user_id=user_id, filename=filename)
+                    entries.append({"index": index, "bill": data, "filename": filename})
+                    outcome["status"] = "queued"
+                except ValueError as e:
+                    outcome.update(status="rejected", error=str(e))
+            outcomes.append(outcome)
+
+        if not entries:
+            return jsonify({"error": "No valid bills in batch", "bills": outcomes}), 400
+
+        task = ingest_batch_async.delay(entries, user_id)
+        print(f"Started batch task: {task.id} ({len(entries)} bills)")
+
+        return jsonify({
+            "batch_id": task.id,
+            "status": "processing",
+            "queued": len(entries),
+            "rejected": len(outcomes) - len(entries),
+            "bills": outcomes
+        }), 202
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -55,6 +242,64 @@ def get_task_result(task_id):
     else:
         return jsonify({"status": result.state}), 202
 
+def requested_task_ids():
+    # ?ids=a,b,c and/or ?ids=a&ids=b
+    ids = [i for value in request.args.getlist("ids") for i in value.split(",") if i.strip()]
+    return list(dict.fromkeys(i.strip() for i in ids))
+
+# ✅ Many task results in one call (one pipelined backend round-trip)
+@bp.route("/results", methods=["GET"])
+def get_task_results():
+    task_ids = requested_task_ids()
+    if not task_ids:
+        return jsonify({"error": "Pass task ids as ?ids=a,b,c"}), 400
+    if len(task_ids) > MAX_TASK_IDS:
+        return jsonify({"error": f"At most {MAX_TASK_IDS} ids per request"}), 400
+    return jsonify({"results": task_events.fetch_statuses(task_ids)})
+
+# ✅ Server-sent events: current state of each task, then every change
+# pushed by the workers, until all are finished (or the stream times out).
+@bp.route("/events/tasks", methods=["GET"])
+def task_event_stream():
+    task_ids = requested_task_ids()
+    if not task_ids:
+        return jsonify({"error": "Pass task ids as ?ids=a,b,c"}), 400
+    if len(task_ids) > MAX_TASK_IDS:
+        return jsonify({"error": f"At most {MAX_TASK_IDS} ids per request"}), 400
+
+    def sse(status):
+        return f"event: task\ndata: {json.dumps(status, default=str)}\n\n"
+
+    def generate():
+        pubsub = task_events.get_redis().pubsub(ignore_subscribe_messages=True)
+        # Subscribe before reading current states so no transition is missed
+        pubsub.subscribe(*[task_events.channel(t) for t in task_ids])
+        try:
+            pending = set(task_ids)
+            for status in task_events.fetch_statuses(task_ids):
+                yield sse(status)
+                if status["status"] in FINAL_STATUSES:
+                    pending.discard(status["task_id"])
+
+            deadline = time.monotonic() + SSE_MAX_SECONDS
+            while pending and time.monotonic() < deadline:
+                message = pubsub.get_message(timeout=SSE_HEARTBEAT_SECONDS)
+                if message is None:
+                    yield ": keepalive\n\n"
+                    continue
+                status = json.loads(message["data"])
+                yield sse(status)
+                if status["status"] in FINAL_STATUSES:
+                    pending.discard(status["task_id"])
+            yield "event: end\ndata: {}\n\n"
+        finally:
+            pubsub.close()
+
+    response = Response(stream_with_context(generate()), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
 # ✅ Direct JSON test route
 @bp.route("/parse-json", methods=["GET", "POST"])
 def parse_json():
@@ -67,75 +312,160 @@ def parse_json():
         if not data or "items" not in data:
             return jsonify({"error": "Invalid JSON or missing 'items'"}), 400
 
-        new_bill = Bill(
-            vendor=data.get("vendor", "Unknown"),
-            tax=data.get("tax", "0.00"),
-            total=data.get("total", "0.00"),
-            currency=data.get("currency", "INR")
-        )
-        for item in data["items"]:
-            bill_item = BillItem(
-                name=item.get("name", "Unnamed"),
-                price=item.get("price", 0.0)
-            )
-            new_bill.items.append(bill_item)
+        try:
+            bill_row, item_rows = validate_bill(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        fingerprint = bill_fingerprint(bill_row, item_rows)
+        existing = lookup(fingerprint)
+        if existing:
+            return already_saved(existing)
 
+        attach_ids([(bill_row, item_rows)])
+        new_bill = Bill(**bill_row)
         db.session.add(new_bill)
-        db.session.commit()
+        db.session.flush()
+        db.session.add_all([BillItem(bill_id=new_bill.id, **row) for row in item_rows])
+        rollups.add_bill(bill_row, [row["item_id"] for row in item_rows])
+
+        # Fingerprint commits with the bill; a racing duplicate loses on its key
+        claim(fingerprint, new_bill.id)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            existing = lookup(fingerprint)
+            if existing:
+                return already_saved(existing)
+            raise
         return jsonify({"message": "Bill saved", "bill_id": new_bill.id}), 201
 
+def already_saved(existing):
+    return jsonify({"message": "Bill already saved", "bill_id": existing["bill_id"],
+                    "duplicate": True, "category_insight": existing["category_insight"]}), 200
+
+def vendor_filter(vendor):
+    # FTS5 index when available (prefix/typo/transliteration aware), else LIKE scan
+    if search.available():
+        ids = search.matching_ids(vendor, "vendors")
+        if ids is not None:
+            return Bill.id.in_(ids)
+    return Bill.vendor.ilike(f"%{vendor}%")
+
+def item_filter(item_name):
+    if search.available():
+        ids = search.matching_ids(item_name, "items")
+        if ids is not None:
+            return BillItem.id.in_(ids)
+    return BillItem.name.ilike(f"%{item_name}%")
+
+def item_id_filter(item_name):
+    # Indexed equality on the canonical item ("Doodh" -> milk), else a name search
+    item_id = db.session.query(Item.id).filter(Item.name_key == item_key(item_name)).scalar()
+    if item_id is not None:
+        return BillItem.item_id == item_id
+    return item_filter(item_name)
+
+def bill_summary(bill):
+    return {
+        "id": bill.id,
+        "user_id": bill.user_id,
+        "vendor": bill.vendor,
+        "total": bill.total,
+        "tax": bill.tax,
+        "date": bill.date.isoformat() if bill.date else None
+    }
+
 # ✅ Enhanced: List bills with pagination and filters
+# Two paging modes, both newest first by (date, id):
+#   ?page=N            classic OFFSET paging with page counts
+#   ?cursor= (or ?cursor with no value for the first page)
+#                      keyset paging - pass back meta.next_cursor; cost doesn't
+#                      grow with depth. Add ?include_total=1 for an exact count.
 @bp.route("/bills", methods=["GET"])
 def list_bills():
-    page = request.args.get("page", 1, type=int)
-    per_page = request.args.get("per_page", 10, type=int)
+    page = max(request.args.get("page", 1, type=int), 1)
+    per_page = min(max(request.args.get("per_page", 10, type=int), 1), MAX_PER_PAGE)
+    user_id = request.args.get("user_id", type=int)
     vendor = request.args.get("vendor")
     min_total = request.args.get("min_total", type=float)
     max_total = request.args.get("max_total", type=float)
 
     query = Bill.query
 
+    if user_id is not None:
+        query = query.filter(Bill.user_id == user_id)
     if vendor:
-        query = query.filter(Bill.vendor.ilike(f"%{vendor}%"))
+        query = query.filter(vendor_filter(vendor))
     if min_total is not None:
         query = query.filter(Bill.total >= min_total)
     if max_total is not None:
         query = query.filter(Bill.total <= max_total)
 
-    pagination = query.order_by(Bill.created_at.desc()).paginate(page=page, per_page=per_page, error_out=False)
-
-    bills = [{
-        "id": bill.id,
-        "vendor": bill.vendor,
-        "total": bill.total,
-        "tax": bill.tax,
-        "currency": bill.currency,
-        "created_at": bill.created_at.isoformat()
-    } for bill in pagination.items]
-
-    return jsonify({
-        "bills": bills,
-        "meta": {
-            "page": pagination.page,
-            "pages": pagination.pages,
-            "total": pagination.total,
-            "per_page": pagination.per_page
-        }
-    })
+    order = (Bill.date.desc().nulls_last(), Bill.id.desc())
+
+    if "cursor" not in request.args:
+        pagination = query.order_by(*order).paginate(page=page, per_page=per_page, error_out=False)
+        return jsonify({
+            "bills": [bill_summary(bill) for bill in pagination.items],
+            "meta": {
+                "page": pagination.page,
+                "pages": pagination.pages,
+                "total": pagination.total,
+                "per_page": pagination.per_page
+            }
+        })
+
+    total = query.order_by(None).count() if request.args.get("include_total") in ("1", "true") else None
+
+    cursor = request.args.get("cursor")
+    if cursor:
+        try:
+            last_date, last_id = decode_cursor(cursor)
+            last_date = date.fromisoformat(last_date) if last_date else None
+            last_id = int(last_id)
+        except (ValueError, TypeError):
+            return jsonify({"error": "Invalid cursor"}), 400
+
+        # Rows that sort after (last_date, last_id) with NULL dates at the end
+        if last_date is None:
+            query = query.filter(Bill.date.is_(None), Bill.id < last_id)
+        else:
+            query = query.filter(or_(
+                Bill.date < last_date,
+                and_(Bill.date == last_date, Bill.id < last_id),
+                Bill.date.is_(None)
+            ))
+
+    rows = query.order_by(*order).limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+
+    meta = {
+        "per_page": per_page,
+        "next_cursor": encode_cursor(rows[-1].date, rows[-1].id) if has_more else None
+    }
+    if total is not None:
+        meta["total"] = total
+
+    return jsonify({"bills": [bill_summary(bill) for bill in rows], "meta": meta})
 
 # ✅ Get one bill by ID
 @bp.route("/bills/<int:bill_id>", methods=["GET"])
 def get_bill(bill_id):
-    bill = Bill.query.get_or_404(bill_id)
+    bill = Bill.query.options(selectinload(Bill.items)).filter_by(id=bill_id).first_or_404()
     return jsonify({
         "id": bill.id,
+        "user_id": bill.user_id,
         "vendor": bill.vendor,
         "total": bill.total,
         "tax": bill.tax,
-        "currency": bill.currency,
-        "created_at": bill.created_at.isoformat(),
+        "date": bill.date.isoformat() if bill.date else None,
+        "filename": bill.filename,
         "items": [{
             "name": item.name,
+            "quantity": item.quantity,
             "price": item.price
         } for item in bill.items]
     })
@@ -147,12 +477,23 @@ def update_bill(bill_id):
     if not bill:
         return jsonify({"error": "Bill not found"}), 404
 
-    data = request.json
-    bill.vendor = data.get("vendor", bill.vendor)
-    bill.total = data.get("total", bill.total)
-    bill.tax = data.get("tax", bill.tax)
-    bill.currency = data.get("currency", bill.currency)
-    #bill.date = data.get("date", bill.date)
+    data = request.json or {}
+    try:
+        total = float(data["total"]) if data.get("total") is not None else bill.total
+        tax = float(data["tax"]) if data.get("tax") is not None else bill.tax
+        bill_date = date.fromisoformat(data["date"]) if data.get("date") else bill.date
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid total, tax or date"}), 400
+
+    # Take the old values out of the rollups, then put the new ones in
+    rollups.remove_bill(bill)
+    if data.get("vendor") and data["vendor"] != bill.vendor:
+        bill.vendor = str(data["vendor"])[:255]
+        bill.vendor_id = intern(Vendor, [bill.vendor]).get(bill.vendor)
+    bill.total = total
+    bill.tax = tax
+    bill.date = bill_date
+    rollups.add_bill(bill, [item.item_id for item in bill.items])
 
     db.session.commit()
     return jsonify({"message": "Bill updated successfully"}), 200
@@ -164,11 +505,48 @@ def delete_bill(bill_id):
     if not bill:
         return jsonify({"error": "Bill not found"}), 404
 
-    BillItem.query.filter_by(bill_id=bill_id).delete()
+    # Items, insights and fingerprints go with it via ON DELETE CASCADE
+    rollups.remove_bill(bill)
     db.session.delete(bill)
     db.session.commit()
     return jsonify({"message": "Bill and its items deleted successfully"}), 200
 
+# ✅ Export bills joined with their items (streamed, one row per item)
+# ?format=csv|ndjson|parquet &user_id= &start=YYYY-MM-DD &end=YYYY-MM-DD
+@bp.route("/export", methods=["GET"])
+def export_bills():
+    fmt = request.args.get("format", "csv")
+    user_id = request.args.get("user_id", type=int)
+    try:
+        start = date.fromisoformat(request.args["start"]) if request.args.get("start") else None
+        end = date.fromisoformat(request.args["end"]) if request.args.get("end") else None
+    except ValueError:
+        return jsonify({"error": "start/end must be YYYY-MM-DD"}), 400
+
+    rows = export.export_rows(user_id=user_id, start=start, end=end)
+    name = f"billwise-export{'-user' + str(user_id) if user_id else ''}"
+
+    if fmt == "csv":
+        response = Response(stream_with_context(export.iter_csv(rows)), mimetype="text/csv")
+    elif fmt == "ndjson":
+        response = Response(stream_with_context(export.iter_ndjson(rows)), mimetype="application/x-ndjson")
+    elif fmt == "parquet":
+        # Parquet needs its footer written last, so spool to a temp file first
+        spool = tempfile.TemporaryFile()
+        try:
+            export.write_parquet(rows, spool)
+        except RuntimeError as e:
+            spool.close()
+            return jsonify({"error": str(e)}), 501
+        spool.seek(0)
+        return send_file(spool, mimetype="application/vnd.apache.parquet",
+                         as_attachment=True, download_name=f"{name}.parquet")
+    else:
+        return jsonify({"error": "format must be csv, ndjson or parquet"}), 400
+
+    response.headers["Content-Disposition"] = f"attachment; filename={name}.{fmt}"
+    return response
+
 # ✅ Optional: handle 404 errors globally
 @bp.errorhandler(404)
 def not_found(e):
@@ -177,13 +555,18 @@ def not_found(e):
 # 📊 Insight Routes
 # ================================
 
+# Insight aggregates read the per-user rollup tables (see app/rollups.py)
+# instead of regrouping bills/bill_items on every call.
+
 # 1. Top vendors by total spend
 @bp.route("/insights/top-vendors", methods=["GET"])
 def top_vendors():
-    results = db.session.query(
-        Bill.vendor,
-        db.func.sum(Bill.total).label("total_spent")
-    ).group_by(Bill.vendor).order_by(db.desc("total_spent")).limit(5).all()
+    spend = db.session.query(
+        UserVendorSpend.vendor_id,
+        db.func.sum(UserVendorSpend.total_spent).label("total_spent")
+    ).group_by(UserVendorSpend.vendor_id).order_by(db.desc("total_spent")).limit(5).subquery()
+    results = db.session.query(Vendor.name, spend.c.total_spent) \
+        .join(spend, spend.c.vendor_id == Vendor.id).order_by(spend.c.total_spent.desc()).all()
 
     return jsonify([
         {"vendor": r[0], "total_spent": round(r[1], 2)} for r in results
@@ -193,9 +576,9 @@ def top_vendors():
 @bp.route("/insights/monthly-spend", methods=["GET"])
 def monthly_spend():
     results = db.session.query(
-        db.func.strftime("%Y-%m", Bill.created_at).label("month"),
-        db.func.sum(Bill.total).label("total")
-    ).group_by("month").order_by("month").all()
+        UserMonthlySpend.month,
+        db.func.sum(UserMonthlySpend.total_spent).label("total")
+    ).group_by(UserMonthlySpend.month).order_by(UserMonthlySpend.month).all()
 
     return jsonify([
         {"month": r[0], "total_spent": round(r[1], 2)} for r in results
@@ -204,10 +587,12 @@ def monthly_spend():
 # 3. Most frequent items purchased
 @bp.route("/insights/frequent-items", methods=["GET"])
 def frequent_items():
-    results = db.session.query(
-        BillItem.name,
-        db.func.count(BillItem.name).label("count")
-    ).group_by(BillItem.name).order_by(db.desc("count")).limit(5).all()
+    counts = db.session.query(
+        UserItemCount.item_id,
+        db.func.sum(UserItemCount.count).label("count")
+    ).group_by(UserItemCount.item_id).order_by(db.desc("count")).limit(5).subquery()
+    results = db.session.query(Item.name, counts.c.count) \
+        .join(counts, counts.c.item_id == Item.id).order_by(counts.c.count.desc()).all()
 
     return jsonify([
         {"item": r[0], "count": r[1]} for r in results
@@ -217,31 +602,172 @@ def frequent_items():
 @bp.route("/insights/price-trend/<item_name>", methods=["GET"])
 def price_trend(item_name):
     results = db.session.query(
-        db.func.strftime("%Y-%m", Bill.created_at).label("month"),
+        rollups.month_expr(Bill.date).label("month"),
         db.func.avg(BillItem.price).label("avg_price")
-    ).join(Bill).filter(BillItem.name.ilike(f"%{item_name}%")) \
+    ).join(Bill).filter(item_id_filter(item_name)) \
      .group_by("month").order_by("month").all()
 
     return jsonify([
         {"month": r[0], "avg_price": round(r[1], 2)} for r in results
     ])
 
-from flask import Response
-import json
+# 5. Vendor / item name search (distinct names with how often they occur)
+@bp.route("/search", methods=["GET"])
+def search_names():
+    q = request.args.get("q", "").strip()
+    kind = request.args.get("type", "items")
+    limit = min(max(request.args.get("limit", 20, type=int), 1), MAX_PER_PAGE)
+    if not q:
+        return jsonify({"error": "Missing 'q'"}), 400
+    if kind not in ("items", "vendors"):
+        return jsonify({"error": "type must be 'items' or 'vendors'"}), 400
+
+    column = BillItem.name if kind == "items" else Bill.vendor
+    condition = item_filter(q) if kind == "items" else vendor_filter(q)
+    results = db.session.query(column, db.func.count().label("count")) \
+        .filter(condition).group_by(column).order_by(db.desc("count")).limit(limit).all()
+
+    return jsonify([{"name": r[0], "count": r[1]} for r in results])
+
+# 6. Item category cache counters (all processes, via Redis) and persistent tier size
+@bp.route("/insights/category-cache", methods=["GET"])
+def category_cache_stats():
+    import redis
+    from app.category_cache import category_cache
+    from app.models import ItemCategory
+
+    try:
+        shared = category_cache.shared_stats()
+    except redis.RedisError as e:
+        print(f"Could not read category cache counters: {e}")
+        shared = None
+
+    persisted = db.session.query(
+        db.func.count(ItemCategory.name_key),
+        db.func.coalesce(db.func.sum(ItemCategory.hits), 0)
+    ).one()
+
+    return jsonify({
+        "all_processes": shared,
+        "process": category_cache.stats(),
+        "persistent": {"entries": persisted[0], "hits": persisted[1]}
+    })
+
+# ================================
+# 👤 Per-user Insight Routes (cached in Redis, ETag aware)
+# ================================
+
+@bp.route("/insights/<int:user_id>/top-vendors", methods=["GET"])
+@cached_user_response()
+def user_top_vendors(user_id):
+    limit = min(max(request.args.get("limit", 5, type=int), 1), MAX_PER_PAGE)
+    results = db.session.query(Vendor.name, UserVendorSpend.total_spent) \
+        .join(Vendor, Vendor.id == UserVendorSpend.vendor_id) \
+        .filter(UserVendorSpend.user_id == user_id) \
+        .order_by(UserVendorSpend.total_spent.desc()).limit(limit).all()
+
+    return jsonify([
+        {"vendor": r[0], "total_spent": round(r[1], 2)} for r in results
+    ])
+
+@bp.route("/insights/<int:user_id>/monthly-spend", methods=["GET"])
+@cached_user_response()
+def user_monthly_spend(user_id):
+    results = db.session.query(UserMonthlySpend.month, UserMonthlySpend.total_spent) \
+        .filter(UserMonthlySpend.user_id == user_id) \
+        .order_by(UserMonthlySpend.month).all()
+
+    return jsonify([
+        {"month": r[0], "total_spent": round(r[1], 2)} for r in results
+    ])
+
+@bp.route("/insights/<int:user_id>/frequent-items", methods=["GET"])
+@cached_user_response()
+def user_frequent_items(user_id):
+    limit = min(max(request.args.get("limit", 5, type=int), 1), MAX_PER_PAGE)
+    results = db.session.query(Item.name, UserItemCount.count) \
+        .join(Item, Item.id == UserItemCount.item_id) \
+        .filter(UserItemCount.user_id == user_id) \
+        .order_by(UserItemCount.count.desc()).limit(limit).all()
+
+    return jsonify([
+        {"item": r[0], "count": r[1]} for r in results
+    ])
+
+@bp.route("/insights/<int:user_id>/price-trend/<item_name>", methods=["GET"])
+@cached_user_response()
+def user_price_trend(user_id, item_name):
+    results = db.session.query(
+        rollups.month_expr(Bill.date).label("month"),
+        db.func.avg(BillItem.price).label("avg_price")
+    ).join(Bill).filter(Bill.user_id == user_id, item_id_filter(item_name)) \
+     .group_by("month").order_by("month").all()
+
+    return jsonify([
+        {"month": r[0], "avg_price": round(r[1], 2)} for r in results
+    ])
 
+def insight_row(row):
+    return {
+        "insight": row.insight_text,
+        "bill_id": row.bill_id,
+        "generated_at": row.generated_at.isoformat() if row.generated_at else None
+    }
+
+# Newest first. Three response shapes, all with flat memory per request:
+#   default          JSON array of every insight, streamed row by row
+#   ?limit=&cursor=  one page {"insights": [...], "next_cursor": ...}
+#   ?format=ndjson   one JSON object per line, streamed (not with limit/cursor:
+#                    a page needs its next_cursor)
 @bp.route("/insights/<int:user_id>", methods=["GET"])
 def get_user_insights(user_id):
     insight_type = request.args.get('type', 'per_bill')
-    insights = UserInsight.query.filter_by(user_id=user_id, insight_type=insight_type)\
-        .order_by(UserInsight.generated_at.desc()).all()
-
-    data = [
-        {
-            "insight": i.insight_text,
-            "bill_id": i.bill_id,
-            "generated_at": i.generated_at.isoformat()
-        }
-        for i in insights
-    ]
-
-    return Response(json.dumps(data, ensure_ascii=False), mimetype='application/json')
+    output_format = request.args.get("format", "json")
+    paged = "limit" in request.args or bool(request.args.get("cursor"))
+    if output_format not in ("json", "ndjson"):
+        return jsonify({"error": "format must be 'json' or 'ndjson'"}), 400
+    if paged and output_format == "ndjson":
+        return jsonify({"error": "format=ndjson streams every insight; it can't be combined with limit/cursor"}), 400
+    query = db.select(
+        UserInsight.id, UserInsight.insight_text, UserInsight.bill_id, UserInsight.generated_at
+    ).where(UserInsight.user_id == user_id, UserInsight.insight_type == insight_type) \
+     .order_by(UserInsight.generated_at.desc(), UserInsight.id.desc())
+
+    cursor = request.args.get("cursor")
+    if cursor:
+        try:
+            last_generated, last_id = decode_cursor(cursor)
+            last_generated = datetime.fromisoformat(last_generated)
+            last_id = int(last_id)
+        except (ValueError, TypeError):
+            return jsonify({"error": "Invalid cursor"}), 400
+        query = query.where(or_(
+            UserInsight.generated_at < last_generated,
+            and_(UserInsight.generated_at == last_generated, UserInsight.id < last_id)
+        ))
+
+    if paged:
+        limit = min(max(request.args.get("limit", 20, type=int), 1), MAX_PER_PAGE)
+        rows = db.session.execute(query.limit(limit + 1)).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        return jsonify({
+            "insights": [insight_row(r) for r in rows],
+            "next_cursor": encode_cursor(rows[-1].generated_at, rows[-1].id) if has_more else None
+        })
+
+    # Rows come off the cursor in batches and go straight to the client
+    rows = db.session.execute(query.execution_options(yield_per=INSIGHT_STREAM_BATCH))
+
+    if output_format == "ndjson":
+        def generate_ndjson():
+            for row in rows:
+                yield json.dumps(insight_row(row), ensure_ascii=False) + "\n"
+        return Response(stream_with_context(generate_ndjson()), mimetype='application/x-ndjson')
+
+    def generate_array():
+        yield "["
+        for n, row in enumerate(rows):
+            yield ("," if n else "") + json.dumps(insight_row(row), ensure_ascii=False)
+        yield "]"
+    return Response(stream_with_context(generate_array()), mimetype='application/json')
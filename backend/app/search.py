@@ -0,0 +1,152 @@
+import re
+import time
+import bisect
+import difflib
+from sqlalchemy import text, select, column, table, literal_column
+
+from .models import db
+from .normalize import TRANSLITERATIONS
+
+# SQLite FTS5 indexes over bills.vendor and bill_items.name. They are
+# "external content" tables kept in sync by triggers, so every write path
+# (ORM, bulk INSERT, cascade deletes) updates them without extra code.
+# prefix='2 3' adds prefix indexes so "mil*" doesn't scan the term list.
+SCHEMA = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS bills_fts USING fts5(
+        vendor, content='bills', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3')""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS bill_items_fts USING fts5(
+        name, content='bill_items', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3')""",
+    # Distinct terms of each index, used for typo-tolerant matching
+    "CREATE VIRTUAL TABLE IF NOT EXISTS bills_fts_vocab USING fts5vocab(bills_fts, 'row')",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS bill_items_fts_vocab USING fts5vocab(bill_items_fts, 'row')",
+
+    """CREATE TRIGGER IF NOT EXISTS bills_fts_ai AFTER INSERT ON bills BEGIN
+        INSERT INTO bills_fts(rowid, vendor) VALUES (new.id, new.vendor);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS bills_fts_ad AFTER DELETE ON bills BEGIN
+        INSERT INTO bills_fts(bills_fts, rowid, vendor) VALUES ('delete', old.id, old.vendor);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS bills_fts_au AFTER UPDATE OF vendor ON bills BEGIN
+        INSERT INTO bills_fts(bills_fts, rowid, vendor) VALUES ('delete', old.id, old.vendor);
+        INSERT INTO bills_fts(rowid, vendor) VALUES (new.id, new.vendor);
+    END""",
+
+    """CREATE TRIGGER IF NOT EXISTS bill_items_fts_ai AFTER INSERT ON bill_items BEGIN
+        INSERT INTO bill_items_fts(rowid, name) VALUES (new.id, new.name);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS bill_items_fts_ad AFTER DELETE ON bill_items BEGIN
+        INSERT INTO bill_items_fts(bill_items_fts, rowid, name) VALUES ('delete', old.id, old.name);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS bill_items_fts_au AFTER UPDATE OF name ON bill_items BEGIN
+        INSERT INTO bill_items_fts(bill_items_fts, rowid, name) VALUES ('delete', old.id, old.name);
+        INSERT INTO bill_items_fts(rowid, name) VALUES (new.id, new.name);
+    END""",
+]
+
+# Transliteration groups (normalize.py) are expanded both ways, so "doodh"
+# finds "Milk" and vice versa.
+_SYNONYMS = {word: set(group) for group in TRANSLITERATIONS for word in group}
+
+FUZZY_CUTOFF = 0.75
+MAX_FUZZY_TERMS = 3
+# The vocabulary is read once per process and refreshed after this long, so
+# typo matching doesn't scan fts5vocab on every request. A term added since
+# only misses out on fuzzy expansion; the word as typed is always searched.
+VOCAB_TTL_SECONDS = 300
+
+_TARGETS = {
+    "vendors": ("bills_fts", "bills_fts_vocab"),
+    "items": ("bill_items_fts", "bill_items_fts_vocab"),
+}
+
+_available = None
+_vocab_cache = {}  # vocab table -> (loaded at, sorted terms)
+
+
+def available():
+    """True when the database is SQLite and the FTS tables have been created."""
+    global _available
+    if not _available and db.engine.dialect.name == "sqlite":
+        # Only a positive answer is cached, so a later migrate is picked up
+        _available = db.session.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE name = 'bill_items_fts'"
+        )).first() is not None
+    return bool(_available)
+
+
+def ensure_search_index(rebuild=False):
+    """Create FTS tables and triggers if missing; backfill when new or asked to."""
+    global _available
+    if db.engine.dialect.name != "sqlite":
+        print("ℹ Full-text search needs SQLite FTS5; falling back to LIKE filters.")
+        return False
+
+    existed = db.session.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE name = 'bill_items_fts'"
+    )).first() is not None
+
+    for statement in SCHEMA:
+        db.session.execute(text(statement))
+    if rebuild or not existed:
+        db.session.execute(text("INSERT INTO bills_fts(bills_fts) VALUES ('rebuild')"))
+        db.session.execute(text("INSERT INTO bill_items_fts(bill_items_fts) VALUES ('rebuild')"))
+    db.session.commit()
+
+    _vocab_cache.clear()
+    _available = True
+    return True
+
+
+def _terms(vocab):
+    """Returns: Sorted distinct terms of an FTS index, cached for VOCAB_TTL_SECONDS"""
+    cached = _vocab_cache.get(vocab)
+    if cached is None or time.monotonic() - cached[0] > VOCAB_TTL_SECONDS:
+        terms = db.session.execute(text(f"SELECT term FROM {vocab} ORDER BY term")).scalars().all()
+        cached = _vocab_cache[vocab] = (time.monotonic(), terms)
+    return cached[1]
+
+
+def _term_range(terms, lo, hi):
+    return terms[bisect.bisect_left(terms, lo):bisect.bisect_left(terms, hi)]
+
+
+def _fuzzy_terms(token, terms):
+    # Candidates share the first letter - keeps the comparison to one range
+    candidates = _term_range(terms, token[0], chr(ord(token[0]) + 1))
+    return difflib.get_close_matches(token, candidates, n=MAX_FUZZY_TERMS, cutoff=FUZZY_CUTOFF)
+
+
+def build_match(query, target="items", fuzzy=True):
+    """
+    Turn free text into an FTS5 MATCH expression: every word must match
+    (as a prefix), either as typed, via a transliteration, or - for words
+    the index has never seen - via close spellings from the vocabulary.
+    Returns: MATCH string, or None when the query has no searchable words
+    """
+    _, vocab = _TARGETS[target]
+    clauses = []
+    for token in re.findall(r"\w+", query.lower()):
+        alternatives = {token} | _SYNONYMS.get(token, set())
+
+        if fuzzy and len(token) >= 4:
+            terms = _terms(vocab)
+            if not _term_range(terms, token, token + "\uffff"):
+                alternatives.update(_fuzzy_terms(token, terms))
+
+        clauses.append("(" + " OR ".join(f'"{alt}"*' for alt in sorted(alternatives)) + ")")
+    return " AND ".join(clauses) or None
+
+
+def matching_ids(query, target="items", fuzzy=True):
+    """
+    Returns: SELECT of matching bills.id / bill_items.id, for use in
+             Model.id.in_(...), or None when the query has no searchable words
+    """
+    fts, _ = _TARGETS[target]
+    expression = build_match(query, target, fuzzy)
+    if expression is None:
+        return None
+    fts_table = table(fts, column("rowid"))
+    return select(fts_table.c.rowid).where(literal_column(fts).op("MATCH")(expression))
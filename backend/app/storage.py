@@ -0,0 +1,100 @@
+import os
+import json
+import hashlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+# Bytes read from the request body per iteration
+CHUNK_SIZE = 64 * 1024
+
+# fsync happens off the request thread so the client gets its 202 right away
+_fsync_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="upload-fsync")
+
+
+def content_path(content_hash, ext=""):
+    """Sharded relative path for a blob, e.g. 'ab/cd/abcd...ef.jpg'."""
+    return os.path.join(content_hash[:2], content_hash[2:4], content_hash + ext)
+
+
+def _fsync(path):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    except OSError as e:
+        print(f"fsync failed for {path}: {e}")
+
+
+def stream_to_store(stream, upload_root, original_name="", chunk_size=CHUNK_SIZE, max_bytes=None):
+    """
+    Copy a file-like stream to a content-addressed location under upload_root.
+    Only one chunk is ever held in memory; the SHA-256 is computed on the fly.
+    Returns: (content_hash, relative_path, size_in_bytes); relative_path is
+             None when the stream was empty and nothing was stored.
+    """
+    ext = os.path.splitext(original_name)[1].lower()
+    os.makedirs(upload_root, exist_ok=True)
+    hasher = hashlib.sha256()
+    size = 0
+
+    fd, tmp_path = tempfile.mkstemp(dir=upload_root, prefix=".incoming-")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_bytes is not None and size > max_bytes:
+                    raise ValueError(f"Upload exceeds {max_bytes} bytes")
+                hasher.update(chunk)
+                out.write(chunk)
+
+        content_hash = hasher.hexdigest()
+        if size == 0:
+            os.remove(tmp_path)
+            return content_hash, None, 0
+
+        rel_path = content_path(content_hash, ext)
+        final_path = os.path.join(upload_root, rel_path)
+
+        if os.path.exists(final_path):
+            # Same bytes already stored - nothing to keep
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.replace(tmp_path, final_path)
+            _fsync_pool.submit(_fsync, final_path)
+
+        return content_hash, rel_path, size
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def sidecar_path(path):
+    """Parsed-JSON sidecar of a stored upload: 'ab/cd/<hash>.jpg' -> 'ab/cd/<hash>.json'."""
+    return os.path.splitext(path)[0] + ".json"
+
+
+def store_sidecar(upload_root, rel_path, data):
+    """
+    Write a parsed bill (dict) as the sidecar of the blob at rel_path, for the
+    local extractor. Written to a temp file and renamed, so a worker never
+    reads half of it. Returns: Relative path of the sidecar
+    """
+    rel_sidecar = sidecar_path(rel_path)
+    final_path = os.path.join(upload_root, rel_sidecar)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(final_path), prefix=".incoming-")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as out:
+            json.dump(data, out, ensure_ascii=False)
+        os.replace(tmp_path, final_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return rel_sidecar
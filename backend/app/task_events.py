@@ -0,0 +1,72 @@
+import json
+
+import redis
+from celery import states
+from celery.signals import task_prerun, task_postrun
+
+from app.celery_config import celery_app
+
+# Task state changes are published on Redis pub/sub (one channel per task)
+# by the workers, so clients can wait on /events/tasks instead of polling.
+CHANNEL_PREFIX = "billwise:task:"
+
+_client = None
+
+
+def get_redis():
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(celery_app.conf.broker_url)
+    return _client
+
+
+def channel(task_id):
+    return CHANNEL_PREFIX + task_id
+
+
+def task_status(task_id, state, result=None):
+    """Same shape /result/<task_id> returns, plus the id."""
+    if state == states.PENDING:
+        return {"task_id": task_id, "status": "Pending"}
+    if state == states.SUCCESS:
+        return {"task_id": task_id, "status": "Completed", "result": result}
+    status = {"task_id": task_id, "status": state}
+    if state in states.EXCEPTION_STATES and result is not None:
+        status["error"] = str(result)
+    return status
+
+
+def fetch_statuses(task_ids):
+    """
+    Current status of many tasks in one round-trip to the result backend
+    (MGET on the Redis backend keys).
+    """
+    backend = celery_app.backend
+    values = backend.mget([backend.get_key_for_task(task_id) for task_id in task_ids])
+
+    statuses = []
+    for task_id, value in zip(task_ids, values):
+        if value is None:
+            statuses.append(task_status(task_id, states.PENDING))
+        else:
+            meta = backend.decode_result(value)
+            statuses.append(task_status(task_id, meta["status"], meta.get("result")))
+    return statuses
+
+
+def publish(task_id, state, result=None):
+    try:
+        message = json.dumps(task_status(task_id, state, result), default=str)
+        get_redis().publish(channel(task_id), message)
+    except redis.RedisError as e:
+        print(f"Could not publish state of task {task_id}: {e}")
+
+
+@task_prerun.connect
+def _on_task_start(task_id=None, **kwargs):
+    publish(task_id, states.STARTED)
+
+
+@task_postrun.connect
+def _on_task_done(task_id=None, retval=None, state=None, **kwargs):
+    publish(task_id, state, retval)
@@ -1,67 +1,201 @@
 import os
+from collections import defaultdict
 from flask import current_app
 from .models import db, Bill, BillItem, UserInsight
-from .textract_utils import read_parsed_json
+from .extraction import extract_bill, extract_bills
 from app.celery_config import celery_app
-from app.insights import get_category_insight_from_llm
+from app.insights import get_category_insights_for_bills
+from app.ingest import validate_bill, bulk_insert_bills
+from app.dimensions import attach_ids
+from sqlalchemy.exc import IntegrityError
+from app.dedup import file_fingerprint, task_fingerprint, lookup, claim
+from app import rollups
 
+# Bills per categorization task when a batch is ingested
+INSIGHTS_BATCH_SIZE = 50
+INSIGHTS_RATE_LIMIT = "60/m"
 
-@celery_app.task(name="app.tasks.parse_json_async")
-def parse_json_async(filename):
-    # Load from static sample file for now
-    json_path = os.path.join(current_app.root_path, "..", "data", "sample_bill_1.json")
-    json_path = os.path.abspath(json_path)
 
-    if not os.path.exists(json_path):
-        raise FileNotFoundError(f"Sample JSON file not found: {json_path}")
+def load_bill_data(filename):
+    """Run the uploaded receipt (path under UPLOAD_FOLDER) through extraction."""
+    return extract_bill(upload_path(filename))
 
-    # Read parsed JSON
-    data = read_parsed_json(json_path)
+
+def upload_path(filename):
+    return os.path.join(current_app.config["UPLOAD_FOLDER"], filename)
+
+
+@celery_app.task(bind=True, name="app.tasks.parse_json_async")
+def parse_json_async(self, filename, content_hash=None):
+    # Same upload (or, without a hash, this same message redelivered) already
+    # processed? Reuse it.
+    fingerprint = file_fingerprint(content_hash) if content_hash else task_fingerprint(self.request.id)
+    existing = lookup(fingerprint)
+    if existing:
+        return existing
+
+    data = load_bill_data(filename)
+    bill_row, item_rows = validate_bill(data, filename=filename)
+    attach_ids([(bill_row, item_rows)])
 
     # Save main bill
-    bill = Bill(
-        vendor=data.get("vendor"),
-        total=data.get("total"),
-        tax=data.get("tax"),
-        currency=data.get("currency")
-    )
+    bill = Bill(**bill_row)
     db.session.add(bill)
     db.session.flush()
 
     # Save items
-    bill_items = []
-    for item in data.get("items", []):
-        bill_item = BillItem(
-            name=item["name"],
-            price=item["price"],
-            bill_id=bill.id
-        )
-        db.session.add(bill_item)
-        bill_items.append({"name": item["name"], "price": item["price"]})
+    db.session.add_all([BillItem(bill_id=bill.id, **row) for row in item_rows])
+    rollups.add_bill(bill_row, [row["item_id"] for row in item_rows])
 
-    db.session.commit()
-
-    # 🔍 Call LLM to get categorization insight
-    category_insight = get_category_insight_from_llm(bill_items)
-    print("LLM response:", category_insight)
-
-    if category_insight:
-        # Save insight with fixed user_id=1 for now
-        db.session.add(UserInsight(
-            user_id=1,
-            bill_id=bill.id,
-            insight_text=category_insight,
-            insight_type="category_summary"
-        ))
+    # The fingerprint commits with the bill: a racing or redelivered copy
+    # hits its primary key and rolls back its whole bill
+    claim(fingerprint, bill.id, self.request.id)
+    try:
         db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        existing = lookup(fingerprint)
+        if existing:
+            return existing
+        raise
+
+    # 🔍 Categorization runs on the insights queue so the bill is done now
+    insight_task = generate_category_insights_async.delay([bill.id])
+    generate_user_analytics_async.delay([bill.user_id])
 
     return {
         "message": "Bill saved",
         "bill_id": bill.id,
-        "category_insight": category_insight
+        "category_insight": None,
+        "insight_task_id": insight_task.id
     }
 
 
+@celery_app.task(name="app.tasks.generate_category_insights_async", rate_limit=INSIGHTS_RATE_LIMIT)
+def generate_category_insights_async(bill_ids):
+    """
+    Fill in category_summary insights for saved bills. Items of all bills
+    share one categorization pass, so batches cost about as much as one bill.
+    """
+    bills = Bill.query.filter(Bill.id.in_(bill_ids)).all()
+    items_by_bill = defaultdict(list)
+    for item in BillItem.query.filter(BillItem.bill_id.in_(bill_ids)):
+        items_by_bill[item.bill_id].append({"name": item.name, "price": item.price})
+
+    bills = [bill for bill in bills if items_by_bill[bill.id]]
+    category_insights = get_category_insights_for_bills([items_by_bill[bill.id] for bill in bills])
+
+    # Idempotent: a redelivered task replaces the summaries instead of duplicating them
+    UserInsight.query.filter(
+        UserInsight.bill_id.in_([bill.id for bill in bills]),
+        UserInsight.insight_type == "category_summary"
+    ).delete(synchronize_session=False)
+
+    saved = 0
+    for bill, category_insight in zip(bills, category_insights):
+        if category_insight:
+            db.session.add(UserInsight(
+                user_id=bill.user_id,
+                bill_id=bill.id,
+                insight_text=category_insight,
+                insight_type="category_summary"
+            ))
+            saved += 1
+    db.session.commit()
+    print(f"Saved {saved} category insights for {len(bill_ids)} bills")
+
+    return {
+        "message": "Insights saved",
+        "bill_ids": [bill.id for bill in bills],
+        "saved": saved
+    }
+
+
+# Re-running a half-saved batch would insert its bills twice, so ack on receipt
+@celery_app.task(name="app.tasks.ingest_batch_async", acks_late=False)
+def ingest_batch_async(entries, user_id=1):
+    """
+    entries: List of dicts, each either {'index': i, 'bill': {...}} with an
+             already-validated parsed bill, or {'index': i, 'filename': ...}
+             for an uploaded receipt that still needs parsing.
+    Returns: Per-bill outcomes keyed by the original request index
+    """
+    # Uploaded receipts are extracted together so their pages share the pool
+    to_extract = [entry for entry in entries if entry.get("bill") is None]
+    extracted = extract_bills([upload_path(entry["filename"]) for entry in to_extract]) if to_extract else []
+    extracted = {entry["index"]: data for entry, data in zip(to_extract, extracted)}
+
+    parsed, indexes, results = [], [], []
+    for entry in entries:
+        try:
+            data = entry.get("bill")
+            if data is None:
+                data = extracted[entry["index"]]
+                if isinstance(data, Exception):
+                    raise data
+            parsed.append(validate_bill(data, user_id=user_id, filename=entry.get("filename")))
+            indexes.append(entry["index"])
+        except Exception as e:
+            results.append({"index": entry["index"], "status": "failed", "error": str(e)})
+
+    saved_users = set()
+    for index, (bill_row, _), outcome in zip(indexes, parsed, bulk_insert_bills(parsed)):
+        results.append(dict(outcome, index=index))
+        if outcome["status"] == "saved":
+            saved_users.add(bill_row["user_id"])
+
+    # Categorize in chunks on the insights queue; the batch result doesn't wait
+    saved_ids = [r["bill_id"] for r in results if r["status"] == "saved"]
+    for start in range(0, len(saved_ids), INSIGHTS_BATCH_SIZE):
+        generate_category_insights_async.delay(saved_ids[start:start + INSIGHTS_BATCH_SIZE])
+    if saved_users:
+        generate_user_analytics_async.delay(sorted(saved_users))
+
+    results.sort(key=lambda r: r["index"])
+    saved = sum(1 for r in results if r["status"] == "saved")
+    print(f"Batch saved {saved}/{len(entries)} bills")
+
+    return {
+        "message": "Batch processed",
+        "saved": saved,
+        "failed": len(results) - saved,
+        "bills": results
+    }
+
+
+@celery_app.task(name="app.tasks.generate_user_analytics_async")
+def generate_user_analytics_async(user_ids):
+    """Refresh spend trend / anomaly / recurring / forecast insights for these users."""
+    from app import analytics  # NumPy is only loaded by workers that run this
+    written = analytics.run(user_ids)
+    print(f"Saved {written} analytics insights for {len(set(user_ids))} users")
+    return {"message": "Analytics saved", "user_ids": sorted(set(user_ids)), "saved": written}
+
+
+@celery_app.task(name="app.tasks.schedule_digests_async")
+def schedule_digests_async(kinds=None):
+    """
+    Beat entry point: queue a task for every (digest kind, period, user shard)
+    with dirty users. Shards without changed bills get no task at all.
+    """
+    from app import digests
+    shards = digests.DIGEST_SHARDS
+    queued = digests.pending(shards, kinds)
+    for kind, period, shard in queued:
+        generate_digest_shard_async.delay(kind, period, shard, shards)
+    return {"message": "Digests queued", "shards": len(queued)}
+
+
+@celery_app.task(name="app.tasks.generate_digest_shard_async")
+def generate_digest_shard_async(kind, period, shard, shards):
+    """Refresh one user shard's dirty digests for a period (no-op if none are left)."""
+    from app import digests
+    result = digests.run_shard(kind, period, shard, shards)
+    if result["users"]:
+        print(f"Saved {result['saved']} {kind} insights for {period}, shard {shard}/{shards}")
+    return result
+
+
 def generate_per_bill_insight(user_id, bill_id, vendor, total):
     try:
         total = float(total)
@@ -1,9 +1,88 @@
 import json
 import os
+import re
+from datetime import datetime
 from flask import current_app
 
 def read_parsed_json(filename):
     file_path = os.path.join(current_app.config["PARSED_JSON_FOLDER"], filename)
-    print(f"[DEBUG] Reading file from: {file_path}")  # 👈 Add this
     with open(file_path, "r", encoding="utf-8") as f:
         return json.load(f)
+
+
+# --- AnalyzeExpense response -> bill dict (same shape as the parsed JSON) ---
+
+_AMOUNT_RE = re.compile(r"-?\d+(?:\.\d+)?")
+_DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%d/%m/%y", "%d-%m-%y",
+                 "%d %b %Y", "%d-%b-%Y", "%d %B %Y", "%b %d, %Y", "%d-%b-%y")
+
+
+def parse_amount(text):
+    """'₹1,234.50' / 'Rs. 48' / '48.00 INR' -> 1234.5 / 48.0 / 48.0 (None if no number)."""
+    if not text:
+        return None
+    match = _AMOUNT_RE.search(text.replace(",", ""))
+    return float(match.group()) if match else None
+
+
+def parse_date(text):
+    """Receipt date in any common layout -> 'YYYY-MM-DD' (None if unreadable)."""
+    if not text:
+        return None
+    text = text.strip()
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
+
+def _field_type(field):
+    return (field.get("Type") or {}).get("Text")
+
+
+def _field_value(field):
+    return ((field.get("ValueDetection") or {}).get("Text") or "").strip()
+
+
+def parse_expense_document(document):
+    """
+    document: One entry of AnalyzeExpense's ExpenseDocuments
+    Returns: {'vendor', 'items': [{'name', 'price', 'quantity'}], 'tax', 'total', 'date'}
+    """
+    summary = {}
+    for field in document.get("SummaryFields", []):
+        kind, value = _field_type(field), _field_value(field)
+        # First detection of each type wins; Textract lists the most likely first
+        if kind and value and kind not in summary:
+            summary[kind] = value
+
+    items = []
+    for group in document.get("LineItemGroups", []):
+        for line in group.get("LineItems", []):
+            fields = {}
+            for field in line.get("LineItemExpenseFields", []):
+                kind, value = _field_type(field), _field_value(field)
+                if kind and value:
+                    fields.setdefault(kind, value)
+            if not fields.get("ITEM"):
+                continue
+            quantity = parse_amount(fields.get("QUANTITY"))
+            price = parse_amount(fields.get("PRICE"))
+            unit_price = parse_amount(fields.get("UNIT_PRICE"))
+            if price is None and unit_price is not None:
+                price = unit_price * (quantity or 1)
+            items.append({
+                "name": fields["ITEM"],
+                "price": price or 0.0,
+                "quantity": int(quantity) if quantity else None,
+            })
+
+    return {
+        "vendor": summary.get("VENDOR_NAME") or summary.get("NAME"),
+        "items": items,
+        "tax": parse_amount(summary.get("TAX")),
+        "total": parse_amount(summary.get("TOTAL") or summary.get("AMOUNT_PAID")),
+        "date": parse_date(summary.get("INVOICE_RECEIPT_DATE")),
+    }
@@ -0,0 +1,111 @@
+# bench_import_time.py
+# Startup cost of each entry point, measured in fresh interpreters.
+# Exits 1 when an entry point goes over its budget or imports a module it
+# shouldn't (e.g. a maintenance script pulling in Celery), so CI can run:
+#   python bench_import_time.py
+#   python bench_import_time.py --runs 10 --top 15   # show the slowest imports
+# IMPORT_BUDGET_SCALE=2 doubles every budget on slow machines.
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# name: (code, budget in ms, modules that must not be imported)
+ENTRY_POINTS = {
+    "models": (
+        "import app.models",
+        600, ["flask_cors", "celery", "redis", "requests", "app.routes"],
+    ),
+    "maintenance": (
+        "from app import create_app; create_app(with_routes=False)",
+        800, ["flask_cors", "celery", "requests", "app.routes", "app.tasks"],
+    ),
+    "worker": (
+        "import celery_worker",
+        1200, ["flask_cors", "app.routes", "PIL", "pypdfium2", "boto3", "pyarrow"],
+    ),
+    "web": (
+        "from app import create_app; create_app()",
+        1200, ["app.tasks", "requests", "PIL", "pypdfium2", "boto3", "pyarrow"],
+    ),
+}
+
+PROBE = """
+import sys, time, json
+start = time.perf_counter()
+{code}
+elapsed = (time.perf_counter() - start) * 1000
+print(json.dumps({{"ms": elapsed, "modules": sorted(sys.modules)}}))
+"""
+
+
+def run_once(code):
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE.format(code=code)],
+        cwd=HERE, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(code, top):
+    """Slowest imports (cumulative, at any depth) from python -X importtime."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=HERE, capture_output=True, text=True, check=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = [part.strip() for part in line[len("import time:"):].split("|")]
+        if cumulative.isdigit():
+            rows.append((int(cumulative), name))
+    rows.sort(reverse=True)
+    seen, slowest = set(), []
+    for cumulative, name in rows:
+        if name not in seen:
+            seen.add(name)
+            slowest.append((cumulative, name))
+    return slowest[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time benchmark for BillWise entry points")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per entry point (median is used)")
+    parser.add_argument("--top", type=int, default=0, help="Also list the N slowest imports per entry point")
+    parser.add_argument("entry_points", nargs="*",
+                        help=f"Entry points to check: {', '.join(ENTRY_POINTS)} (default: all)")
+    args = parser.parse_args()
+    unknown = [name for name in args.entry_points if name not in ENTRY_POINTS]
+    if unknown:
+        parser.error(f"unknown entry point(s): {', '.join(unknown)}")
+
+    scale = float(os.getenv("IMPORT_BUDGET_SCALE", "1"))
+    failed = False
+
+    for name in args.entry_points or ENTRY_POINTS:
+        code, budget, forbidden = ENTRY_POINTS[name]
+        budget *= scale
+        run_once(code)  # warm the bytecode cache
+        samples = [run_once(code) for _ in range(args.runs)]
+        median = statistics.median(s["ms"] for s in samples)
+        leaked = [m for m in forbidden if m in samples[0]["modules"]]
+
+        ok = median <= budget and not leaked
+        failed |= not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {name:<12} {median:7.1f} ms (budget {budget:.0f} ms)"
+              + (f"  imports {', '.join(leaked)}" if leaked else ""))
+
+        if args.top or not ok:
+            for cumulative, module in slowest_imports(code, args.top or 10):
+                print(f"       {cumulative / 1000:7.1f} ms  {module}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,19 @@
+import os
+from celery.signals import worker_process_init
 from app import create_app
 from app.celery_config import celery_app  # ✅ no circular import
+from app.models import db
 
-flask_app = create_app()
-celery_app.conf.update(flask_app.config)
+# Each prefork child opens its own small pool (server databases only)
+os.environ.setdefault("DB_POOL_SIZE", "2")
+os.environ.setdefault("DB_MAX_OVERFLOW", "2")
+
+flask_app = create_app(with_routes=False)
 
 # Import task modules *after* app context is ready
 from app.tasks import parse_json_async
+from app import task_events  # publishes task state changes for /events/tasks
+from app import metrics  # queue wait / run / LLM / SQL timings per task, read by /metrics
 
 # Task context binding
 class ContextTask(celery_app.Task):
@@ -14,3 +22,10 @@ class ContextTask(celery_app.Task):
             return self.run(*args, **kwargs)
 
 celery_app.Task = ContextTask
+
+# Connections inherited from the parent must not be shared across a fork:
+# drop them (without closing the parent's sockets) so each child reconnects.
+@worker_process_init.connect
+def _reset_db_pool(**kwargs):
+    with flask_app.app_context():
+        db.engine.dispose(close=False)
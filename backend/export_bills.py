@@ -0,0 +1,37 @@
+# export_bills.py
+# Stream bills + items to a file without loading them into memory.
+#   python export_bills.py --format csv --user-id 1 --start 2024-01-01 --out bills.csv
+#   python export_bills.py --format parquet --out bills.parquet   (needs pyarrow)
+import sys
+import argparse
+from datetime import date
+from app import create_app
+from app.export import export_rows, iter_csv, iter_ndjson, write_parquet
+
+parser = argparse.ArgumentParser(description="Export bills joined with their items")
+parser.add_argument("--format", choices=["csv", "ndjson", "parquet"], default="csv")
+parser.add_argument("--user-id", type=int)
+parser.add_argument("--start", type=date.fromisoformat, help="YYYY-MM-DD (inclusive)")
+parser.add_argument("--end", type=date.fromisoformat, help="YYYY-MM-DD (inclusive)")
+parser.add_argument("--out", help="Output file (default: stdout, not for parquet)")
+args = parser.parse_args()
+
+app = create_app(with_routes=False)
+with app.app_context():
+    rows = export_rows(user_id=args.user_id, start=args.start, end=args.end)
+
+    if args.format == "parquet":
+        if not args.out:
+            parser.error("--out is required for parquet")
+        count = write_parquet(rows, args.out)
+        print(f"✅ Wrote {count} rows to {args.out}", file=sys.stderr)
+    else:
+        chunks = iter_csv(rows) if args.format == "csv" else iter_ndjson(rows)
+        out = open(args.out, "w", encoding="utf-8", newline="") if args.out else sys.stdout
+        try:
+            for chunk in chunks:
+                out.write(chunk)
+        finally:
+            if args.out:
+                out.close()
+                print(f"✅ Export written to {args.out}", file=sys.stderr)
@@ -3,7 +3,7 @@ from datetime import datetime, timedelta
 from app import create_app
 from app.models import db, Bill, BillItem, UserInsight
 
-app = create_app()
+app = create_app(with_routes=False)
 
 VENDORS = ['D-Mart', 'Big Bazaar', 'Reliance Fresh', 'Spencer’s', 'Nature’s Basket', 'KFC', 'McDonald’s']
 ITEMS = ['Rice', 'Milk', 'Apples', 'Toothpaste', 'Soap', 'Chips', 'Oil', 'Chicken', 'Paneer']
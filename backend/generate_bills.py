@@ -0,0 +1,215 @@
+# generate_bills.py
+# Synthetic bills at production volume, e.g.
+#   python generate_bills.py --users 5000 --bills 2000000 --workers 8
+#   python generate_bills.py --users 1 --bills 100            # old generate_100_test_bills.py
+# Vendors and items follow a Zipf distribution (a few shops and staples
+# dominate), dates lean towards weekends, and every item has a stable base
+# price. Rows are generated in parallel chunks with pre-assigned bill ids and
+# written with one multi-row INSERT per table per chunk; vendor/item ids are
+# filled in per distinct name and rollups rebuilt once at the end.
+import os
+import sys
+import time
+import random
+import argparse
+import itertools
+from datetime import date, timedelta
+from multiprocessing import Pool
+
+from sqlalchemy import insert
+
+from app import create_app
+from app.models import db, Bill, BillItem
+from app import rollups, dimensions
+
+BASE_VENDORS = ["D-Mart", "Big Bazaar", "Reliance Fresh", "Spencer's", "Nature's Basket", "More Supermarket",
+                "Star Bazaar", "Mohan's Vegetables", "KFC", "McDonald's", "Domino's", "Apollo Pharmacy",
+                "MedPlus", "Croma", "Shell", "Indian Oil"]
+VENDOR_WORDS = (["Sri", "New", "Royal", "City", "Fresh", "Green", "Lakshmi", "Balaji", "Ganesh", "Metro"],
+                ["Stores", "Mart", "Supermarket", "Traders", "Kirana", "Bakery", "Medicals", "Restaurant", "Fuels"])
+BASE_ITEMS = ["Milk", "Bread", "Eggs", "Rice", "Atta", "Sugar", "Salt", "Tea", "Coffee", "Oil", "Ghee", "Paneer",
+              "Curd", "Butter", "Tomato", "Onion", "Potato", "Apples", "Bananas", "Dal", "Chicken", "Chips",
+              "Biscuits", "Soap", "Shampoo", "Toothpaste", "Detergent", "Paracetamol", "Petrol", "Burger"]
+ITEM_BRANDS = ["", "Amul ", "Tata ", "Fortune ", "Aashirvaad ", "Britannia ", "Mother Dairy ", "Patanjali ", "Organic "]
+ITEM_SIZES = ["", " 500g", " 1kg", " 1L", " 500ml", " 200g", " 5kg", " Pack of 6"]
+
+TAX_RATE = 0.05
+ITEMS_PER_BILL = list(range(1, 16))
+ITEMS_PER_BILL_WEIGHTS = [4, 8, 10, 11, 10, 9, 8, 7, 6, 5, 4, 3, 2, 2, 1]
+
+_args = None
+_vendors = _items = _vendor_weights = _item_weights = _item_prices = _user_weights = None
+_worker_app = None
+
+
+def zipf_cum_weights(n, s):
+    """Cumulative weights for random.choices: rank k has weight 1/k**s."""
+    return list(itertools.accumulate(1 / (k ** s) for k in range(1, n + 1)))
+
+
+def make_catalogue(count, base, combos, seed):
+    """Base names first (the most popular ranks), then generated combinations."""
+    rng = random.Random(seed)
+    names = list(dict.fromkeys(base))
+    generated = [("".join(parts)).strip() for parts in itertools.product(*combos)]
+    rng.shuffle(generated)
+    for name in generated:
+        if len(names) >= count:
+            break
+        if name not in names:
+            names.append(name)
+    while len(names) < count:
+        names.append(f"{rng.choice(base)} #{len(names)}")
+    return names[:count]
+
+
+def _init_worker(args):
+    """Build the catalogues once per process (same seed -> same catalogue everywhere)."""
+    global _args, _vendors, _items, _vendor_weights, _item_weights, _item_prices, _user_weights
+    _args = args
+    _vendors = make_catalogue(args.vendors, BASE_VENDORS, VENDOR_WORDS, args.seed)
+    _items = make_catalogue(args.items, BASE_ITEMS, (ITEM_BRANDS, BASE_ITEMS, ITEM_SIZES), args.seed + 1)
+    _vendor_weights = zipf_cum_weights(len(_vendors), args.zipf)
+    _item_weights = zipf_cum_weights(len(_items), args.zipf)
+    rng = random.Random(args.seed + 2)
+    _item_prices = [round(rng.lognormvariate(4.2, 0.9), 2) for _ in _items]   # median ~₹67
+    # Some users shop a lot more than others
+    _user_weights = list(itertools.accumulate(rng.lognormvariate(0, 1) for _ in range(args.users)))
+
+
+def _random_date(rng, today, days):
+    while True:
+        day = today - timedelta(days=rng.randrange(days))
+        if day.weekday() >= 5 or rng.random() < 0.7:   # weekends ~1.4x busier
+            return day
+
+
+def generate_chunk(task):
+    """
+    task: (first_bill_id, count, seed)
+    Returns: (bill_rows, item_rows) with bill ids first_bill_id.. assigned here
+    """
+    first_id, count, seed = task
+    rng = random.Random(seed)
+    today = date.today()
+    user_ids = rng.choices(range(1, _args.users + 1), cum_weights=_user_weights, k=count)
+    vendors = rng.choices(_vendors, cum_weights=_vendor_weights, k=count)
+    sizes = rng.choices(ITEMS_PER_BILL, weights=ITEMS_PER_BILL_WEIGHTS, k=count)
+    picks = rng.choices(range(len(_items)), cum_weights=_item_weights, k=sum(sizes))
+
+    bills, items, p = [], [], 0
+    for i in range(count):
+        bill_id = first_id + i
+        subtotal = 0.0
+        for index in picks[p:p + sizes[i]]:
+            quantity = rng.choices((1, 2, 3, 4), weights=(70, 18, 8, 4))[0]
+            price = round(_item_prices[index] * rng.uniform(0.85, 1.15) * quantity, 2)
+            subtotal += price
+            items.append({"bill_id": bill_id, "name": _items[index], "quantity": quantity, "price": price})
+        p += sizes[i]
+        tax = round(subtotal * TAX_RATE, 2)
+        bills.append({
+            "id": bill_id,
+            "user_id": user_ids[i],
+            "vendor": vendors[i],
+            "date": _random_date(rng, today, _args.days),
+            "tax": tax,
+            "total": round(subtotal + tax, 2),
+            "filename": f"synthetic_{bill_id}.json",
+        })
+    return bills, items
+
+
+def write_chunk(bills, items):
+    with db.engine.begin() as conn:
+        conn.execute(insert(Bill.__table__), bills)
+        conn.execute(insert(BillItem.__table__), items)
+
+
+def _generate_and_write(task):
+    """Worker entry point for databases that take parallel writers (PostgreSQL)."""
+    bills, items = generate_chunk(task)
+    with _worker_app.app_context():
+        write_chunk(bills, items)
+    return len(bills), len(items)
+
+
+def _init_writer(args):
+    global _worker_app
+    _init_worker(args)
+    _worker_app = create_app(with_routes=False)
+    with _worker_app.app_context():
+        db.engine.dispose(close=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic bills for load testing")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--bills", type=int, default=10000, help="Total bills across all users")
+    parser.add_argument("--vendors", type=int, default=500, help="Distinct vendors")
+    parser.add_argument("--items", type=int, default=3000, help="Distinct item names")
+    parser.add_argument("--days", type=int, default=730, help="Spread bill dates over this many past days")
+    parser.add_argument("--zipf", type=float, default=1.1, help="Zipf exponent for vendor/item popularity")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="Bills per INSERT batch")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--skip-rollups", action="store_true", help="Don't rebuild rollups (or mark digests dirty) afterwards")
+    args = parser.parse_args()
+
+    app = create_app(with_routes=False)
+    with app.app_context():
+        db.create_all()
+        first_id = (db.session.scalar(db.select(db.func.max(Bill.id))) or 0) + 1
+        parallel_writes = db.engine.dialect.name != "sqlite"
+        dialect = db.engine.dialect.name
+        db.engine.dispose()   # don't hand open connections to forked workers
+
+    tasks = [(first_id + start, min(args.chunk_size, args.bills - start), args.seed * 1000003 + start)
+             for start in range(0, args.bills, args.chunk_size)]
+    print(f"Generating {args.bills} bills for {args.users} users in {len(tasks)} chunks "
+          f"({args.workers} workers, {dialect})...")
+
+    started = time.perf_counter()
+    bills_done = items_done = 0
+    with app.app_context():
+        if parallel_writes:
+            # Every worker inserts its own chunks on its own connection
+            with Pool(args.workers, initializer=_init_writer, initargs=(args,)) as pool:
+                for n_bills, n_items in pool.imap_unordered(_generate_and_write, tasks):
+                    bills_done += n_bills
+                    items_done += n_items
+                    print(f"  {bills_done}/{args.bills} bills", end="\r")
+            db.session.execute(db.text(
+                "SELECT setval(pg_get_serial_sequence('bills', 'id'), (SELECT MAX(id) FROM bills))"))
+            db.session.commit()
+        else:
+            # SQLite has one writer: workers generate, this process inserts as chunks arrive
+            with Pool(args.workers, initializer=_init_worker, initargs=(args,)) as pool:
+                for bills, items in pool.imap_unordered(generate_chunk, tasks):
+                    write_chunk(bills, items)
+                    bills_done += len(bills)
+                    items_done += len(items)
+                    print(f"  {bills_done}/{args.bills} bills", end="\r")
+
+        elapsed = time.perf_counter() - started
+        print()
+        print(f"Inserted {bills_done} bills / {items_done} items in {elapsed:.1f}s "
+              f"({bills_done / max(elapsed, 1e-9):.0f} bills/s)")
+
+        started = time.perf_counter()
+        bills_linked, items_linked = dimensions.backfill()
+        print(f"Linked {bills_linked} bills / {items_linked} items to vendor/item ids "
+              f"in {time.perf_counter() - started:.1f}s")
+
+        if not args.skip_rollups:
+            started = time.perf_counter()
+            rollups.rebuild()
+            print(f"Rebuilt rollups in {time.perf_counter() - started:.1f}s")
+        db.session.execute(db.text("ANALYZE"))
+        db.session.commit()
+
+    print("✅ Done.")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
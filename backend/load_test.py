@@ -0,0 +1,201 @@
+# load_test.py
+# Replays a weighted mix of API requests against a running app and reports
+# latency percentiles and throughput per endpoint, e.g.
+#   python run.py &                       (or the production server)
+#   python generate_bills.py --users 1000 --bills 500000
+#   python load_test.py --concurrency 32 --duration 60
+#   python load_test.py --mix bills=5,insights=5 --requests 2000
+# Uploads send a real receipt with random trailing bytes so every request is
+# new work rather than a dedup hit. Each carries the parsed JSON from
+# --parsed for the local extractor (pass --parsed "" with Textract). The
+# server stores them by content hash like any upload, as
+# <upload folder>/ab/cd/<sha256>.jpg plus a <sha256>.json sidecar. Every run
+# adds new files there, and nothing marks them as load-test data.
+import os
+import sys
+import time
+import random
+import argparse
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_RECEIPT = os.path.join(HERE, "data", "uploads", "Image1.jpg")
+DEFAULT_PARSED = os.path.join(HERE, "data", "parsed_json", "sample_output.json")
+DEFAULT_MIX = "upload=1,bills=4,bill=3,insights=3"
+USER_INSIGHTS = ["top-vendors", "monthly-spend", "frequent-items"]
+
+_local = threading.local()
+
+
+def session():
+    if not hasattr(_local, "session"):
+        _local.session = requests.Session()
+    return _local.session
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+class LoadTest:
+    def __init__(self, base_url, users, bill_ids, receipt, timeout, parsed=None):
+        self.base_url = base_url.rstrip("/")
+        self.users = users
+        self.bill_ids = bill_ids
+        self.receipt = receipt
+        self.parsed = parsed
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    # --- request kinds: each returns (label, method, path, kwargs) ---
+    def upload(self, rng):
+        body = self.receipt + rng.randbytes(16)
+        files = {"file": (f"load_{rng.getrandbits(48):x}.jpg", body, "image/jpeg")}
+        if self.parsed is not None:
+            files["parsed"] = ("parsed.json", self.parsed, "application/json")
+        return "POST /upload", "POST", "/upload", {"files": files}
+
+    def bills(self, rng):
+        params = {"user_id": rng.choice(self.users), "per_page": 20}
+        if rng.random() < 0.5:
+            params["cursor"] = ""
+        else:
+            params["page"] = rng.randint(1, 5)
+        return "GET /bills", "GET", "/bills", {"params": params}
+
+    def bill(self, rng):
+        return "GET /bills/<id>", "GET", f"/bills/{rng.choice(self.bill_ids)}", {}
+
+    def insights(self, rng):
+        user_id = rng.choice(self.users)
+        if rng.random() < 0.25:
+            return "GET /insights/<user>", "GET", f"/insights/{user_id}", {"params": {"limit": 50}}
+        kind = rng.choice(USER_INSIGHTS)
+        return f"GET /insights/<user>/{kind}", "GET", f"/insights/{user_id}/{kind}", {}
+
+    def send(self, kind, rng):
+        label, method, path, kwargs = getattr(self, kind)(rng)
+        started = time.perf_counter()
+        try:
+            response = session().request(method, self.base_url + path, timeout=self.timeout, **kwargs)
+            ok = response.status_code < 400
+            response.content   # include the body transfer in the timing
+        except requests.RequestException:
+            ok = False
+        elapsed = (time.perf_counter() - started) * 1000
+        with self.lock:
+            self.latencies[label].append(elapsed)
+            if not ok:
+                self.errors[label] += 1
+
+    def report(self, wall_seconds):
+        print(f"\n{'endpoint':<38}{'count':>7}{'errors':>8}{'req/s':>9}"
+              f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+        total = 0
+        everything = []
+        for label in sorted(self.latencies):
+            values = sorted(self.latencies[label])
+            total += len(values)
+            everything.extend(values)
+            print(f"{label:<38}{len(values):>7}{self.errors[label]:>8}{len(values) / wall_seconds:>9.1f}"
+                  f"{percentile(values, 50):>9.1f}{percentile(values, 95):>9.1f}"
+                  f"{percentile(values, 99):>9.1f}{values[-1]:>9.1f}")
+        everything.sort()
+        print(f"{'all':<38}{total:>7}{sum(self.errors.values()):>8}{total / wall_seconds:>9.1f}"
+              f"{percentile(everything, 50):>9.1f}{percentile(everything, 95):>9.1f}"
+              f"{percentile(everything, 99):>9.1f}{(everything[-1] if everything else 0):>9.1f}")
+        return sum(self.errors.values())
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ("upload", "bills", "bill", "insights"):
+            raise argparse.ArgumentTypeError(f"unknown request kind '{name}'")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def discover(base_url, timeout, sample=500):
+    """Bill ids and user ids to aim at, taken from the app itself."""
+    response = requests.get(f"{base_url}/bills", params={"cursor": "", "per_page": 100}, timeout=timeout)
+    response.raise_for_status()
+    bills = response.json()["bills"]
+    next_cursor = response.json()["meta"]["next_cursor"]
+    while next_cursor and len(bills) < sample:
+        response = requests.get(f"{base_url}/bills", params={"cursor": next_cursor, "per_page": 100}, timeout=timeout)
+        response.raise_for_status()
+        bills.extend(response.json()["bills"])
+        next_cursor = response.json()["meta"]["next_cursor"]
+    return [b["id"] for b in bills], sorted({b["user_id"] for b in bills if b.get("user_id") is not None})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the BillWise API")
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--concurrency", type=int, default=16, help="Parallel clients")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to run (ignored with --requests)")
+    parser.add_argument("--requests", type=int, help="Stop after this many requests instead")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f"Weighted request kinds (default {DEFAULT_MIX})")
+    parser.add_argument("--receipt", default=DEFAULT_RECEIPT, help="File sent by upload requests")
+    parser.add_argument("--parsed", default=DEFAULT_PARSED,
+                        help="Parsed JSON sent with each upload for the local extractor ('' to send none)")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    base_url = args.url.rstrip("/")
+    bill_ids, users = discover(base_url, args.timeout)
+    if not bill_ids:
+        print("No bills found - run generate_bills.py first.")
+        return 1
+    with open(args.receipt, "rb") as f:
+        receipt = f.read()
+    parsed = None
+    if args.parsed:
+        with open(args.parsed, "rb") as f:
+            parsed = f.read()
+
+    test = LoadTest(base_url, users, bill_ids, receipt, args.timeout, parsed)
+    kinds, weights = zip(*args.mix.items())
+    print(f"{args.concurrency} clients against {base_url} ({len(users)} users, {len(bill_ids)} bills sampled), "
+          f"mix {dict(args.mix)}")
+
+    counter = iter(range(args.requests)) if args.requests else None
+    counter_lock = threading.Lock()
+    deadline = time.perf_counter() + args.duration
+
+    def client(n):
+        rng = random.Random(None if args.seed is None else args.seed + n)
+        while True:
+            if counter is not None:
+                with counter_lock:
+                    if next(counter, None) is None:
+                        return
+            elif time.perf_counter() >= deadline:
+                return
+            test.send(rng.choices(kinds, weights=weights)[0], rng)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(client, range(args.concurrency)))
+    errors = test.report(time.perf_counter() - started)
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
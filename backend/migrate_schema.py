@@ -0,0 +1,121 @@
+# migrate_schema.py
+# Brings an existing database up to the current models: creates missing
+# tables and indexes, and rebuilds SQLite tables that predate their foreign
+# keys (SQLite can't ALTER TABLE ADD CONSTRAINT). Safe to run repeatedly.
+# Orphaned rows (items/insights pointing at deleted bills) can't satisfy the
+# new foreign keys and are dropped; the counts are printed.
+# Bills/items predating the vendor/item dimensions get their id columns added
+# and filled in, and name-keyed rollup tables are recreated on those ids.
+# Other columns added since a table was created are added with ALTER TABLE.
+# Databases that have bills but have never had digests get every period
+# marked for the scheduled digest run.
+from sqlalchemy import inspect, text
+from app import create_app
+from app.models import db
+from app.search import ensure_search_index
+from app import dimensions, rollups, digests
+
+# table -> WHERE clause selecting rows that satisfy the new foreign keys
+FK_TABLES = {
+    "bill_items": "bill_id IN (SELECT id FROM bills)",
+    "user_insights": "bill_id IS NULL OR bill_id IN (SELECT id FROM bills)",
+    "bill_fingerprints": "bill_id IN (SELECT id FROM bills)",
+}
+
+# table -> (column, column DDL) added after the table was first created
+ADDED_COLUMNS = {
+    "bills": ("vendor_id", 'INTEGER REFERENCES "vendors" (id)'),
+    "bill_items": ("item_id", 'INTEGER REFERENCES "items" (id)'),
+    "user_insights": ("period", "VARCHAR(10)"),
+}
+# rollup table -> key column it must have; older ones keyed on names are recreated
+ROLLUP_KEYS = {
+    "user_vendor_spend": "vendor_id",
+    "user_item_counts": "item_id",
+}
+
+
+def needs_rebuild(inspector, table):
+    return inspector.has_table(table) and not inspector.get_foreign_keys(table)
+
+
+def missing_column(inspector, table, column):
+    return inspector.has_table(table) and column not in {c["name"] for c in inspector.get_columns(table)}
+
+
+def migrate():
+    engine = db.engine
+    inspector = inspect(engine)
+    is_sqlite = engine.dialect.name == "sqlite"
+    rebuild = [t for t in FK_TABLES if is_sqlite and needs_rebuild(inspector, t)]
+    add_columns = {t: col for t, col in ADDED_COLUMNS.items()
+                   if t not in rebuild and missing_column(inspector, t, col[0])}
+    stale_rollups = [t for t, key in ROLLUP_KEYS.items() if missing_column(inspector, t, key)]
+
+    with engine.connect() as conn:
+        if is_sqlite:
+            # Must be switched off outside a transaction
+            conn.exec_driver_sql("PRAGMA foreign_keys=OFF")
+            conn.commit()
+
+        with conn.begin():
+            for table in rebuild:
+                for index in inspector.get_indexes(table):
+                    conn.exec_driver_sql(f'DROP INDEX IF EXISTS "{index["name"]}"')
+                conn.exec_driver_sql(f'ALTER TABLE "{table}" RENAME TO "{table}_old"')
+            for table, (column, ddl) in add_columns.items():
+                conn.exec_driver_sql(f'ALTER TABLE "{table}" ADD COLUMN "{column}" {ddl}')
+                print(f"✅ Added {table}.{column}")
+            for table in stale_rollups:
+                conn.exec_driver_sql(f'DROP TABLE "{table}"')
+
+            # New tables (with their indexes) plus indexes missing on kept tables
+            db.metadata.create_all(conn)
+            for table in db.metadata.sorted_tables:
+                for index in table.indexes:
+                    index.create(conn, checkfirst=True)
+
+            for table in rebuild:
+                old_cols = {c["name"] for c in inspect(conn).get_columns(f"{table}_old")}
+                cols = ", ".join(f'"{c.name}"' for c in db.metadata.tables[table].columns if c.name in old_cols)
+                total = conn.execute(text(f'SELECT COUNT(*) FROM "{table}_old"')).scalar()
+                copied = conn.execute(text(
+                    f'INSERT INTO "{table}" ({cols}) SELECT {cols} FROM "{table}_old" WHERE {FK_TABLES[table]}'
+                )).rowcount
+                conn.exec_driver_sql(f'DROP TABLE "{table}_old"')
+                print(f"✅ Rebuilt {table}: kept {copied} rows, dropped {total - copied} orphans")
+
+            # Refresh planner statistics so the new indexes get used
+            conn.exec_driver_sql("ANALYZE")
+
+        if is_sqlite:
+            conn.exec_driver_sql("PRAGMA foreign_keys=ON")
+            problems = conn.exec_driver_sql("PRAGMA foreign_key_check").fetchall()
+            if problems:
+                print(f"⚠️ foreign_key_check reported {len(problems)} rows: {problems[:5]}")
+
+    # Point existing bills/items at their vendor/item rows, then rebuild the
+    # rollups on the new keys
+    linked = dimensions.backfill()
+    if any(linked):
+        print(f"✅ Linked {linked[0]} bills / {linked[1]} items to vendor/item ids")
+    if stale_rollups or any(linked):
+        rollups.rebuild()
+        print("✅ Rollups rebuilt on vendor/item ids.")
+    elif digests.never_run():
+        marked = digests.mark_all_dirty()
+        db.session.commit()
+        if marked:
+            print(f"✅ Marked digests of {marked} user-days for the next digest run.")
+
+    # Full-text search tables + sync triggers (SQLite only)
+    if ensure_search_index(rebuild=bool(rebuild)):
+        print("✅ Search index ready.")
+
+    print("✅ Schema is up to date.")
+
+
+if __name__ == "__main__":
+    app = create_app(with_routes=False)
+    with app.app_context():
+        migrate()
@@ -0,0 +1,25 @@
+# rebuild_rollups.py
+# Recompute the spend rollup tables from bills/bill_items, e.g. after a
+# backfill that bypassed the app (rows without vendor/item ids get them
+# first).  Usage: python rebuild_rollups.py [user_id]
+# Add --analytics to also refresh the spend trend/anomaly/recurring/forecast insights.
+import sys
+from app import create_app
+from app.models import db, Bill
+from app.rollups import rebuild
+from app.dimensions import backfill
+
+app = create_app(with_routes=False)
+with app.app_context():
+    db.create_all()
+    args = [a for a in sys.argv[1:] if a != "--analytics"]
+    user_id = int(args[0]) if args else None
+    backfill()
+    rebuild(user_id)
+    print(f"✅ Rollups rebuilt for {'user ' + str(user_id) if user_id else 'all users'}.")
+
+    if "--analytics" in sys.argv:
+        from app import analytics
+        user_ids = [user_id] if user_id else [u for (u,) in db.session.query(Bill.user_id).distinct()]
+        written = analytics.run(user_ids)
+        print(f"✅ {written} analytics insights saved for {len(user_ids)} users.")
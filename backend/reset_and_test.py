@@ -3,7 +3,7 @@ from datetime import datetime
 from app import create_app
 from app.models import db, Bill, BillItem, UserInsight
 
-app = create_app()
+app = create_app(with_routes=False)
 
 DB_PATH = os.path.join("app", "billwise.db")
 
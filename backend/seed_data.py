@@ -3,7 +3,7 @@ from app.models import db, Bill, BillItem
 from datetime import datetime
 import random
 
-app = create_app()
+app = create_app(with_routes=False)
 app.app_context().push()
 
 # Clear old data
@@ -1,8 +1,10 @@
 # setup_db.py
 from app import create_app
 from app.models import db
+from app.search import ensure_search_index
 
-app = create_app()
+app = create_app(with_routes=False)
 with app.app_context():
     db.create_all()
+    ensure_search_index()
     print("✅ Tables created!")
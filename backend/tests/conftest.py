@@ -0,0 +1,67 @@
+import os
+import tempfile
+
+import pytest
+
+# One throwaway SQLite database and upload folder for the whole run. Set
+# before anything calls create_app(), which reads DATABASE_URL.
+ROOT = tempfile.mkdtemp(prefix="billwise-tests-")
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(ROOT, "bills.db")
+UPLOAD_FOLDER = os.path.join(ROOT, "uploads")
+
+
+@pytest.fixture(scope="session")
+def worker_app():
+    """The Celery worker's app, with tasks run eagerly in the calling thread."""
+    import celery_worker
+    from app.celery_config import celery_app
+    from app.models import db
+    from app.search import ensure_search_index
+
+    celery_app.conf.task_always_eager = True
+    celery_app.conf.task_eager_propagates = True
+    app = celery_worker.flask_app
+    app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
+    with app.app_context():
+        db.create_all()
+        ensure_search_index()
+    return app
+
+
+@pytest.fixture
+def app(worker_app):
+    """Worker app context over an empty database; per-process caches reset after."""
+    from app.models import db
+    from app import dimensions
+    from app.category_cache import category_cache
+
+    with worker_app.app_context():
+        yield worker_app
+        db.session.rollback()
+        for table in reversed(db.metadata.sorted_tables):
+            db.session.execute(table.delete())
+        db.session.commit()
+    for ids in dimensions._ids.values():
+        ids.clear()
+    category_cache._lru.clear()
+
+
+@pytest.fixture
+def client(app):
+    """Test client of the web app (same database and upload folder)."""
+    from app import create_app
+
+    web = create_app()
+    web.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
+    return web.test_client()
+
+
+def post_bill(client, vendor="DMart", date="2026-03-31", items=(("Milk", 50.0),), user_id=1, total=None):
+    """Save a bill through POST /parse-json. Returns: Its id"""
+    bill = {"vendor": vendor, "date": date, "user_id": user_id,
+            "items": [{"name": name, "price": price} for name, price in items]}
+    if total is not None:
+        bill["total"] = total
+    response = client.post("/parse-json", json=bill)
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()["bill_id"]
@@ -0,0 +1,36 @@
+from datetime import date, timedelta
+
+import pytest
+
+from app import analytics
+from app.models import UserInsight
+
+from conftest import post_bill
+
+TODAY = date(2026, 6, 30)
+
+
+@pytest.mark.parametrize("days_since_last, expected", [
+    (3, "next one due around 2026-07-04."),
+    (10, "one was due around 2026-06-27 (3 days overdue; last bought 2026-06-20)."),
+])
+def test_recurring_purchase_due_date_is_never_in_the_past(app, client, days_since_last, expected):
+    last = TODAY - timedelta(days=days_since_last)
+    for weeks_back in range(5):
+        post_bill(client, date=(last - timedelta(weeks=weeks_back)).isoformat(),
+                  vendor=f"Shop {weeks_back}", items=[("Milk", 50.0 + weeks_back)])
+
+    analytics.run([1], today=TODAY)
+    recurring = UserInsight.query.filter_by(user_id=1, insight_type="recurring").one()
+    assert recurring.insight_text.startswith("You buy Milk about every 7 days - ")
+    assert recurring.insight_text.endswith(expected)
+
+
+def test_lapsed_purchases_are_not_reported(app, client):
+    last = TODAY - timedelta(days=20)
+    for weeks_back in range(5):
+        post_bill(client, date=(last - timedelta(weeks=weeks_back)).isoformat(),
+                  vendor=f"Shop {weeks_back}", items=[("Milk", 50.0 + weeks_back)])
+
+    analytics.run([1], today=TODAY)
+    assert UserInsight.query.filter_by(user_id=1, insight_type="recurring").count() == 0
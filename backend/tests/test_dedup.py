@@ -0,0 +1,59 @@
+import io
+
+from app import tasks
+from app.models import Bill, BillFingerprint, UserMonthlySpend
+from app.storage import stream_to_store, store_sidecar
+from app.tasks import parse_json_async
+
+from conftest import UPLOAD_FOLDER, post_bill
+
+PARSED = {"vendor": "DMart", "date": "2026-03-31", "items": [{"name": "Milk", "price": "50.00"}]}
+
+
+def stored_receipt(data=b"receipt bytes"):
+    content_hash, rel_path, _ = stream_to_store(io.BytesIO(data), UPLOAD_FOLDER, "receipt.jpg")
+    store_sidecar(UPLOAD_FOLDER, rel_path, PARSED)
+    return rel_path, content_hash
+
+
+def test_redelivered_parse_task_reuses_the_saved_bill(app):
+    rel_path, content_hash = stored_receipt()
+    first = parse_json_async.apply(args=(rel_path, content_hash), task_id="delivery-1").get()
+    second = parse_json_async.apply(args=(rel_path, content_hash), task_id="delivery-2").get()
+
+    assert second["bill_id"] == first["bill_id"]
+    assert second["task_id"] == "delivery-1"
+    assert Bill.query.count() == 1
+
+
+def test_racing_delivery_rolls_back_on_the_fingerprint_key(app, monkeypatch):
+    rel_path, content_hash = stored_receipt(b"raced receipt")
+    winner = parse_json_async.apply(args=(rel_path, content_hash), task_id="winner").get()
+
+    # The loser looked before the winner committed, so it inserts its own
+    # bill and only the fingerprint's primary key stops it
+    real_lookup, missed = tasks.lookup, []
+
+    def lookup_too_early(fingerprint):
+        if not missed:
+            missed.append(fingerprint)
+            return None
+        return real_lookup(fingerprint)
+
+    monkeypatch.setattr(tasks, "lookup", lookup_too_early)
+    loser = parse_json_async.apply(args=(rel_path, content_hash), task_id="loser").get()
+
+    assert loser["bill_id"] == winner["bill_id"]
+    assert Bill.query.count() == 1
+    assert BillFingerprint.query.count() == 1
+    # The loser's rollup delta went with its rollback
+    assert UserMonthlySpend.query.one().bill_count == 1
+
+
+def test_same_bill_posted_twice_is_saved_once(app, client):
+    bill_id = post_bill(client)
+    again = client.post("/parse-json", json={"vendor": "dmart ", "date": "2026-03-31", "user_id": 1,
+                                              "items": [{"name": "MILK", "price": 50.0}]})
+    assert again.status_code == 200
+    assert again.get_json()["duplicate"] and again.get_json()["bill_id"] == bill_id
+    assert Bill.query.count() == 1
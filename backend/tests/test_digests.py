@@ -0,0 +1,99 @@
+from sqlalchemy import update
+
+from app import digests, rollups
+from app.models import db, DigestDirty, UserInsight
+
+from conftest import post_bill
+
+
+def marks():
+    return {(kind, period) for kind, period, _ in db.session.execute(
+        db.select(DigestDirty.kind, DigestDirty.period, DigestDirty.user_id))}
+
+
+def run_pending():
+    for kind, period, shard in digests.pending(shards=1):
+        digests.run_shard(kind, period, shard, shards=1)
+
+
+def digest_periods(kind):
+    return {period for (period,) in db.session.execute(
+        db.select(UserInsight.period).where(UserInsight.insight_type == kind))}
+
+
+def test_new_bill_marks_its_day_month_and_next_month(app, client):
+    post_bill(client, date="2026-03-31")
+    assert marks() == {
+        ("daily_digest", "2026-03-31"),
+        ("monthly_digest", "2026-03"),
+        ("monthly_digest", "2026-04"),  # compares against March
+        ("category_digest", "2026-03"),
+    }
+    run_pending()
+    assert marks() == set()
+    assert digest_periods("daily_digest") == {"2026-03-31"}
+    assert digest_periods("monthly_digest") == {"2026-03"}
+
+
+def test_moving_a_bill_across_months_refreshes_old_and_new_periods(app, client):
+    bill_id = post_bill(client, date="2026-03-31", total=120.0)
+    run_pending()
+
+    assert client.put(f"/bills/{bill_id}", json={"date": "2026-04-02"}).status_code == 200
+    assert marks() == {
+        ("daily_digest", "2026-03-31"), ("daily_digest", "2026-04-02"),
+        ("monthly_digest", "2026-03"), ("monthly_digest", "2026-04"), ("monthly_digest", "2026-05"),
+        ("category_digest", "2026-03"), ("category_digest", "2026-04"),
+    }
+    run_pending()
+    assert digest_periods("daily_digest") == {"2026-04-02"}
+    assert digest_periods("monthly_digest") == {"2026-04"}
+    assert digest_periods("category_digest") == {"2026-04"}
+    april = UserInsight.query.filter_by(insight_type="monthly_digest", period="2026-04").one()
+    assert "₹120.00" in april.insight_text
+
+
+def test_deleting_last_bill_of_a_period_removes_its_digests(app, client):
+    keep = post_bill(client, date="2026-03-02")
+    gone = post_bill(client, date="2026-03-31", vendor="Reliance")
+    run_pending()
+    assert digest_periods("daily_digest") == {"2026-03-02", "2026-03-31"}
+
+    assert client.delete(f"/bills/{gone}").status_code == 200
+    run_pending()
+    assert digest_periods("daily_digest") == {"2026-03-02"}
+    assert digest_periods("monthly_digest") == {"2026-03"}
+
+    assert client.delete(f"/bills/{keep}").status_code == 200
+    run_pending()
+    assert UserInsight.query.filter(UserInsight.insight_type.in_(list(digests.DIGEST_KINDS))).count() == 0
+
+
+def test_mark_bumped_during_run_survives_for_the_next_run(app, client, monkeypatch):
+    post_bill(client, date="2026-03-31")
+    build = digests.BUILDERS["daily_digest"]
+
+    def build_while_a_bill_commits(user_ids, kind, period):
+        # Another transaction marks the same digest dirty after run_shard read it
+        with db.engine.begin() as conn:
+            conn.execute(update(DigestDirty).where(DigestDirty.kind == kind, DigestDirty.period == period)
+                         .values(version=DigestDirty.version + 1))
+        return build(user_ids, kind, period)
+
+    monkeypatch.setitem(digests.BUILDERS, "daily_digest", build_while_a_bill_commits)
+    digests.run_shard("daily_digest", "2026-03-31", 0, shards=1)
+    assert ("daily_digest", "2026-03-31") in marks()
+
+    monkeypatch.setitem(digests.BUILDERS, "daily_digest", build)
+    digests.run_shard("daily_digest", "2026-03-31", 0, shards=1)
+    assert ("daily_digest", "2026-03-31") not in marks()
+
+
+def test_rebuild_marks_bulk_loaded_bills(app, client):
+    post_bill(client, date="2026-03-31")
+    db.session.execute(db.delete(DigestDirty))
+    db.session.commit()
+
+    rollups.rebuild()
+    assert ("daily_digest", "2026-03-31") in marks()
+    assert not digests.never_run()
@@ -0,0 +1,35 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models import db, UserInsight
+
+
+@pytest.fixture
+def insights(app):
+    now = datetime(2026, 6, 30, 12)
+    db.session.add_all([UserInsight(user_id=1, insight_type="per_bill", insight_text=f"insight {n}",
+                                    generated_at=now - timedelta(minutes=n)) for n in range(5)])
+    db.session.commit()
+
+
+def test_pages_follow_the_cursor(client, insights):
+    first = client.get("/insights/1?limit=3").get_json()
+    second = client.get(f"/insights/1?limit=3&cursor={first['next_cursor']}").get_json()
+    texts = [i["insight"] for i in first["insights"] + second["insights"]]
+    assert texts == [f"insight {n}" for n in range(5)]
+    assert second["next_cursor"] is None
+
+
+def test_ndjson_streams_every_insight(client, insights):
+    response = client.get("/insights/1?format=ndjson")
+    assert response.mimetype == "application/x-ndjson"
+    assert [json.loads(line)["insight"] for line in response.get_data(as_text=True).splitlines()] == \
+        [f"insight {n}" for n in range(5)]
+
+
+@pytest.mark.parametrize("query", ["format=ndjson&limit=2", "format=ndjson&cursor=abc", "format=csv"])
+def test_rejects_formats_it_would_ignore(client, insights, query):
+    response = client.get(f"/insights/1?{query}")
+    assert response.status_code == 400
@@ -0,0 +1,110 @@
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.llm_client import OllamaClient, CircuitBreaker, LLMUnavailable
+
+
+class StubOllama(ThreadingHTTPServer):
+    """
+    Local stand-in for Ollama's /api/generate. Each request takes the next
+    scripted reply: an HTTP status code, or "hang" to stall past the client's
+    read timeout without answering. Once the script runs out it answers 200.
+    """
+    daemon_threads = True
+
+    def __init__(self, script=()):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.script = list(script)
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/api/generate"
+
+    def next_reply(self):
+        with self.lock:
+            self.requests += 1
+            return self.script.pop(0) if self.script else 200
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        reply = self.server.next_reply()
+        if reply == "hang":
+            time.sleep(0.5)  # the client has given up by now
+            return
+        body = json.dumps({"response": "ok"} if reply == 200 else {"error": "busy"}).encode()
+        self.send_response(reply)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def start(*script):
+        server = StubOllama(script)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def make_client(server, **kwargs):
+    kwargs.setdefault("timeout", (1, 0.2))
+    return OllamaClient(url=server.url, **kwargs)
+
+
+def test_retries_busy_statuses(stub):
+    server = stub(503, 429)
+    assert make_client(server, retries=2).generate("hi", "m") == "ok"
+    assert server.requests == 3
+
+
+def test_does_not_retry_read_timeout(stub):
+    server = stub("hang")
+    with pytest.raises(LLMUnavailable):
+        make_client(server, retries=2).generate("hi", "m")
+    assert server.requests == 1
+
+
+def test_does_not_retry_server_error(stub):
+    server = stub(500)
+    with pytest.raises(LLMUnavailable):
+        make_client(server, retries=2).generate("hi", "m")
+    assert server.requests == 1
+
+
+def test_breaker_opens_then_half_opens(stub):
+    server = stub(500, 500)
+    client = make_client(server, breaker=CircuitBreaker(failures_to_open=2, cooldown=0.2))
+    for _ in range(2):
+        with pytest.raises(LLMUnavailable):
+            client.generate("hi", "m")
+
+    # Open: fails fast without calling the server
+    with pytest.raises(LLMUnavailable, match="Circuit open"):
+        client.generate("hi", "m")
+    assert server.requests == 2
+
+    # After the cooldown one trial call goes through and closes it again
+    time.sleep(0.25)
+    assert client.generate("hi", "m") == "ok"
+    assert client.breaker.opened_at is None and client.breaker.failures == 0
+    assert server.requests == 3
@@ -0,0 +1,43 @@
+from app import rollups
+from app.models import db, UserVendorSpend, UserMonthlySpend, UserItemCount
+
+from conftest import post_bill
+
+
+def snapshot():
+    """Every rollup row, with floats rounded (deltas and sums add in different orders)."""
+    return {
+        model.__tablename__: sorted(
+            tuple(round(v, 2) if isinstance(v, float) else v for v in row)
+            for row in db.session.execute(db.select(*model.__table__.columns))
+        )
+        for model in (UserVendorSpend, UserMonthlySpend, UserItemCount)
+    }
+
+
+def test_incremental_rollups_match_a_rebuild(app, client):
+    first = post_bill(client, vendor="DMart", date="2026-03-02", items=[("Milk", 50.0), ("Bread", 40.0)])
+    post_bill(client, vendor="D-Mart", date="2026-03-15", items=[("Milk 1L", 52.0)])
+    moved = post_bill(client, vendor="Reliance", date="2026-03-31", items=[("Eggs", 84.0)])
+    post_bill(client, vendor="Reliance", date="2026-04-05", items=[("Doodh", 48.0)], user_id=2)
+    gone = post_bill(client, vendor="Spar", date="2026-04-10", items=[("Rice", 300.0)])
+
+    assert client.put(f"/bills/{moved}", json={"vendor": "Spar", "total": 90.0, "date": "2026-04-01"}).status_code == 200
+    assert client.put(f"/bills/{first}", json={"total": 95.5}).status_code == 200
+    assert client.delete(f"/bills/{gone}").status_code == 200
+
+    incremental = snapshot()
+    rollups.rebuild()
+    db.session.expire_all()
+    assert snapshot() == incremental
+
+    months = {(u, m): (t, n) for u, m, t, n in db.session.execute(db.select(
+        UserMonthlySpend.user_id, UserMonthlySpend.month, UserMonthlySpend.total_spent, UserMonthlySpend.bill_count))}
+    assert months == {(1, "2026-03"): (147.5, 2), (1, "2026-04"): (90.0, 1), (2, "2026-04"): (48.0, 1)}
+
+
+def test_deleting_every_bill_empties_the_rollups(app, client):
+    bill_ids = [post_bill(client, date=f"2026-03-{day:02d}") for day in (1, 2)]
+    for bill_id in bill_ids:
+        assert client.delete(f"/bills/{bill_id}").status_code == 200
+    assert snapshot() == {"user_vendor_spend": [], "user_monthly_spend": [], "user_item_counts": []}
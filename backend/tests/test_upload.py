@@ -0,0 +1,70 @@
+import io
+import json
+
+import pytest
+
+from app.models import Bill
+from app.storage import stream_to_store, sidecar_path
+from app.tasks import parse_json_async
+
+from conftest import UPLOAD_FOLDER
+
+RECEIPT = b"\xff\xd8\xff\xe0 not really a jpeg"
+PARSED = {
+    "vendor": "Mohan's Vegetables",
+    "items": [{"name": "Tomato", "price": "20.00"}, {"name": "Onion", "price": "28.00"}],
+    "tax": "0.00",
+    "total": "48.00",
+}
+
+
+def test_image_upload_with_parsed_json_is_saved(app, client):
+    response = client.post("/upload", data={
+        "file": (io.BytesIO(RECEIPT), "receipt.jpg"),
+        "parsed": (io.BytesIO(json.dumps(PARSED).encode()), "receipt.json"),
+    })
+    assert response.status_code == 202
+
+    bill = Bill.query.one()
+    assert bill.vendor == "Mohan's Vegetables"
+    assert bill.total == 48.0
+    assert sorted(item.name for item in bill.items) == ["Onion", "Tomato"]
+    # Stored by content, not by the client's file name
+    assert bill.filename.endswith(".jpg") and "receipt" not in bill.filename
+
+    # Same bytes again: answered from the dedup index, nothing new saved
+    again = client.post("/upload", data={"file": (io.BytesIO(RECEIPT), "other-name.jpg")})
+    assert again.status_code == 200 and again.get_json()["duplicate"]
+    assert Bill.query.count() == 1
+
+
+def test_rejects_parsed_part_that_is_not_json(app, client):
+    response = client.post("/upload", data={
+        "file": (io.BytesIO(RECEIPT), "receipt.jpg"),
+        "parsed": (io.BytesIO(b"not json"), "receipt.json"),
+    })
+    assert response.status_code == 400
+    assert Bill.query.count() == 0
+
+
+def test_image_without_parsed_json_fails_clearly(app):
+    content_hash, rel_path, _ = stream_to_store(io.BytesIO(RECEIPT + b"2"), UPLOAD_FOLDER, "receipt.jpg")
+    with pytest.raises(FileNotFoundError, match="parsed"):
+        parse_json_async.delay(rel_path, content_hash)
+    assert Bill.query.count() == 0
+
+
+def test_sidecar_sits_next_to_content_addressed_upload():
+    assert sidecar_path("7c/8f/7c8f00.jpg") == "7c/8f/7c8f00.json"
+
+
+@pytest.mark.parametrize("user_id", ["abc", None, [1]])
+def test_batch_rejects_non_numeric_user_id(app, client, user_id):
+    response = client.post("/upload/batch", json={"user_id": user_id, "bills": [PARSED]})
+    assert response.status_code == 400
+    assert "user_id" in response.get_json()["error"]
+
+
+def test_batch_form_rejects_non_numeric_user_id(app, client):
+    response = client.post("/upload/batch", data={"user_id": "abc", "files": (io.BytesIO(RECEIPT), "a.jpg")})
+    assert response.status_code == 400
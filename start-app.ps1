@@ -23,9 +23,17 @@ $env:Path = "$venvPath\Scripts;" + $env:Path
 Write-Host "Starting Flask..."
 Start-Process powershell -ArgumentList "cd `"$backendPath`"; & '$pythonPath' run.py"
 
-# === Start Celery (using --pool=solo for Windows compatibility) ===
-Write-Host "Starting Celery (solo mode)..."
-Start-Process powershell -ArgumentList "cd `"$backendPath`"; & '$pythonPath' -m celery -A celery_worker.celery_app worker --pool=solo --loglevel=info"
+# === Start Celery ingest worker (profile picks --pool=solo on Windows) ===
+Write-Host "Starting Celery ingest worker..."
+Start-Process powershell -ArgumentList "cd `"$backendPath`"; `$env:BILLWISE_WORKER='ingest'; & '$pythonPath' -m celery -A celery_worker.celery_app worker -Q ingest -n ingest@%h --loglevel=info"
+
+# === Start Celery insights worker (LLM calls are IO-bound: thread pool) ===
+Write-Host "Starting Celery insights worker (threads)..."
+Start-Process powershell -ArgumentList "cd `"$backendPath`"; `$env:BILLWISE_WORKER='insights'; & '$pythonPath' -m celery -A celery_worker.celery_app worker -Q insights -n insights@%h --loglevel=info"
+
+# === Start Celery beat (scheduled daily/monthly digests) ===
+Write-Host "Starting Celery beat..."
+Start-Process powershell -ArgumentList "cd `"$backendPath`"; & '$pythonPath' -m celery -A celery_worker.celery_app beat --loglevel=info"
 
 # === Open browser ===
 Start-Sleep -Seconds 2